@@ -0,0 +1,271 @@
+# -*- coding: UTF-8 -*-
+
+'''
+fake_flickr
+===========
+
+Local HTTP stand-in for the parts of the Flickr REST API that
+flickr-spellcheckr uses. The photostream is synthetic and generated on
+demand from the photo number, so a million photo stream costs no memory.
+
+Use :func:`install` to point :mod:`flickrapi` at the server.
+'''
+
+from SocketServer import ThreadingMixIn
+from xml.sax.saxutils import escape, quoteattr
+import BaseHTTPServer
+import datetime
+import httplib
+import random
+import threading
+import time
+import urllib2
+import urlparse
+
+WORDS = ('sunset', 'beach', 'mountain', 'river', 'forest', 'city', 'night',
+         'bridge', 'harbour', 'garden', 'morning', 'family', 'holiday',
+         'street', 'market', 'church', 'castle', 'winter', 'summer', 'snow')
+MISSPELLINGS = ('sunsett', 'beech', 'mountian', 'rivr', 'forrest', 'citty',
+                'nigth', 'brige', 'harbor', 'gardn', 'mornig', 'famly')
+TAGS = WORDS + ('new york', 'san francisco', 'geo:lat=51.5', 'holliday')
+MAX_PER_PAGE = 500
+MAX_SEARCH_RESULTS = 4000  # Like flickr, later search pages repeat
+FIRST_UPLOAD = 1300000000  # Unix time photo 0 was uploaded, one a second
+DEFAULT_PER_PAGE = 100
+FIRST_TAKEN = datetime.datetime(2000, 1, 1)
+
+
+class Photostream(object):
+    def __init__(self, photos, misspell_rate=0.05, seed=0):
+        '''Deterministic synthetic photostream
+
+        :param photos: Number of photos
+        :keyword misspell_rate: Chance of each word being misspelt
+        :keyword seed: Seed for the text, the same seed gives the same stream
+        '''
+
+        self.photos = photos
+        self.misspell_rate = misspell_rate
+        self.seed = seed
+        self._edits = {}  # photo_id -> (title, description) from setMeta
+        self._lock = threading.Lock()
+
+    def _words(self, rand, count):
+        words = []
+        for _ in xrange(count):
+            if rand.random() < self.misspell_rate:
+                words.append(rand.choice(MISSPELLINGS))
+            else:
+                words.append(rand.choice(WORDS))
+        return ' '.join(words)
+
+    def photo(self, idx):
+        '''Return (photo_id, title, description, date_taken, last_update)
+        '''
+
+        photo_id = str(1000000 + idx)
+        rand = random.Random(self.seed * 7919 + idx)
+        title = self._words(rand, rand.randint(1, 4)).capitalize()
+        description = self._words(rand, rand.randint(0, 30))
+        with self._lock:
+            title, description = self._edits.get(photo_id,
+                                                 (title, description))
+        taken = FIRST_TAKEN + datetime.timedelta(hours=idx)
+        return (photo_id, title, description,
+                taken.strftime('%Y-%m-%d %H:%M:%S'), FIRST_UPLOAD + idx)
+
+    def set_meta(self, photo_id, title, description):
+        with self._lock:
+            self._edits[photo_id] = (title, description)
+
+
+class FakeFlickrServer(ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, stream, latency=0.0, error_rate=0.0, port=0,
+                 seed=0):
+        '''Threaded HTTP server answering Flickr REST calls
+
+        :param stream: :obj:`Photostream` to serve
+        :keyword latency: Seconds added to every response
+        :keyword error_rate: Chance of a call failing with an HTTP 500
+        :keyword port: Port to listen on. Default: any free port
+        :keyword seed: Seed for choosing which calls fail
+        '''
+
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port),
+                                           _Handler)
+        self.stream = stream
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count_call(self, method):
+        '''Count the call, returns True if it should fail
+        '''
+
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            return self._random.random() < self.error_rate
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1  # One write per response, small writes stall keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length', 0))
+        params = dict(urlparse.parse_qsl(self.rfile.read(length)))
+        self.respond(params)
+
+    def do_GET(self):
+        self.respond(dict(urlparse.parse_qsl(
+                                        urlparse.urlparse(self.path).query)))
+
+    def respond(self, params):
+        server = self.server
+        method = params.get('method', '')
+        if server.latency:
+            time.sleep(server.latency)
+        if server.count_call(method):
+            self.send_body(500, 'Internal Server Error')
+            return
+        handler = METHODS.get(method)
+        if handler is None:
+            body = ('<rsp stat="fail"><err code="112" msg="Method &quot;%s'
+                    '&quot; not found"/></rsp>' % escape(method))
+        else:
+            body = '<rsp stat="ok">%s</rsp>' % handler(server.stream, params)
+        self.send_body(200, '<?xml version="1.0" encoding="utf-8" ?>\n' +
+                       body, 'text/xml; charset=utf-8')
+
+    def send_body(self, code, body, content_type='text/plain'):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+
+def _photo_list(stream, params, first=0, last=None, cap=None):
+    if last is None:
+        last = stream.photos
+    per_page = min(int(params.get('per_page', DEFAULT_PER_PAGE)),
+                   MAX_PER_PAGE)
+    page = int(params.get('page', 1))
+    total = max(last - first, 0)
+    pages = max((total + per_page - 1) // per_page, 1)
+    if cap is not None:
+        page = min(page, max(cap // per_page, 1))
+    start = first + (page - 1) * per_page
+    photos = []
+    for idx in xrange(start, min(start + per_page, last)):
+        photo_id, title, description, taken, update = stream.photo(idx)
+        photos.append('<photo id="%s" owner="me" title=%s datetaken="%s" '
+                      'lastupdate="%d"><description>%s</description>'
+                      '</photo>' % (photo_id, quoteattr(title), taken, update,
+                                    escape(description)))
+    return '<photos page="%d" pages="%d" perpage="%d" total="%d">%s' \
+           '</photos>' % (page, pages, per_page, total, ''.join(photos))
+
+
+def _index_for_time(value):
+    # Photos are taken an hour apart from FIRST_TAKEN
+    taken = datetime.datetime.fromtimestamp(float(value))
+    delta = taken - FIRST_TAKEN
+    return max(int(delta.days * 24 + delta.seconds // 3600), 0)
+
+
+def _photos_search(stream, params):
+    first, last = 0, stream.photos
+    if 'min_taken_date' in params:
+        first = min(_index_for_time(params['min_taken_date']), last)
+    if 'max_taken_date' in params:
+        last = min(_index_for_time(params['max_taken_date']) + 1, last)
+    if 'min_upload_date' in params:
+        first = max(first, min(int(params['min_upload_date']) - FIRST_UPLOAD,
+                               last))
+    if 'max_upload_date' in params:
+        last = max(min(int(params['max_upload_date']) - FIRST_UPLOAD + 1,
+                       last), first)
+    return _photo_list(stream, params, first, last, cap=MAX_SEARCH_RESULTS)
+
+
+def _photos_recently_updated(stream, params):
+    first = max(int(params.get('min_date', 0)) - FIRST_UPLOAD, 0)
+    return _photo_list(stream, params, min(first, stream.photos))
+
+
+def _photos_set_meta(stream, params):
+    stream.set_meta(params['photo_id'], params.get('title', ''),
+                    params.get('description', ''))
+    return ''
+
+
+def _tags_list_user_raw(stream, params):
+    tags = ''.join('<tag clean=%s><raw>%s</raw></tag>' % (
+                        quoteattr(tag.replace(' ', '')), escape(tag))
+                   for tag in TAGS)
+    return '<who id="me"><tags>%s</tags></who>' % tags
+
+
+def _tags_list_user_popular(stream, params):
+    tags = ''.join('<tag count="%d">%s</tag>' % (stream.photos // (idx + 1),
+                                                 escape(tag.replace(' ', '')))
+                   for idx, tag in enumerate(TAGS))
+    return '<who id="me"><tags>%s</tags></who>' % tags
+
+METHODS = {'flickr.photos.search': _photos_search,
+           'flickr.photos.recentlyUpdated': _photos_recently_updated,
+           'flickr.photos.setMeta': _photos_set_meta,
+           'flickr.tags.getListUserRaw': _tags_list_user_raw,
+           'flickr.tags.getListUserPopular': _tags_list_user_popular}
+
+
+class _LocalHandler(urllib2.HTTPHandler):
+    handler_order = 100  # Ahead of the default HTTPS handler
+
+    def __init__(self, port):
+        urllib2.HTTPHandler.__init__(self)
+        self.port = port
+
+    def https_open(self, req):
+        def connect(host, timeout=None):
+            return httplib.HTTPConnection('127.0.0.1', self.port,
+                                          timeout=timeout)
+        return self.do_open(connect, req)
+
+
+def install(server):
+    '''Send every HTTPS request made through urllib2 to the fake server
+
+    :mod:`flickrapi` always talks HTTPS to api.flickr.com, this swaps in a
+    global opener that talks plain HTTP to ``server`` instead.
+    '''
+
+    urllib2.install_opener(urllib2.build_opener(_LocalHandler(server.port)))
+
+
+def uninstall():
+    urllib2.install_opener(None)
@@ -0,0 +1,201 @@
+# -*- coding: UTF-8 -*-
+
+'''
+Benchmarks for flickr-spellcheckr against a local fake Flickr
+============================================================
+
+Starts :mod:`fake_flickr` on a local port, points flickrapi at it and times
+the main code paths over a synthetic photostream::
+
+    python benchmarks/run.py --photos 100000 --latency 0.05 --workers 8
+
+Runs with the same arguments (including ``--seed``) see the same photos and
+the same failures, so numbers can be compared between commits. Use
+``--json`` to keep the results.
+'''
+
+from flickr_spellcheckr import controller
+from flickr_spellcheckr.utils import bulksave, detect, flickr, httppool
+import __builtin__
+import argparse
+import fake_flickr
+import json
+import os
+import resource
+import sys
+import time
+
+PHASES = ('fetch', 'detect', 'save', 'tags', 'correct')
+
+
+def peak_memory_mb():
+    '''Peak resident memory of this process so far, in MB
+    '''
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # Bytes on OS X, KB everywhere else
+        return peak / (1024.0 * 1024)
+    return peak / 1024.0
+
+
+def stream_photos(stream):
+    for idx in xrange(stream.photos):
+        photo_id, title, description, taken, update = stream.photo(idx)
+        yield flickr.SimplePhoto(title, description, photo_id, taken, update)
+
+
+def timed(name, count_name, func):
+    '''Run func, which returns a count, and time it
+    '''
+
+    started = time.time()
+    count = func()
+    elapsed = time.time() - started
+    return {'phase': name, 'count': count, 'unit': count_name,
+            'seconds': elapsed,
+            'per_second': count / elapsed if elapsed else float('inf'),
+            'peak_memory_mb': peak_memory_mb()}
+
+
+def bench_fetch(flickr_obj, args):
+    photos = flickr_obj.photos_iter(date_from=fake_flickr.FIRST_TAKEN,
+                                    per_page=args.per_page,
+                                    workers=args.workers)
+    return sum(1 for _photo in photos)
+
+
+def bench_detect(stream, args):
+    detector = detect.Detector(controller.LANG, processes=args.processes)
+    return sum(1 for _record in detector.errors_iter(stream_photos(stream)))
+
+
+def bench_save(flickr_obj, stream, args):
+    saver = bulksave.BulkSaver(flickr_obj, workers=args.workers,
+                               backoff=0.01)
+    photos = list(photo for idx, photo in
+                  zip(xrange(args.saves), stream_photos(stream)))
+    results = saver.save_all(photos)
+    return sum(1 for result in results if result.ok)
+
+
+def bench_tags(flickr_obj, args):
+    return sum(1 for _tag in flickr_obj.tag_list())
+
+
+def bench_correct(flickr_obj, args):
+    import enchant
+    from enchant.checker import SpellChecker
+
+    speller = SpellChecker(lang=enchant.DictWithPWL(controller.LANG))
+    devnull = open(os.devnull, 'w')
+    ctrl = controller.Controller(speller=speller, flickr=flickr_obj,
+                                 stdout=devnull)
+    prompts = [0]
+
+    def answer(prompt=''):
+        prompts[0] += 1
+        return 'i'
+    real_raw_input = __builtin__.raw_input
+    __builtin__.raw_input = answer
+    try:
+        list(ctrl._correct_photos(date_from=fake_flickr.FIRST_TAKEN))
+    finally:
+        __builtin__.raw_input = real_raw_input
+        devnull.close()
+    return prompts[0]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark '
+                                     'flickr-spellcheckr against a fake '
+                                     'flickr')
+    parser.add_argument('--photos', type=int, default=1000,
+                        help='Photos in the photostream (default: 1000)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds added to every API call (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Chance of an API call failing (default: 0)')
+    parser.add_argument('--misspell-rate', type=float, default=0.05,
+                        help='Chance of each word being misspelt '
+                             '(default: 0.05)')
+    parser.add_argument('--per-page', type=int, default=None,
+                        help='Photos per search page (default: adapt to '
+                             'latency and response size)')
+    parser.add_argument('--connections', type=int, default=None,
+                        help='Use pooled keep-alive connections, this many '
+                             '(default: a new connection per call)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Pages fetched / photos saved at once '
+                             '(default: 4)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Detection processes (default: one per CPU)')
+    parser.add_argument('--saves', type=int, default=1000,
+                        help='Photos saved in the save phase (default: 1000)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for the photostream and failures')
+    parser.add_argument('--phases', default=','.join(PHASES),
+                        help='Comma separated phases to run (default: %s)' % (
+                                                            ','.join(PHASES)))
+    parser.add_argument('--json', default=None,
+                        help='Also write the results to this file')
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    stream = fake_flickr.Photostream(args.photos,
+                                     misspell_rate=args.misspell_rate,
+                                     seed=args.seed)
+    server = fake_flickr.FakeFlickrServer(stream, latency=args.latency,
+                                          error_rate=args.error_rate,
+                                          seed=args.seed)
+    server.start()
+    fake_flickr.install(server)
+    if args.connections:
+        pool = httppool.ConnectionPool('127.0.0.1:%d' % server.port,
+                                       size=args.connections, scheme='http')
+        flickr_obj = flickr.PooledFlickr(pool=pool)
+    else:
+        flickr_obj = flickr.Flickr()
+    flickr_obj.logged_in = True  # The fake server doesn't check auth
+    benchmarks = {
+        'fetch': lambda: timed('fetch', 'photos',
+                               lambda: bench_fetch(flickr_obj, args)),
+        'detect': lambda: timed('detect', 'errors',
+                                lambda: bench_detect(stream, args)),
+        'save': lambda: timed('save', 'saves',
+                              lambda: bench_save(flickr_obj, stream, args)),
+        'tags': lambda: timed('tags', 'tags',
+                              lambda: bench_tags(flickr_obj, args)),
+        'correct': lambda: timed('correct', 'prompts',
+                                 lambda: bench_correct(flickr_obj, args)),
+    }
+    results = []
+    try:
+        for phase in args.phases.split(','):
+            phase = phase.strip()
+            try:
+                result = benchmarks[phase]()
+            except Exception, e:
+                # e.g. a failed page with --error-rate, keep going
+                print '%-8s failed: %r' % (phase, e)
+                results.append({'phase': phase, 'error': repr(e)})
+                continue
+            results.append(result)
+            print '%-8s %10d %-8s %8.2fs %12.1f/s %8.1f MB peak' % (
+                        result['phase'], result['count'], result['unit'],
+                        result['seconds'], result['per_second'],
+                        result['peak_memory_mb'])
+    finally:
+        fake_flickr.uninstall()
+        server.stop()
+    print 'API calls:', ', '.join('%s=%d' % item
+                                  for item in sorted(server.calls.items()))
+    if args.json is not None:
+        with open(args.json, 'w') as output:
+            json.dump({'arguments': vars(args), 'results': results,
+                       'api_calls': server.calls}, output, indent=2,
+                      sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -26,7 +26,8 @@ setup(name='flickr-spellcheckr',
                         'pyreadline', ],
       entry_points={
         'console_scripts': [
-            'flickr-spellcheckr = flickr_spellcheckr.controller:main'
+            'flickr-spellcheckr = flickr_spellcheckr.controller:main',
+            'flickr-spellcheckr-report = flickr_spellcheckr.report:main',
             ]
         },
       test_suite='nose.colletor',
@@ -9,10 +9,28 @@ a fairly basic command line interface.
 '''
 
 from cmd import Cmd
-from flickr_spellcheckr.utils import flickr
+from flickr_spellcheckr.utils import bulksave, detect, flickr, journal, \
+    lazy, lexicon, markup, pipeline, quota, rules, store, suggest, \
+    tagcheck, tagrename, wordindex, writebehind
+from flickr_spellcheckr.utils import metrics as metrics_module
+from flickr_spellcheckr.utils import scope as scope_module
+from flickr_spellcheckr.utils.flickr import PhotoQueue
+import argparse
+import cProfile
+import collections
 import datetime
+import functools
+import json
 import sys
 import os
+import re
+import time
+
+LANG = 'en_US'
+SYNC_MARGIN = 300  # Seconds of overlap between syncs to allow for clock skew
+SCAN_TOP_WORDS = 20  # Most common misspelled words listed by scan
+DAY = 24 * 60 * 60  # Seconds
+SUGGEST_AHEAD = 10  # Words ahead of the prompt to prefetch suggestions for
 
 
 class SpellcheckerCommandResult(object):
@@ -33,26 +51,201 @@ class SpellcheckerCommandResult(object):
         self.carryon = carryon
 
 
+class WordError(object):
+    def __init__(self, speller, word):
+        '''Stands in for a spellchecker error covering every use of a word
+
+        Used by spellcheckwords so that
+        :meth:`Controller._read_spellchecker_command` can prompt once for a
+        word instead of once per occurrence.
+
+        :param speller: :obj:`~enchant.checker.SpellChecker` object used for
+            suggestions and the personal dictionary
+        :param word: The misspelled word
+        :ivar replacement: What the user chose to replace the word with
+        '''
+
+        self.speller = speller
+        self.word = word
+        self.replacement = None
+
+    def suggest(self):
+        return self.speller.suggest(self.word)
+
+    def replace(self, repl):
+        self.replacement = repl
+
+    def replace_always(self, repl):
+        self.replacement = repl
+        self.speller.replace_always(self.word, repl)
+
+    def ignore_always(self):
+        self.speller.ignore_always(self.word)
+
+    def add(self):
+        self.speller.add(self.word)
+
+
 class Controller(Cmd):
 
     def __init__(self, speller, flickr, completekey='tab', stdin=None,
-                 stdout=None):
+                 stdout=None, saver=None, photo_store=None,
+                 suggestions=None, checker=None, detector=None,
+                 metrics=None, profile_dir=None, journal=None,
+                 rule_store=None, prefetcher=None, tag_renamer=None,
+                 save_every=None, save_after=None, album_workers=1,
+                 fetch_workers=1, per_page=None):
         '''Simple command line processor of the flickr spell checker.
 
         :param flickr: :obj:`~flickr_spellchecker.utils.flickr.Flickr` object
             to handle comm w/ Flickr
         :param speller: :obj:`~enchant.checker.SpellChecker` object to handle
-            spellchecking
+            spellchecking. May be a
+            :obj:`~flickr_spellcheckr.utils.lazy.Background` still loading
+        :keyword saver: :obj:`~flickr_spellcheckr.utils.bulksave.BulkSaver`
+            used by savechanges. Default: one with the default settings
+        :keyword photo_store: :obj:`~flickr_spellcheckr.utils.store.PhotoStore`
+            to check photos from instead of searching flickr every time
+        :keyword suggestions:
+            :obj:`~flickr_spellcheckr.utils.suggest.SuggestionCache` to look
+            up suggestions in before asking the spellchecker
+        :keyword checker: A second :obj:`~enchant.checker.SpellChecker`, not
+            shared with ``speller``, or a
+            :obj:`~flickr_spellcheckr.utils.lexicon.IndexedChecker`. If
+            given, photos are fetched and checked on a background thread and
+            only photos with errors are prompted
+        :keyword detector: :obj:`~flickr_spellcheckr.utils.detect.Detector`
+            used to find errors in bulk for scan and spellcheckwords
+        :keyword metrics: :obj:`~flickr_spellcheckr.utils.metrics.Metrics`
+            shown by stats. Default: the shared registry
+        :keyword profile_dir: Directory to write a cProfile dump of every
+            command to, named ``<command>-<timestamp>.prof``
+        :keyword journal: :obj:`~flickr_spellcheckr.utils.journal.Journal`
+            every correction is written to until it has been saved. The
+            corrections it holds from an earlier session are reloaded
+        :keyword rule_store: :obj:`~flickr_spellcheckr.utils.rules.RuleStore`
+            keeping the words to always replace or ignore between sessions.
+            Its rules are applied without prompting
+        :keyword prefetcher:
+            :obj:`~flickr_spellcheckr.utils.suggest.SuggestionPrefetcher`
+            working out suggestions for the errors coming up while the user
+            answers the prompt. Given the same cache as ``suggestions``
+        :keyword tag_renamer:
+            :obj:`~flickr_spellcheckr.utils.tagrename.TagRenamer` used by
+            ``spellchecktags apply`` and renametags. Default: one with the
+            default settings
+        :keyword save_every: Save corrected photos with ``saver`` in the
+            background as the review goes on, once this many are waiting,
+            instead of waiting for savechanges
+        :keyword save_after: As ``save_every``, once the oldest photo
+            waiting has waited this many seconds. If only one of the two is
+            given the other is the
+            :mod:`~flickr_spellcheckr.utils.writebehind` default
+        :keyword album_workers: Albums listed from flickr at once when
+            photos are picked by album, collection or tag
+        :keyword fetch_workers: Pages of search results fetched from flickr
+            at once
+        :keyword per_page: Photos asked for in each page of search results.
+            Default: picked by the flickr object
         '''
 
         self.flickr = flickr
         self.speller = speller
-        self.photos = []
+        self.photos = PhotoQueue()
+        if saver is None:
+            saver = bulksave.BulkSaver(flickr)
+        self.saver = saver
+        self.photo_store = photo_store
+        self.suggestions = suggestions
+        self.checker = checker
+        self.detector = detector
+        self.metrics = metrics if metrics is not None else \
+            metrics_module.registry
+        self.profile_dir = profile_dir
+        self.journal = journal
+        self.rule_store = rule_store
+        self.prefetcher = prefetcher
+        if tag_renamer is None:
+            tag_renamer = tagrename.TagRenamer(flickr)
+        self.tag_renamer = tag_renamer
+        self.album_workers = album_workers
+        self.fetch_workers = fetch_workers
+        self.per_page = per_page
+        self.write_behind = None
+        if save_every or save_after:
+            self.write_behind = writebehind.WriteBehind(
+                            self.saver,
+                            max_count=save_every or writebehind.FLUSH_COUNT,
+                            max_age=save_after or writebehind.FLUSH_AGE,
+                            on_result=self._confirm_save)
         Cmd.__init__(self, completekey=completekey, stdin=stdin, stdout=stdout)
+        if journal is not None and len(journal):
+            self.photos = PhotoQueue(journal.pending())
+            print >> self.stdout, ("%d unsaved changes from the last session, "
+                                   "use savechanges to save them" % (
+                                                            len(self.photos)))
+        renames = tag_renamer.pending()
+        if renames:
+            print >> self.stdout, ("%d unfinished tag renames from the last "
+                                   "session, use renametags to finish them" % (
+                                                                len(renames)))
+
+    def onecmd(self, line):
+        '''Run a command, timing it and profiling it if asked to
+        '''
+
+        name = self.parseline(line)[0] or 'emptyline'
+        if not name.isalnum():
+            name = 'default'
+        with self.metrics.timer('command.' + name):
+            if self.profile_dir is None:
+                return Cmd.onecmd(self, line)
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(Cmd.onecmd, self, line)
+            finally:
+                profiler.dump_stats(os.path.join(self.profile_dir,
+                        '%s-%s.prof' % (name, time.strftime('%Y%m%d%H%M%S'))))
 
     def do_EOF(self, line):
         return True
 
+    def do_stats(self, _ignored):
+        '''Show the API calls, timings and counts so far this session
+        '''
+
+        for line in self.metrics.report():
+            print >> self.stdout, line
+
+    def do_quota(self, _ignored):
+        '''Show how much of the hourly flickr API quota has been used
+
+        Every call to flickr waits its turn against the quota. Reads go
+        before writes, and calls are paused for a while whenever flickr
+        pushes back.
+        '''
+
+        used = self.flickr.quota()
+        if used['hourly_limit']:
+            print >> self.stdout, "%d of %d calls used in the last hour, " \
+                "%d left" % (used['calls_last_hour'], used['hourly_limit'],
+                             used['remaining_this_hour'])
+            print >> self.stdout, "%d calls can be made straight away" % (
+                                                            used['tokens'])
+        else:
+            print >> self.stdout, "%d calls in the last hour, no limit" % (
+                                                    used['calls_last_hour'])
+        print >> self.stdout, "Throttled by flickr %d times" % (
+                                                        used['throttled'])
+        if used['paused_for']:
+            print >> self.stdout, "Calls paused for %.1fs" % (
+                                                        used['paused_for'])
+        for priority in (quota.READ, quota.WRITE):
+            print >> self.stdout, "%ss: %d waiting, %.1fs spent waiting" % (
+                                        priority.capitalize(),
+                                        used['waiting'][priority],
+                                        used['waited'][priority])
+
     def do_showchanges(self, _ignored):
         '''Show the list of photos that need to be saved to Flickr
         '''
@@ -60,72 +253,352 @@ class Controller(Cmd):
         for photo in self.photos:
             print photo, '\n'
 
+    def do_rules(self, _ignored):
+        '''rules
+
+        List the words always replaced or ignored without asking
+        '''
+
+        if not self._check_rule_store():
+            return
+        for rule in self.rule_store.rules():
+            action = ('-> %s' % rule.replacement
+                      if rule.replacement is not None else '(ignore)')
+            used = (time.strftime('%m/%d/%Y', time.localtime(rule.used))
+                    if rule.used is not None else 'never')
+            print >> self.stdout, "%-20s %-24s used %d times, last %s" % (
+                                        rule.word, action, rule.uses, used)
+        print >> self.stdout, "%d rules" % len(self.rule_store)
+
+    def do_editrule(self, line):
+        '''editrule word [replacement]
+
+        Always replace the word with the replacement without asking, or
+        always ignore it if no replacement is given. Replaces any rule
+        already set for the word.
+        '''
+
+        if not self._check_rule_store():
+            return
+        args = line.split()
+        if len(args) not in (1, 2):
+            print >> self.stdout, "Usage: editrule word [replacement]"
+            return
+        self.rule_store.set(*args)
+
+    def do_removerule(self, word):
+        '''removerule word
+
+        Ask about the word again instead of replacing or ignoring it
+        '''
+
+        if not self._check_rule_store():
+            return
+        if not self.rule_store.remove(word.strip()):
+            print >> self.stdout, "No rule for", word.strip()
+
+    def do_expirerules(self, days):
+        '''expirerules days
+
+        Remove the rules that haven't been applied in the given number of
+        days
+        '''
+
+        if not self._check_rule_store():
+            return
+        try:
+            days = float(days)
+        except ValueError:
+            print >> self.stdout, "Usage: expirerules days"
+            return
+        expired = self.rule_store.expire(days * DAY)
+        print >> self.stdout, "%d rules expired" % len(expired)
+
+    def _check_rule_store(self):
+        if self.rule_store is None:
+            print >> self.stdout, "No rule store in use"
+            return False
+        return True
+
     def do_savechanges(self, _ignored):
         '''For each photo with spelling corrections go and save the changes
 
-        Note that after this finishes saving all the photos, the list of photos
-        to update will be cleared.
+        Photos are saved several at a time. A photo that fails to save does
+        not stop the rest of the batch. Once finished only the photos that
+        failed to save are left in the list of photos to update, so running
+        savechanges again retries just those. Each save is recorded in the
+        journal as soon as flickr confirms it, so an interrupted savechanges
+        picks up where it left off next time. Photos whose edits leave the
+        text as it is on flickr are dropped without being saved.
         '''
 
-        for photo in self.photos:
-            self.flickr.save_meta(photo)
-        self.photos = []
+        if not self.photos:
+            return
+        unchanged = [photo for photo in self.photos if not photo.dirty]
+        if self.journal is not None:
+            for photo in unchanged:
+                self.journal.confirm(photo)
+        photos = [photo for photo in self.photos if photo.dirty]
+        if unchanged:
+            print >> self.stdout, "%d photos unchanged, not saved" % (
+                                                                len(unchanged))
+
+        def progress(done, total):
+            self.stdout.write('\rSaving photos... %d/%d' % (done, total))
+            self.stdout.flush()
+
+        def confirm(result):
+            if result.ok and self.journal is not None:
+                self.journal.confirm(result.photo)
+        results = self.saver.save_all(photos, progress=progress,
+                                      on_result=confirm)
+        print >> self.stdout
+        if self.journal is not None:
+            self.journal.compact()
+        failed = [result for result in results if not result.ok]
+        for result in results:
+            if not result.ok:
+                continue
+            result.photo.mark_saved()
+            if self.photo_store is not None:
+                self.photo_store.mark_verified(result.photo)
+        for result in failed:
+            print >> self.stdout, "Failed to save photo %s: %s" % (
+                                        result.photo.photo_id, result.error)
+        print >> self.stdout, "Saved %d photos, %d failed" % (
+                                    len(results) - len(failed), len(failed))
+        self.photos = PhotoQueue(result.photo for result in failed)
 
-    def do_spellcheck(self, dates):
-        '''spellcheck [date from] [date to]
+    def do_spellcheck(self, line):
+        '''spellcheck [album:ID ...] [collection:ID ...] [tag:TAG ...] [all]
+        [date from] [date to]
 
         Search your photostream for photos TAKEN (not posted) between the
         given dates. If left blank the defaults are from 40 days ago to the
         present.
 
+        Give albums, collections or tags to check only the photos in them,
+        all to check every photo. Dates then narrow those photos down.
+
         Dates need to be in the format MM/DD/YYYY e.g. 01/14/2012
         '''
 
         # 1) First find the photos that we need to check
-        date_range = []
-        try:
-            for date in dates.split(' '):  # Try to get a from and to range
-                if date == '':
-                    continue
-                date_range.append(datetime.datetime.strptime(date, '%m/%d/%Y'))
-        except ValueError, e:
-            print >> self.stdout, e, 'Processing has been aborted'
+        checking = self._start_check(line)
+        if checking is None:
             return
         # 2) Then call someone else to do the spell checking on each photo
-        # and then save that list of corrected photos
+        # and then save the corrected photos, or queue them for savechanges
+        photo_scope, date_range = checking
+        self._keep_corrected(self._correct_photos(*date_range,
+                                                  scope=photo_scope))
+        if self.journal is not None:
+            self.journal.sync()
+
+    def do_spellcheckwords(self, line):
+        '''spellcheckwords [album:ID ...] [collection:ID ...] [tag:TAG ...]
+        [all] [date from] [date to]
+
+        Like spellcheck, but every photo in the range is scanned first and
+        then each misspelled word is asked about only once, most common word
+        first. The answer is applied to every photo using the word.
+
+        Dates need to be in the format MM/DD/YYYY e.g. 01/14/2012
+        '''
+
+        checking = self._start_check(line)
+        if checking is None:
+            return
+        photo_scope, date_range = checking
+        self._keep_corrected(self._correct_words(*date_range,
+                                                 scope=photo_scope))
+        if self.journal is not None:
+            self.journal.sync()
+
+    def do_sync(self, _ignored):
+        '''sync
+
+        Bring the local photo store up to date with flickr. The first sync
+        downloads the whole photostream, after that only photos changed since
+        the last sync are fetched. spellcheck does this automatically.
+        '''
+
+        if self.photo_store is None:
+            print >> self.stdout, "No local photo store in use"
+            return
+        self._flicker_login()
+        self._sync_store()
+
+    def do_scan(self, line):
+        '''scan [album:ID ...] [collection:ID ...] [tag:TAG ...] [all]
+        [date from] [date to]
+
+        Find the spelling errors in the same photos spellcheck would look at
+        without asking about or changing anything. Prints how many errors
+        were found and the most common misspelled words.
+
+        Dates need to be in the format MM/DD/YYYY e.g. 01/14/2012
+        '''
+
+        checking = self._start_check(line)
+        if checking is None:
+            return
+        photo_scope, date_range = checking
+        print >> self.stdout, "Searching for photos..."
+        words = collections.defaultdict(int)
+        photo_ids = set()
+        for record in self._error_records(self._photos_to_check(
+                                        *date_range, scope=photo_scope)):
+            words[record.word] += 1
+            photo_ids.add(record.photo_id)
+        print >> self.stdout, "%d errors in %d photos" % (
+                                        sum(words.values()), len(photo_ids))
+        common = sorted(words.iteritems(), key=lambda item: -item[1])
+        for word, count in common[:SCAN_TOP_WORDS]:
+            print >> self.stdout, "%6d %s" % (count, word)
+
+    def do_albums(self, _ignored):
+        '''albums
+
+        List your albums with their ids, for picking the photos spellcheck
+        looks at with album:ID.
+        '''
+
         self._flicker_login()
-        self.photos.extend(self._correct_photos(*date_range))
+        for photoset in self.flickr.photoset_list():
+            print >> self.stdout, "%s %6d %s" % (photoset.photoset_id,
+                                                 photoset.photos,
+                                                 photoset.title)
 
-    def do_spellchecktags(self, _ignored):
-        '''spellchecktags
+    def do_spellchecktags(self, line):
+        '''spellchecktags [apply]
 
         Get the full list of tags and spellcheck the individual tags.
-        Note this does not actually update the tags in flickr, it is for
-        information only. The reason is the flickr API does not provide an easy
-        method to rename a tag, instead it must be done through the web
-        interface.
+        Without ``apply`` this does not actually update the tags in flickr,
+        it is for information only. The flickr API does not provide a method
+        to rename a tag, so with ``apply`` each corrected tag is renamed
+        photo by photo, see renametags.
         '''
 
+        if line.strip() not in ('', 'apply'):
+            print >> self.stdout, "Usage: spellchecktags [apply]"
+            return
         self._flicker_login()
         tags_to_update = self._get_tags_to_correct()
         # [(err, correction), ...] --> "err --> correction\n"
         print >> self.stdout, "Tags to update:\n{0}".format(
                 '\n'.join(map(lambda tag: ' --> '.join(tag), tags_to_update)))
+        if line.strip() == 'apply' and tags_to_update:
+            self._rename_tags(tags_to_update)
+
+    def do_renametags(self, _ignored):
+        '''renametags
+
+        Finish the tag renames an interrupted ``spellchecktags apply`` left
+        unfinished. Every photo carrying a misspelled tag has the corrected
+        tag added and the misspelled one removed, several photos at a time.
+        Photos already done are skipped.
+        '''
+
+        renames = self.tag_renamer.pending()
+        if not renames:
+            print >> self.stdout, "No unfinished tag renames"
+            return
+        self._flicker_login()
+        self._rename_tags(renames)
+
+    def _rename_tags(self, renames):
+        '''Rename tags on flickr and print a summary of the photos touched
+
+        :param renames: [(original, corrected), ...] tag names
+        '''
+
+        print >> self.stdout, "Finding photos to retag..."
+
+        def progress(done, total):
+            self.stdout.write('\rRetagging photos... %d/%d' % (done, total))
+            self.stdout.flush()
+        results = self.tag_renamer.rename_all(renames, progress=progress)
+        if results:
+            print >> self.stdout
+        changed = collections.defaultdict(int)
+        for result in results:
+            if result.changed:
+                changed[result.old] += 1
+        failed = [result for result in results if not result.ok]
+        for old, new in tagrename.distinct_renames(renames):
+            print >> self.stdout, "%s --> %s: %d photos" % (old, new,
+                                                            changed[old])
+        for result in failed:
+            print >> self.stdout, "Failed to retag photo %s: %s" % (
+                                                result.photo_id, result.error)
+        touched = set(result.photo_id for result in results
+                      if result.changed)
+        print >> self.stdout, ("Retagged %d photos, %d already done, "
+                               "%d failed" % (len(touched), len(results) -
+                                              sum(changed.values()) -
+                                              len(failed), len(failed)))
+        if failed and self.tag_renamer.pending():
+            print >> self.stdout, "Use renametags to retry the failures"
+
+    def _start_check(self, line):
+        '''Turn a check command's argument into the photos to check and log
+        into flickr
+
+        Collections are looked up on flickr and swapped for the albums in
+        them.
 
-    def _correct_photos(self, date_from=None, date_to=None):
-        '''Return a list of photos with the spelling corrected
+        :returns: Tuple of (:obj:`~flickr_spellcheckr.utils.scope.Scope`,
+            list of :obj:`datetime.datetime`), None if badly formatted
+        '''
+
+        try:
+            photo_scope, date_range = scope_module.parse(line)
+        except ValueError, e:
+            print >> self.stdout, e, 'Processing has been aborted'
+            return None
+        self._flicker_login()
+        if photo_scope.collections:
+            try:
+                photoset_ids = self.flickr.collection_photosets(
+                                                    photo_scope.collections)
+            except ValueError, e:
+                print >> self.stdout, e, 'Processing has been aborted'
+                return None
+            photo_scope = scope_module.Scope(
+                albums=photo_scope.albums + [photoset_id for photoset_id
+                                             in photoset_ids
+                                             if photoset_id not in
+                                             photo_scope.albums],
+                tags=photo_scope.tags)
+            if not photo_scope:
+                print >> self.stdout, "No albums in those collections"
+                return None
+        if photo_scope:
+            print >> self.stdout, "Checking %s" % photo_scope
+        return photo_scope, date_range
+
+    def _correct_photos(self, date_from=None, date_to=None, scope=None):
+        '''Iterate over the photos with the spelling corrected, each as soon
+        as the user has finished with it
 
         :keyword date_from: The :obj:`datetime.datetime` to search from
         :keyword date_to: The :obj:`datetime.datetime` to search to
-        :returns: List of :obj:`~flickr_spellchecker.utils.flickr.SimplePhoto`
-            objects that have been edited
+        :keyword scope: :obj:`~flickr_spellcheckr.utils.scope.Scope` to pick
+            the photos by instead, narrowed down by the dates
+        :returns: Iterator of
+            :obj:`~flickr_spellchecker.utils.flickr.SimplePhoto` objects that
+            have been edited
         '''
 
         print >> self.stdout, "Searching for photos..."
-        corrected_photos = []
-        for photo in self.flickr.photos_iter(date_from=date_from,
-                                             date_to=date_to):
+        photos = self._photos_to_check(date_from, date_to, scope=scope)
+        if self.checker is not None:
+            photos = pipeline.background_filter(photos, self._has_errors,
+                                                on_reject=self._photo_clean)
+        for photo in photos:
             save_photo = False  # Track if we have modified a photo at all
+            reviewed = True  # False if the user quit part way through
             for key in ('title', 'description'):
                 # pyenchant doesn't like having set_text(None) called...
                 if getattr(photo, key) is None:
@@ -136,14 +609,254 @@ class Controller(Cmd):
                        ._read_spellchecker_command(err, getattr(photo, key)))
                     save_photo |= result.updated  # Binary or (save true)
                     if not result.carryon:  # Stop if the user says 'q'
+                        reviewed = False
                         break
                 # Save the updated text from this key after checking for errors
                 if save_photo:
                     setattr(photo, key, self.speller.get_text())
-            # Only append the photo to the corrected_photos queue once
+            # Only hand the photo on once
             if save_photo:
-                corrected_photos.append(photo)
-        return corrected_photos
+                self._journal_photos([photo])
+                yield photo
+            elif reviewed:
+                self._photo_clean(photo)
+
+    def _correct_words(self, date_from=None, date_to=None, scope=None):
+        '''Return a list of photos corrected one misspelled word at a time
+
+        :keyword date_from: The :obj:`datetime.datetime` to search from
+        :keyword date_to: The :obj:`datetime.datetime` to search to
+        :keyword scope: :obj:`~flickr_spellcheckr.utils.scope.Scope` to pick
+            the photos by instead, narrowed down by the dates
+        :returns: List of :obj:`~flickr_spellchecker.utils.flickr.SimplePhoto`
+            objects that have been edited
+        '''
+
+        print >> self.stdout, "Searching for photos..."
+        photos = collections.OrderedDict()
+
+        def remember(photos_iter):
+            for photo in photos_iter:
+                photos[photo.photo_id] = photo
+                yield photo
+        index = wordindex.WordIndex()
+        found = set()
+        for record in self._error_records(remember(
+                    self._photos_to_check(date_from, date_to, scope=scope))):
+            index.add(record.word, photos[record.photo_id], record.field,
+                      record.offset)
+            found.add(record.photo_id)
+        for photo_id, photo in photos.iteritems():
+            if photo_id not in found:
+                self._photo_clean(photo)
+        print >> self.stdout, "%d misspelled words found" % len(index)
+        replacements = {}
+        most_common = index.most_common()
+        for idx, (word, occurrences) in enumerate(most_common):
+            self._prefetch(ahead for ahead, _ in
+                           most_common[idx:idx + SUGGEST_AHEAD])
+            first = occurrences[0]
+            if self.rule_store is None or self.rule_store.get(word) is None:
+                print >> self.stdout, "%d uses in %d photos" % (
+                                    len(occurrences), index.photo_count(word))
+            result = self._read_spellchecker_command(WordError(self.speller,
+                                                               word),
+                                             getattr(first.photo, first.key))
+            if result.updated:
+                replacements[word] = result.err_replacement
+            if not result.carryon:  # Stop if the user says 'q'
+                break
+        return self._journal_photos(index.apply(replacements))
+
+    def _keep_corrected(self, photos):
+        '''Save corrected photos in the background as they come in, or
+        queue them for savechanges
+
+        With :attr:`write_behind` the photos still waiting once the review
+        is over are saved straight away. Photos that fail to save are
+        queued for savechanges.
+
+        :param photos: Iterable of corrected photos
+        '''
+
+        if self.write_behind is None:
+            self.photos.extend(photos)
+            return
+        for photo in photos:
+            self.write_behind.add(photo)
+        if len(self.write_behind):
+            print >> self.stdout, "Saving the last %d photos..." % (
+                                                    len(self.write_behind))
+        saved, failed = self.write_behind.flush()
+        for result in failed:
+            print >> self.stdout, "Failed to save photo %s: %s" % (
+                                        result.photo.photo_id, result.error)
+        if saved or failed:
+            print >> self.stdout, "Saved %d photos, %d failed" % (
+                                                        saved, len(failed))
+        if failed:
+            self.photos.extend(result.photo for result in failed)
+            print >> self.stdout, "Use savechanges to retry the failures"
+
+    def _confirm_save(self, result):
+        '''Record a photo saved by :attr:`write_behind`, run on its thread
+        '''
+
+        if not result.ok:
+            return
+        if self.journal is not None:
+            self.journal.confirm(result.photo)
+        result.photo.mark_saved()
+        if self.photo_store is not None:
+            self.photo_store.mark_verified(result.photo)
+
+    def _journal_photos(self, photos):
+        '''Write corrected photos to the journal, if there is one
+
+        :returns: ``photos``
+        '''
+
+        if self.journal is not None:
+            for photo in photos:
+                self.journal.append(photo)
+        return photos
+
+    def _error_records(self, photos):
+        '''Iterate over the spelling errors in the photos without prompting
+
+        Uses :attr:`detector` if there is one, otherwise the photos are
+        checked in this process.
+
+        :returns: Iterator of
+            :obj:`~flickr_spellcheckr.utils.detect.ErrorRecord`
+        '''
+
+        if self.detector is not None:
+            records = self.detector.errors_iter(photos)
+        else:
+            checker = self.checker if self.checker is not None else \
+                self.speller
+            records = detect.errors_iter(checker, photos)
+        if self.rule_store is not None:
+            records = (record for record in records
+                       if not self.rule_store.ignored(record.word))
+        return self._count_errors(records)
+
+    def _count_errors(self, records):
+        '''Record how many errors each photo with errors has
+        '''
+
+        photo_id, count = None, 0
+        for record in records:
+            self.metrics.incr('check.errors')
+            if record.photo_id != photo_id:
+                if count:
+                    self.metrics.observe('check.errors_per_photo', count, 1)
+                photo_id, count = record.photo_id, 0
+            count += 1
+            yield record
+        if count:
+            self.metrics.observe('check.errors_per_photo', count, 1)
+
+    def _has_errors(self, photo):
+        '''Check a photo with :attr:`checker`, run on a background thread
+
+        The words in error are prefetched, as the user is about to be asked
+        about them.
+
+        :returns: True if the title or description has a spelling error
+        '''
+
+        with self.metrics.timer('check.photo'):
+            words = []
+            for key in ('title', 'description'):
+                if getattr(photo, key) is None:
+                    continue
+                self.checker.set_text(getattr(photo, key))
+                for err in self.checker:
+                    if self.rule_store is None or \
+                            not self.rule_store.ignored(err.word):
+                        if self.prefetcher is None:
+                            return True
+                        words.append(err.word)
+        if words:
+            self._prefetch(words)
+        return bool(words)
+
+    def _photo_clean(self, photo):
+        '''Record a photo that was checked and needs no changes
+        '''
+
+        if self.photo_store is not None:
+            self.photo_store.mark_verified(photo)
+
+    def _photos_to_check(self, date_from=None, date_to=None, scope=None):
+        '''Return an iterable of the photos spellcheck should look at
+
+        With a local photo store the store is synced first and only photos
+        not already verified clean are returned, otherwise flickr is searched.
+        Photos picked by a ``scope`` are fetched from flickr, see
+        :meth:`_scoped_photos`.
+        '''
+
+        if scope:
+            return self._scoped_photos(scope, date_from, date_to)
+        if self.photo_store is None:
+            return self.flickr.photos_iter(date_from=date_from,
+                                           date_to=date_to,
+                                           per_page=self.per_page,
+                                           workers=self.fetch_workers)
+        self._sync_store()
+        if date_from is None:
+            date_from = (datetime.datetime.utcnow() - datetime.timedelta(
+                                            days=flickr.DEFAULT_SEARCH_DAYS))
+        return self.photo_store.photos(date_from=date_from, date_to=date_to)
+
+    def _scoped_photos(self, scope, date_from=None, date_to=None):
+        '''Return the photos in a scope's albums or with its tags
+
+        Only those photos are fetched, :attr:`album_workers` albums at a
+        time. With a local photo store, photos already verified clean with
+        the text they have now are skipped without a sync. A scope of every
+        photo is read from the synced store, or searched for without one.
+        '''
+
+        if scope.everything:
+            if self.photo_store is None:
+                return self.flickr.all_photos_iter(
+                                            per_page=self.per_page,
+                                            workers=self.fetch_workers)
+            self._sync_store()
+            return self.photo_store.photos()
+        photos = self.flickr.scoped_photos_iter(photoset_ids=scope.albums,
+                                                tags=scope.tags,
+                                                per_page=self.per_page,
+                                                workers=self.album_workers)
+        photos = scope_module.taken_between(photos, date_from, date_to)
+        if self.photo_store is not None:
+            photos = (photo for photo in photos
+                      if not self.photo_store.is_verified(photo))
+        return photos
+
+    def _sync_store(self):
+        '''Pull new and changed photos from flickr into the photo store
+        '''
+
+        started = time.time()
+        last_sync = self.photo_store.last_sync
+        if last_sync is None:
+            print >> self.stdout, "Downloading photostream to local store..."
+            photos = self.flickr.all_photos_iter(per_page=self.per_page,
+                                                 workers=self.fetch_workers)
+        else:
+            print >> self.stdout, "Syncing local store..."
+            photos = self.flickr.updated_photos_iter(
+                                            last_sync - SYNC_MARGIN,
+                                            per_page=self.per_page,
+                                            workers=self.fetch_workers)
+        count = self.photo_store.update(photos)
+        self.photo_store.last_sync = started
+        print >> self.stdout, "%d photos updated" % count
 
     def _flicker_login(self):
         '''Log into flickr and get the auth tokens.
@@ -159,20 +872,41 @@ class Controller(Cmd):
     def _get_tags_to_correct(self):
         '''Return a list of tags to correct
 
+        Each distinct tag is checked on its own, and only tags with an
+        unknown word are prompted for, the most used tags first.
+
         :returns: [(original, corrected), ...] tag names
         '''
 
         print >> self.stdout, "Searching for tags..."
-        self.speller.set_text(' '.join(self.flickr.tag_list()))
+        tags = tagcheck.unique_tags(self.flickr.tag_list())
         print >> self.stdout, "Spellchecking tags..."
+        misspelled = list(tagcheck.find_misspelled(tags, self.speller.check))
+        if not misspelled:
+            return []
+        counts = self.flickr.tag_counts()
+        misspelled.sort(key=lambda miss:
+                        -counts.get(tagcheck.clean_tag(miss[0]), 0))
         tags_to_update = []
-        for err in self.speller:
-            result = (self._read_spellchecker_command(err,
-                                                                   err.word))
-            if not result.carryon:  # Stop if the user says 'q'
+        for idx, (tag, words) in enumerate(misspelled):
+            self._prefetch(word for _, ahead in
+                           misspelled[idx:idx + SUGGEST_AHEAD]
+                           for word in ahead)
+            corrected = tag
+            carryon = True
+            for word in words:
+                result = self._read_spellchecker_command(
+                                        WordError(self.speller, word), tag)
+                if result.updated:
+                    corrected = tagcheck.replace_word(corrected, word,
+                                                      result.err_replacement)
+                if not result.carryon:  # Stop if the user says 'q'
+                    carryon = False
+                    break
+            if corrected != tag:
+                tags_to_update.append((tag, corrected))
+            if not carryon:
                 break
-            if result.updated:
-                tags_to_update.append((result.err_word, result.err_replacement))
         return tags_to_update
 
     def _read_spellchecker_command(self, error, phrase):
@@ -180,10 +914,23 @@ class Controller(Cmd):
 
         This is a moderately ugly bit of case switch code in python.
 
+        A word with a rule in :attr:`rule_store` is replaced or ignored
+        without prompting.
+
         :returns: Tuple of bools (Continue checking, Word Modified)
         '''
 
-        suggs = error.suggest()
+        if self.rule_store is not None:
+            rule = self.rule_store.get(error.word)
+            if rule is not None:
+                return self._apply_rule(error, rule)
+        with self.metrics.timer('suggest'):
+            if self.prefetcher is not None:
+                suggs = self.prefetcher.suggest(error.word, error.suggest)
+            elif self.suggestions is not None:
+                suggs = self.suggestions.suggest(error.word, error.suggest)
+            else:
+                suggs = error.suggest()
         while True:
             print >> self.stdout, "CHECKING: ", phrase
             print >> self.stdout, "ERROR:", error.word
@@ -215,6 +962,8 @@ class Controller(Cmd):
                     print >> self.stdout, "No suggestion number", repl
                     continue
                 error.replace_always(suggs[repl])
+                if self.rule_store is not None:
+                    self.rule_store.set(error.word, suggs[repl])
                 return SpellcheckerCommandResult(error, error.word,
                                                  suggs[repl], updated=True,
                                                  carryon=True)
@@ -225,11 +974,17 @@ class Controller(Cmd):
             # ALWAYS ignore this word
             elif cmd == "I":
                 error.ignore_always()
+                if self.rule_store is not None:
+                    self.rule_store.set(error.word)
                 return SpellcheckerCommandResult(error, error.word, None,
                                                  updated=False, carryon=True)
             # Add the word to the dictionary
             elif cmd == "a":
                 error.add()
+                if self.suggestions is not None:
+                    self.suggestions.refresh()  # The PWL has changed
+                if self.prefetcher is not None:
+                    self.prefetcher.clear()
                 return SpellcheckerCommandResult(error, error.word, None,
                                                  updated=False, carryon=True)
             # Edit the word directly
@@ -253,16 +1008,43 @@ class Controller(Cmd):
                 print >> self.stdout, "Badly formatted command (try 'help')"
                 continue
 
+    def _prefetch(self, words):
+        '''Queue words for :attr:`prefetcher`, if there is one
+
+        Words with a rule are skipped, they are never prompted for.
+        '''
+
+        if self.prefetcher is None:
+            return
+        if self.rule_store is not None:
+            words = (word for word in words
+                     if self.rule_store.get(word) is None)
+        self.prefetcher.prefetch(words)
+
+    def _apply_rule(self, error, rule):
+        '''Replace or ignore an error as a stored rule says to
+        '''
+
+        self.rule_store.record_use(rule.word)
+        self.metrics.incr('rules.applied')
+        if rule.replacement is None:
+            return SpellcheckerCommandResult(error, error.word, None,
+                                             updated=False, carryon=True)
+        error.replace(rule.replacement)
+        return SpellcheckerCommandResult(error, error.word, rule.replacement,
+                                         updated=True, carryon=True)
+
     def _spellchecker_help(self):
         '''Just prints out the help text for using the spelling corrector
         '''
 
         print >> self.stdout, '\n'.join((
            "0..N:    replace with the numbered suggestion",
-           "R0..rN:  always replace with the numbered suggestion",
-           "i:       ignore this wordv",
-           "I:       always ignore this word",
-           "a:       add word to personal dictionary (only for this session)",
+           "R0..RN:  always replace with the numbered suggestion, now and "
+           "in later sessions",
+           "i:       ignore this word",
+           "I:       always ignore this word, now and in later sessions",
+           "a:       add word to personal dictionary",
            "e:       edit the word",
            "q:       quit checking",
            "h:       print this help message",
@@ -275,14 +1057,213 @@ def get_local_settings():
     return os.path.join(os.path.expanduser("~"), '.flickr-spellcheckr')
 
 
-def main():
-    import enchant
-    from enchant.checker import SpellChecker
+def get_local_file(suffix):
+    '''Path of a data file kept alongside the personal word list
+
+    :param suffix: Extension for the file, e.g. ``.sqlite``
+    '''
+
+    return os.path.splitext(get_local_settings())[0] + suffix
+
+
+def add_markup_arguments(parser):
+    '''Add the options choosing what markup the spellchecker skips
+    '''
+
+    def pattern(value):
+        if isinstance(value, str):
+            value = value.decode(sys.getfilesystemencoding() or 'utf-8')
+        try:
+            re.compile(value, re.UNICODE)
+        except re.error, e:
+            raise argparse.ArgumentTypeError('bad pattern: %s' % e)
+        return value
+    parser.add_argument('--no-filter', action='append', default=[],
+                        choices=markup.FILTERS, metavar='FILTER',
+                        help='Check text the named filter would skip, one '
+                             'of %s. May be given more than once' % (
+                                                ', '.join(markup.FILTERS)))
+    parser.add_argument('--skip-pattern', action='append', default=[],
+                        type=pattern, metavar='REGEX',
+                        help='Don\'t check text matching this regular '
+                             'expression. May be given more than once')
+
+
+def add_quota_arguments(parser):
+    '''Add the options pacing calls to flickr
+    '''
+
+    parser.add_argument('--api-hourly', type=int, default=quota.HOURLY_LIMIT,
+                        help='Most calls to flickr per hour, 0 for no limit '
+                             '(default: %d)' % quota.HOURLY_LIMIT)
+    parser.add_argument('--api-burst', type=int, default=quota.BURST,
+                        help='Calls to flickr that may be made at once '
+                             'before pacing starts (default: %d)' % (
+                                                            quota.BURST))
+
+
+def quota_scheduler(args):
+    '''Return the :obj:`~flickr_spellcheckr.utils.quota.QuotaScheduler`
+    for the options added by :func:`add_quota_arguments`
+    '''
+
+    return quota.QuotaScheduler(hourly=args.api_hourly, burst=args.api_burst)
+
+
+def markup_options(args):
+    '''Return the markup keywords for the checker factories from the
+    options added by :func:`add_markup_arguments`
+    '''
+
+    return {'filters': tuple(name for name in markup.FILTERS
+                             if name not in args.no_filter),
+            'patterns': tuple(args.skip_pattern)}
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='flickr-spellcheckr',
+                    description='Commandline spellchecker for flickr photos')
+    parser.add_argument('--save-workers', type=int, default=4,
+                        help='Photos to save to flickr at once (default: 4)')
+    parser.add_argument('--save-rate', type=float, default=None,
+                        help='Most save requests per second, only used '
+                             'with --api-hourly 0 (default: none)')
+    parser.add_argument('--save-retries', type=int, default=3,
+                        help='Attempts per photo on network errors '
+                             '(default: 3)')
+    parser.add_argument('--save-every', type=int, default=None,
+                        help='Save corrected photos in the background during '
+                             'spellcheck, once this many are waiting')
+    parser.add_argument('--save-after', type=float, default=None,
+                        help='Save corrected photos in the background during '
+                             'spellcheck, once the oldest has waited this '
+                             'many seconds')
+    parser.add_argument('--album-workers', type=int, default=4,
+                        help='Albums listed from flickr at once when '
+                             'checking by album, collection or tag '
+                             '(default: 4)')
+    parser.add_argument('--fetch-workers', type=int, default=4,
+                        help='Pages of search results fetched from flickr '
+                             'at once (default: 4)')
+    parser.add_argument('--per-page', type=int, default=None,
+                        help='Photos per page of search results (default: '
+                             'picked from the response times)')
+    parser.add_argument('--no-store', action='store_true',
+                        help='Search flickr every time instead of keeping a '
+                             'local copy of the photostream')
+    parser.add_argument('--no-pipeline', action='store_true',
+                        help='Fetch and check photos on the same thread as '
+                             'the prompt')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Processes used by scan and spellcheckwords to '
+                             'find errors (default: one per CPU)')
+    parser.add_argument('--no-suggestion-cache', action='store_true',
+                        help='Ask the spellchecker for suggestions every time '
+                             'instead of caching them between runs')
+    parser.add_argument('--suggest-workers', type=int, default=1,
+                        help='Threads working out suggestions for the errors '
+                             'coming up while you answer the prompt, 0 for '
+                             'none (default: 1)')
+    parser.add_argument('--stats-file', default=None,
+                        help='Write the session\'s API call and timing stats '
+                             'to this file as JSON on exit')
+    parser.add_argument('--profile-dir', default=None,
+                        help='Write a cProfile dump of every command to this '
+                             'directory')
+    parser.add_argument('--connections', type=int, default=None,
+                        help='Talk to flickr over this many pooled '
+                             'keep-alive connections instead of a new '
+                             'connection per call')
+    parser.add_argument('--no-journal', action='store_true',
+                        help='Keep corrections in memory only until they are '
+                             'saved instead of journaling them to disk')
+    parser.add_argument('--no-rules', action='store_true',
+                        help='Forget always replace and always ignore '
+                             'answers at the end of the session instead of '
+                             'applying them in later sessions')
+    add_markup_arguments(parser)
+    add_quota_arguments(parser)
+    return parser
+
 
-    speller = SpellChecker(lang=enchant.DictWithPWL("en_US",
-                                                    pwl=get_local_settings()))
-    ctrl = Controller(flickr=flickr.Flickr(), speller=speller)
-    ctrl.cmdloop()
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    markup_kwargs = markup_options(args)
+    # Loading the dictionaries is the slowest part of starting up, so it is
+    # done while the user types the first command
+    speller = lazy.Background(detect.make_checker, LANG,
+                              pwl=get_local_settings(), **markup_kwargs)
+    scheduler = quota_scheduler(args)
+    if args.connections:
+        flickr_obj = flickr.PooledFlickr(connections=args.connections,
+                                         scheduler=scheduler)
+    else:
+        flickr_obj = flickr.Flickr(scheduler=scheduler)
+    saver = bulksave.BulkSaver(flickr_obj, workers=args.save_workers,
+                               rate=args.save_rate, retries=args.save_retries)
+    photo_store = None
+    if not args.no_store:
+        photo_store = store.PhotoStore(get_local_file('.sqlite'))
+    suggestions = None
+    if not args.no_suggestion_cache:
+        suggestions = suggest.SuggestionCache(LANG, pwl=get_local_settings(),
+                                path=get_local_file('-suggestions.sqlite'))
+    prefetcher = None
+    if args.suggest_workers > 0:
+        prefetcher = suggest.SuggestionPrefetcher(
+                        functools.partial(suggest.make_suggester, LANG,
+                                          pwl=get_local_settings()),
+                        workers=args.suggest_workers, cache=suggestions)
+    checker = None
+    if not args.no_pipeline:
+        checker = lazy.Background(lexicon.make_checker, LANG,
+                                  pwl=get_local_settings(), **markup_kwargs)
+    detector = detect.Detector(LANG, pwl=get_local_settings(),
+                               processes=args.processes,
+                               factory=functools.partial(lexicon.make_checker,
+                                                         **markup_kwargs))
+    journal_obj = None
+    if not args.no_journal:
+        journal_obj = journal.Journal(get_local_file('-journal.jsonl'))
+    rename_log = None
+    if not args.no_journal:
+        rename_log = tagrename.RenameLog(get_local_file('-renames.jsonl'))
+    tag_renamer = tagrename.TagRenamer(flickr_obj, workers=args.save_workers,
+                                       rate=args.save_rate,
+                                       retries=args.save_retries,
+                                       log=rename_log)
+    rule_store = None
+    if not args.no_rules:
+        rule_store = rules.RuleStore(get_local_file('-rules.sqlite'))
+    ctrl = Controller(flickr=flickr_obj, speller=speller, saver=saver,
+                      photo_store=photo_store, suggestions=suggestions,
+                      checker=checker, detector=detector,
+                      profile_dir=args.profile_dir, journal=journal_obj,
+                      rule_store=rule_store, prefetcher=prefetcher,
+                      tag_renamer=tag_renamer, save_every=args.save_every,
+                      save_after=args.save_after,
+                      album_workers=args.album_workers,
+                      fetch_workers=args.fetch_workers,
+                      per_page=args.per_page)
+    try:
+        ctrl.cmdloop()
+    finally:
+        if ctrl.write_behind is not None:
+            # Anything that fails is still in the journal for next time
+            ctrl.write_behind.close()
+        if journal_obj is not None:
+            journal_obj.close()
+        if rename_log is not None:
+            rename_log.close()
+        if rule_store is not None:
+            rule_store.close()
+        if prefetcher is not None:
+            prefetcher.close()
+        flickr_obj.close()
+        if args.stats_file is not None:
+            with open(args.stats_file, 'w') as stats:
+                json.dump(metrics_module.registry.snapshot(), stats, indent=2,
+                          sort_keys=True)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,231 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.report
+=========================
+
+Non-interactive report of the spelling errors in a photostream, for use from
+cron jobs and CI. Every error found is written out as soon as its photo has
+been checked, as JSON Lines or CSV, so memory use does not grow with the
+size of the photostream.
+
+Exit codes:
+
+* 0 -- no spelling errors found
+* 1 -- spelling errors found
+* 2 -- bad arguments or a failure talking to flickr
+* 3 -- not authorised, run ``flickr-spellcheckr`` once to log in
+'''
+
+from flickr_spellcheckr.controller import LANG, add_markup_arguments, \
+    add_quota_arguments, get_local_file, get_local_settings, \
+    markup_options, quota_scheduler
+from flickr_spellcheckr.utils import detect, flickr, lazy, lexicon, suggest
+import argparse
+import collections
+import csv
+import datetime
+import functools
+import json
+import sys
+
+EXIT_CLEAN = 0
+EXIT_ERRORS_FOUND = 1
+EXIT_FAILURE = 2
+EXIT_NOT_AUTHORISED = 3
+
+COLUMNS = ('photo_id', 'field', 'offset', 'word', 'suggestions', 'context')
+CONTEXT_CHARS = 30  # Characters either side of the error in the context
+
+
+class JsonLinesWriter(object):
+    def __init__(self, stream):
+        '''Write one JSON object per error, one per line
+        '''
+
+        self.stream = stream
+
+    def write(self, row):
+        self.stream.write(json.dumps(row, sort_keys=True) + '\n')
+        self.stream.flush()
+
+
+class CsvWriter(object):
+    def __init__(self, stream):
+        '''Write one CSV row per error, suggestions separated by "|"
+        '''
+
+        self.stream = stream
+        self._writer = csv.writer(stream)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, row):
+        row = dict(row, suggestions='|'.join(row['suggestions']))
+        self._writer.writerow([unicode(row[column]).encode('utf-8')
+                               for column in COLUMNS])
+        self.stream.flush()
+
+WRITERS = {'jsonl': JsonLinesWriter, 'csv': CsvWriter}
+
+
+class _RecentPhotos(object):
+    def __init__(self):
+        '''Photos sent for checking whose errors may not have arrived yet
+
+        Errors come back in the same order as the photos went out, so once
+        an error for a photo arrives every photo before it can be dropped.
+        '''
+
+        self._photos = collections.OrderedDict()
+
+    def track(self, photos):
+        for photo in photos:
+            self._photos[photo.photo_id] = photo
+            yield photo
+
+    def get(self, photo_id):
+        while self._photos:
+            first = next(iter(self._photos))
+            if first == photo_id:
+                return self._photos[first]
+            del self._photos[first]
+        raise KeyError(photo_id)
+
+
+def context(text, offset, word, chars=CONTEXT_CHARS):
+    '''Return the text around a word, on a single line
+    '''
+
+    start = max(offset - chars, 0)
+    end = offset + len(word) + chars
+    snippet = u' '.join(text[start:end].split())
+    return (u'...' if start > 0 else u'') + snippet + (
+                                        u'...' if end < len(text) else u'')
+
+
+def report_rows(photos, records, suggester=None, max_suggestions=3):
+    '''Iterate over the report rows for the errors in the photos
+
+    :param photos: Iterable of photos being checked
+    :param records: Callable taking an iterable of photos and returning an
+        iterator of :obj:`~flickr_spellcheckr.utils.detect.ErrorRecord` in
+        the same order
+    :keyword suggester: Callable taking a word and returning suggestions
+    :keyword max_suggestions: Most suggestions included per error
+    :returns: Iterator of dicts keyed by :data:`COLUMNS`
+    '''
+
+    recent = _RecentPhotos()
+    for record in records(recent.track(photos)):
+        text = getattr(recent.get(record.photo_id), record.field)
+        suggs = []
+        if suggester is not None and max_suggestions > 0:
+            suggs = list(suggester(record.word))[:max_suggestions]
+        yield {'photo_id': record.photo_id,
+               'field': record.field,
+               'offset': record.offset,
+               'word': record.word,
+               'suggestions': suggs,
+               'context': context(text, record.offset, record.word)}
+
+
+def get_parser():
+    def date(value):
+        return datetime.datetime.strptime(value, '%m/%d/%Y')
+    parser = argparse.ArgumentParser(prog='flickr-spellcheckr-report',
+                    description='Report the spelling errors in your flickr '
+                                'photos without asking anything')
+    parser.add_argument('--from', dest='date_from', type=date, default=None,
+                        help='Photos taken from MM/DD/YYYY (default: 40 days '
+                             'ago)')
+    parser.add_argument('--to', dest='date_to', type=date, default=None,
+                        help='Photos taken up to MM/DD/YYYY (default: now)')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='jsonl',
+                        help='Output format (default: jsonl)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='File to write to (default: stdout)')
+    parser.add_argument('--suggestions', type=int, default=3,
+                        help='Suggestions per error, 0 for none (default: 3)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Processes used to find errors (default: one '
+                             'per CPU)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Search result pages fetched at once '
+                             '(default: 4)')
+    parser.add_argument('--connections', type=int, default=None,
+                        help='Talk to flickr over this many pooled '
+                             'keep-alive connections instead of a new '
+                             'connection per call')
+    add_markup_arguments(parser)
+    add_quota_arguments(parser)
+    return parser
+
+
+def load_dictionary(lang, pwl=None):
+    '''Return an :obj:`enchant.Dict` for the language with the word list
+    '''
+
+    import enchant
+
+    return enchant.DictWithPWL(lang, pwl=pwl)
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    pwl = get_local_settings()
+    # Load the dictionary while logging in
+    dictionary = lazy.Background(load_dictionary, LANG, pwl=pwl)
+    scheduler = quota_scheduler(args)
+    if args.connections:
+        flickr_obj = flickr.PooledFlickr(connections=args.connections,
+                                         scheduler=scheduler)
+    else:
+        flickr_obj = flickr.Flickr(scheduler=scheduler)
+    try:
+        if not flickr_obj.login(interactive=False):
+            print >> sys.stderr, ('Not authorised with flickr, run '
+                                  'flickr-spellcheckr once to log in')
+            return EXIT_NOT_AUTHORISED
+    except Exception, e:
+        # Anything escaping would exit 1, which reads as errors found
+        print >> sys.stderr, 'Flickr login failed:', e
+        flickr_obj.close()
+        return EXIT_FAILURE
+    cache = None
+    output = None
+    found = False
+    try:
+        cache = suggest.SuggestionCache(LANG, pwl=pwl,
+                                path=get_local_file('-suggestions.sqlite'))
+        factory = functools.partial(lexicon.make_checker,
+                                    **markup_options(args))
+        detector = detect.Detector(LANG, pwl=pwl, processes=args.processes,
+                                   factory=factory)
+
+        def suggester(word):
+            return cache.suggest(word, lambda: dictionary.suggest(word))
+        photos = flickr_obj.photos_iter(date_from=args.date_from,
+                                        date_to=args.date_to,
+                                        workers=args.workers)
+        output = sys.stdout
+        if args.output is not None:
+            output = open(args.output, 'wb')
+        writer = WRITERS[args.format](output)
+        for row in report_rows(photos, detector.errors_iter,
+                               suggester=suggester,
+                               max_suggestions=args.suggestions):
+            writer.write(row)
+            found = True
+    except Exception, e:
+        print >> sys.stderr, 'Report aborted:', e
+        return EXIT_FAILURE
+    finally:
+        if cache is not None:
+            cache.close()
+        flickr_obj.close()
+        if output is not None and output is not sys.stdout:
+            output.close()
+    return EXIT_ERRORS_FOUND if found else EXIT_CLEAN
+
+if __name__ == '__main__':
+    sys.exit(main())
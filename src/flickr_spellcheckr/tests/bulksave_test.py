@@ -0,0 +1,145 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.bulksave
+'''
+
+from flickr_spellcheckr.tests.fakes import FakeClock
+from flickr_spellcheckr.utils import bulksave, flickr, httppool, quota
+import mock
+import threading
+import unittest
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_no_limit(self):
+        sleep = mock.Mock()
+        limiter = bulksave.RateLimiter(None, sleep=sleep)
+        for _ in xrange(10):
+            limiter.acquire()
+        self.assertFalse(sleep.called)
+
+    def test_rate(self):
+        clock = FakeClock()
+        limiter = bulksave.RateLimiter(2, clock=clock, sleep=clock.sleep)
+        for _ in xrange(5):
+            limiter.acquire()
+        # One free token, then 4 more at 2 per second
+        self.assertAlmostEqual(2.0, clock.now)
+
+
+class TestBulkSaver(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        # Mock makes save_meta the first time it is used, and calls on a copy
+        # made by a racing worker thread would be lost, so make it up front
+        self.saved = []
+        lock = threading.Lock()
+
+        def save_meta(photo):
+            with lock:
+                self.saved.append(photo.photo_id)
+        self.mock_flickr.save_meta.side_effect = save_meta
+        self.photos = [flickr.SimplePhoto('title', 'desc', str(idx))
+                       for idx in xrange(10)]
+        self.sleep = mock.Mock()
+
+    def test_all_saved_in_order(self):
+        saver = bulksave.BulkSaver(self.mock_flickr, workers=3,
+                                   sleep=self.sleep)
+        results = saver.save_all(self.photos)
+        self.assertEqual(self.photos, [result.photo for result in results])
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual([1] * 10, [result.attempts for result in results])
+        self.assertEqual(sorted(photo.photo_id for photo in self.photos),
+                         sorted(self.saved))
+
+    def test_on_result(self):
+        saver = bulksave.BulkSaver(self.mock_flickr, workers=3,
+                                   sleep=self.sleep)
+        seen = []
+        saver.save_all(self.photos, on_result=seen.append)
+        self.assertEqual(sorted(self.photos),
+                         sorted(result.photo for result in seen))
+        self.assertTrue(all(result.ok for result in seen))
+        self.assertEqual(10, len(self.saved))
+
+    def test_transient_retried(self):
+        self.mock_flickr.save_meta.side_effect = [IOError('timeout'), None]
+        saver = bulksave.BulkSaver(self.mock_flickr, retries=3,
+                                   backoff=0.5, sleep=self.sleep)
+        result = saver.save_one(self.photos[0])
+        self.assertTrue(result.ok)
+        self.assertEqual(2, result.attempts)
+        self.sleep.assert_called_with(0.5)
+
+    def test_transient_gives_up(self):
+        self.mock_flickr.save_meta.side_effect = IOError('timeout')
+        saver = bulksave.BulkSaver(self.mock_flickr, retries=3,
+                                   sleep=self.sleep)
+        result = saver.save_one(self.photos[0])
+        self.assertFalse(result.ok)
+        self.assertEqual(3, self.mock_flickr.save_meta.call_count)
+
+    def test_permanent_not_retried(self):
+        self.mock_flickr.save_meta.side_effect = (
+                                    flickr.flickrapi.FlickrError('denied'))
+        saver = bulksave.BulkSaver(self.mock_flickr, retries=3,
+                                   sleep=self.sleep)
+        result = saver.save_one(self.photos[0])
+        self.assertFalse(result.ok)
+        self.assertEqual(1, self.mock_flickr.save_meta.call_count)
+
+    def test_client_error_not_retried(self):
+        self.mock_flickr.save_meta.side_effect = httppool.HTTPStatusError(
+                                                        403, 'Forbidden')
+        saver = bulksave.BulkSaver(self.mock_flickr, retries=3,
+                                   sleep=self.sleep)
+        result = saver.save_one(self.photos[0])
+        self.assertFalse(result.ok)
+        self.assertEqual(1, self.mock_flickr.save_meta.call_count)
+
+    def test_server_error_retried(self):
+        self.mock_flickr.save_meta.side_effect = [
+            httppool.HTTPStatusError(502, 'Bad Gateway'), None]
+        saver = bulksave.BulkSaver(self.mock_flickr, retries=3,
+                                   sleep=self.sleep)
+        self.assertTrue(saver.save_one(self.photos[0]).ok)
+        self.assertEqual(2, self.mock_flickr.save_meta.call_count)
+
+    def test_throttled_not_retried_twice(self):
+        clock = FakeClock()
+        scheduler = quota.QuotaScheduler(clock=clock, sleep=clock.sleep)
+        pool = mock.Mock()
+        pool.request.side_effect = httppool.HTTPStatusError(
+                                                429, 'Too Many Requests')
+        with mock.patch('flickrapi.FlickrAPI') as mock_api:
+            mock_api.return_value.encode_and_sign.side_effect = \
+                lambda args: args
+            flickr_obj = flickr.PooledFlickr(pool=pool, scheduler=scheduler)
+            flickr_obj.logged_in = True
+            saver = bulksave.BulkSaver(flickr_obj, rate=1, retries=3,
+                                       sleep=self.sleep)
+            result = saver.save_one(self.photos[0])
+        self.assertFalse(result.ok)
+        self.assertEqual(scheduler.retries, pool.request.call_count)
+        self.assertFalse(self.sleep.called)
+        self.assertEqual(None, saver.limiter.rate)
+
+    def test_failure_does_not_stop_batch(self):
+        def save_meta(photo):
+            if photo.photo_id == '3':
+                raise flickr.flickrapi.FlickrError('denied')
+        self.mock_flickr.save_meta.side_effect = save_meta
+        progress = mock.Mock()
+        saver = bulksave.BulkSaver(self.mock_flickr, sleep=self.sleep)
+        results = saver.save_all(self.photos, progress=progress)
+        self.assertEqual(['3'], [result.photo.photo_id for result in results
+                                 if not result.ok])
+        self.assertEqual(10, progress.call_count)
+        progress.assert_called_with(10, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,7 +5,14 @@
 
 from enchant.checker import SpellChecker
 from flickr_spellcheckr import controller
-from flickr_spellcheckr.utils import flickr
+from flickr_spellcheckr.utils import flickr, journal, lazy, metrics, \
+    quota, rules, store, suggest, tagrename
+import StringIO
+import datetime
+import os
+import shutil
+import tempfile
+import time
 import enchant
 import mock
 import unittest
@@ -30,6 +37,18 @@ class TestBasicController(unittest.TestCase):
         self.mock_flickr.login.assert_called_with()
         assert self.mock_flickr.photos_iter.called, 'Never iterated photos'
 
+    def test_fetch_settings(self):
+        self.mock_flickr.login.return_value = True
+        self.mock_flickr.photos_iter.return_value = iter([])
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller,
+                                     fetch_workers=3, per_page=50)
+        ctrl.do_spellcheck('01/01/2012 02/01/2012')
+        self.mock_flickr.photos_iter.assert_called_once_with(
+                            date_from=datetime.datetime(2012, 1, 1),
+                            date_to=datetime.datetime(2012, 2, 1),
+                            per_page=50, workers=3)
+
     def test_one_photo_no_errors(self):
         photo = mock.Mock(spec=flickr.SimplePhoto, title='test',
                           description='test')
@@ -42,12 +61,371 @@ class TestBasicController(unittest.TestCase):
         self.assertEqual(self.mock_speller.__iter__.call_count, 2,
                          'Failed to check all fields')
 
+    def test_speller_loaded_in_background(self):
+        photo = flickr.SimplePhoto('test', 'test', '1')
+        self.mock_flickr.login.return_value = True
+        self.mock_flickr.photos_iter.return_value = iter([photo])
+        self.mock_speller.__iter__.return_value = iter([])
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                        speller=lazy.Background(lambda: self.mock_speller))
+        ctrl.do_spellcheck('')
+        self.mock_speller.set_text.assert_called_with('test')
+
+
+class TestPhotoStoreController(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.mock_flickr.login.return_value = True
+        self.mock_speller = mock.MagicMock(spec=SpellChecker)
+        self.mock_speller.__iter__.return_value = iter([])
+        self.store = store.PhotoStore(':memory:')
+        self.photo = flickr.SimplePhoto('test', 'test', '1',
+                        datetime.datetime.now().strftime(store.DATE_FORMAT))
+        self.ctrl = controller.Controller(flickr=self.mock_flickr,
+                                          speller=self.mock_speller,
+                                          photo_store=self.store)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_first_sync_downloads_all(self):
+        self.mock_flickr.all_photos_iter.return_value = iter([self.photo])
+        self.ctrl.do_spellcheck('')
+        self.assertFalse(self.mock_flickr.photos_iter.called)
+        self.assertEqual(1, len(self.store))
+        self.assertNotEqual(None, self.store.last_sync)
+
+    def test_clean_photo_not_rechecked(self):
+        self.mock_flickr.all_photos_iter.return_value = iter([self.photo])
+        self.ctrl.do_spellcheck('')
+        self.assertEqual(self.mock_speller.__iter__.call_count, 2)
+        self.mock_flickr.updated_photos_iter.return_value = iter([])
+        self.ctrl.do_spellcheck('')
+        self.assertTrue(self.mock_flickr.updated_photos_iter.called)
+        self.assertEqual(self.mock_speller.__iter__.call_count, 2,
+                         'Verified photo was checked again')
+
+    def test_sync_fetch_settings(self):
+        self.ctrl.fetch_workers = 3
+        self.ctrl.per_page = 50
+        self.mock_flickr.all_photos_iter.return_value = iter([self.photo])
+        self.mock_flickr.updated_photos_iter.return_value = iter([])
+        self.ctrl.do_sync('')
+        self.ctrl.do_sync('')
+        self.mock_flickr.all_photos_iter.assert_called_once_with(
+                                                    per_page=50, workers=3)
+        _since, kwargs = self.mock_flickr.updated_photos_iter.call_args
+        self.assertEqual({'per_page': 50, 'workers': 3}, kwargs)
+
+
+class TestPipelineController(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.mock_flickr.login.return_value = True
+        self.mock_speller = mock.MagicMock(spec=SpellChecker)
+        self.mock_speller.__iter__.side_effect = lambda: iter([])
+        self.mock_checker = mock.MagicMock(spec=SpellChecker)
+        texts = []
+        self.mock_checker.set_text.side_effect = texts.append
+        self.mock_checker.__iter__.side_effect = lambda: iter(
+                                    ['err'] if 'bad' in texts[-1] else [])
+        self.photos = [flickr.SimplePhoto('good', None, '1'),
+                       flickr.SimplePhoto('bad', None, '2'),
+                       flickr.SimplePhoto('good', 'good', '3')]
+        self.mock_flickr.photos_iter.return_value = iter(self.photos)
+
+    def test_only_errors_prompted(self):
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller,
+                                     checker=self.mock_checker)
+        ctrl.do_spellcheck('')
+        self.mock_speller.set_text.assert_called_once_with('bad')
+
+    def test_clean_photos_verified(self):
+        photo_store = mock.Mock(spec=store.PhotoStore)
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller,
+                                     checker=self.mock_checker)
+        ctrl.photo_store = photo_store
+        ctrl._photos_to_check = mock.Mock(return_value=iter(self.photos))
+        ctrl.do_spellcheck('')
+        verified = [call[0][0].photo_id
+                    for call in photo_store.mark_verified.call_args_list]
+        self.assertEqual(['1', '2', '3'], sorted(verified))
+
+
+class TestWordReviewController(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.mock_flickr.login.return_value = True
+        self.mock_speller = mock.MagicMock(spec=SpellChecker)
+        self.mock_speller.suggest.return_value = ['receive', 'relieve']
+        self.photos = [flickr.SimplePhoto('recieve it', None, str(idx))
+                       for idx in xrange(5)]
+        self.mock_flickr.photos_iter.return_value = iter(self.photos)
+        error = mock.Mock(word='recieve', wordpos=0)
+        self.mock_speller.__iter__.side_effect = lambda: iter([error])
+        self.ctrl = controller.Controller(flickr=self.mock_flickr,
+                                          speller=self.mock_speller)
+
+    def test_one_prompt_per_word(self):
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = '0'
+            self.ctrl.do_spellcheckwords('')
+        self.assertEqual(1, mockraw.call_count)
+        self.assertEqual(['receive it'] * 5,
+                         [photo.title for photo in self.photos])
+        self.assertEqual(5, len(self.ctrl.photos))
+
+    def test_scan_reports_without_prompting(self):
+        out = StringIO.StringIO()
+        self.ctrl.stdout = out
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            self.ctrl.do_scan('')
+        self.assertFalse(mockraw.called)
+        self.assertTrue('5 errors in 5 photos' in out.getvalue())
+        self.assertEqual([], list(self.ctrl.photos))
+
+    def test_ignored_word_unchanged(self):
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = 'i'
+            self.ctrl.do_spellcheckwords('')
+        self.assertEqual(['recieve it'] * 5,
+                         [photo.title for photo in self.photos])
+        self.assertEqual([], list(self.ctrl.photos))
+
+
+class TestTagController(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.mock_flickr.login.return_value = True
+        self.mock_flickr.tag_list.return_value = iter(
+            ['good', 'teh', 'good', 'New Yrok', 'teh', 'geo:lat=12.3'])
+        self.mock_flickr.tag_counts.return_value = {'newyrok': 10, 'teh': 1}
+        self.mock_speller = mock.MagicMock(spec=SpellChecker)
+        self.mock_speller.check.side_effect = lambda word: word in (
+                                                    'good', 'New', 'the')
+        self.mock_speller.suggest.side_effect = lambda word: {
+                                'teh': ['the'], 'Yrok': ['York']}[word]
+        self.ctrl = controller.Controller(flickr=self.mock_flickr,
+                                          speller=self.mock_speller)
+
+    def test_each_word_checked_once(self):
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = 'i'
+            self.ctrl._get_tags_to_correct()
+        checked = [call[0][0] for call in
+                   self.mock_speller.check.call_args_list]
+        self.assertEqual(sorted(set(checked)), sorted(checked))
+        self.assertEqual(2, mockraw.call_count)
+
+    def test_most_used_first(self):
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = '0'
+            to_update = self.ctrl._get_tags_to_correct()
+        self.assertEqual([('New Yrok', 'New York'), ('teh', 'the')],
+                         to_update)
+
+    def test_apply_renames(self):
+        renamer = mock.Mock(spec=tagrename.TagRenamer)
+        renamer.pending.return_value = []
+        renamer.rename_all.return_value = [
+            tagrename.RenameResult('teh', 'the', '1', changed=True),
+            tagrename.RenameResult('teh', 'the', '2'),
+            tagrename.RenameResult('teh', 'the', '3', error=IOError('down'))]
+        out = StringIO.StringIO()
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller, stdout=out,
+                                     tag_renamer=renamer)
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.side_effect = ['i', '0']
+            ctrl.do_spellchecktags('apply')
+        self.assertEqual([('teh', 'the')],
+                         renamer.rename_all.call_args[0][0])
+        self.assertTrue('teh --> the: 1 photos' in out.getvalue())
+        self.assertTrue('Retagged 1 photos, 1 already done, 1 failed' in
+                        out.getvalue())
+
+    def test_no_apply_no_renames(self):
+        renamer = mock.Mock(spec=tagrename.TagRenamer)
+        renamer.pending.return_value = []
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller,
+                                     tag_renamer=renamer)
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = '0'
+            ctrl.do_spellchecktags('')
+        self.assertFalse(renamer.rename_all.called)
+
+    def test_unfinished_renames_resumed(self):
+        renamer = mock.Mock(spec=tagrename.TagRenamer)
+        renamer.pending.return_value = [('teh', 'the')]
+        renamer.rename_all.return_value = []
+        out = StringIO.StringIO()
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller, stdout=out,
+                                     tag_renamer=renamer)
+        self.assertTrue('1 unfinished tag renames' in out.getvalue())
+        ctrl.do_renametags('')
+        self.assertEqual([('teh', 'the')],
+                         renamer.rename_all.call_args[0][0])
+
+
+class TestSuggestionCacheController(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.mock_speller = mock.MagicMock(spec=SpellChecker)
+        self.error = mock.Mock(word='recieve')
+        self.error.suggest.return_value = ['receive']
+        self.ctrl = controller.Controller(flickr=self.mock_flickr,
+                        speller=self.mock_speller,
+                        suggestions=suggest.SuggestionCache('en_US'))
+
+    def test_repeat_error_cached(self):
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = 'i'
+            self.ctrl._read_spellchecker_command(self.error, 'recieve')
+            self.ctrl._read_spellchecker_command(self.error, 'recieve')
+        self.assertEqual(1, self.error.suggest.call_count)
+
+    def test_add_refreshes(self):
+        with mock.patch.object(self.ctrl.suggestions, 'refresh') as refresh:
+            with mock.patch('__builtin__.raw_input') as mockraw:
+                mockraw.return_value = 'a'
+                self.ctrl._read_spellchecker_command(self.error, 'recieve')
+        self.assertTrue(refresh.called)
+
+
+class TestPrefetchController(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.mock_flickr.login.return_value = True
+        self.mock_speller = mock.MagicMock(spec=SpellChecker)
+        self.mock_speller.suggest.return_value = ['the']
+        self.prefetcher = mock.Mock(spec=suggest.SuggestionPrefetcher)
+        self.prefetcher.suggest.return_value = ['the']
+
+    def test_suggestions_from_prefetcher(self):
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller,
+                                     prefetcher=self.prefetcher)
+        error = mock.Mock(word='teh')
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = '0'
+            ctrl._read_spellchecker_command(error, 'teh')
+        error.replace.assert_called_once_with('the')
+        self.assertEqual('teh', self.prefetcher.suggest.call_args[0][0])
+
+    def test_words_ahead_prefetched(self):
+        photos = [flickr.SimplePhoto('teh', None, '1'),
+                  flickr.SimplePhoto('recieve', None, '2')]
+        self.mock_flickr.photos_iter.return_value = iter(photos)
+        texts = []
+        self.mock_speller.set_text.side_effect = texts.append
+        self.mock_speller.__iter__.side_effect = lambda: iter(
+                                    [mock.Mock(word=texts[-1], wordpos=0)])
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller,
+                                     prefetcher=self.prefetcher)
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = 'i'
+            ctrl.do_spellcheckwords('')
+        prefetched = self.prefetcher.prefetch.call_args_list[0][0][0]
+        self.assertEqual(['teh', 'recieve'], list(prefetched))
+
+    def test_checker_prefetches(self):
+        checker = mock.MagicMock(spec=SpellChecker)
+        checker.__iter__.side_effect = lambda: iter(
+                                    [mock.Mock(word='teh', wordpos=0)])
+        rule_store = rules.RuleStore()
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller,
+                                     checker=checker,
+                                     prefetcher=self.prefetcher,
+                                     rule_store=rule_store)
+        self.assertTrue(ctrl._has_errors(flickr.SimplePhoto('teh', None,
+                                                            '1')))
+        self.assertEqual(['teh'],
+                         list(self.prefetcher.prefetch.call_args[0][0]))
+        rule_store.set('teh', 'the')
+        ctrl._has_errors(flickr.SimplePhoto('teh', None, '1'))
+        self.assertEqual([],
+                         list(self.prefetcher.prefetch.call_args[0][0]))
+
+    def test_add_clears(self):
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller,
+                                     prefetcher=self.prefetcher)
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = 'a'
+            ctrl._read_spellchecker_command(mock.Mock(word='teh'), 'teh')
+        self.assertTrue(self.prefetcher.clear.called)
+
+
+class TestStatsController(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.mock_speller = mock.MagicMock(spec=SpellChecker)
+        self.metrics = metrics.Metrics()
+        self.stdout = StringIO.StringIO()
+        self.ctrl = controller.Controller(flickr=self.mock_flickr,
+                                          speller=self.mock_speller,
+                                          stdout=self.stdout,
+                                          metrics=self.metrics)
+
+    def test_commands_timed(self):
+        self.ctrl.onecmd('showchanges')
+        self.ctrl.onecmd('showchanges')
+        hists = self.metrics.snapshot()['histograms']
+        self.assertEqual(2, hists['command.showchanges']['count'])
+
+    def test_stats(self):
+        self.metrics.incr('api.calls', 7)
+        self.ctrl.onecmd('stats')
+        self.assertTrue('api.calls' in self.stdout.getvalue())
+
+    def test_quota(self):
+        scheduler = quota.QuotaScheduler(hourly=3600, burst=10)
+        for _ in xrange(3):
+            scheduler.acquire()
+        self.mock_flickr.quota.return_value = scheduler.snapshot()
+        self.ctrl.onecmd('quota')
+        self.assertTrue('3 of 3600 calls used in the last hour, 3597 left'
+                        in self.stdout.getvalue())
+        self.assertTrue('Writes: 0 waiting' in self.stdout.getvalue())
+
+    def test_errors_per_photo(self):
+        records = [mock.Mock(photo_id=pid) for pid in ('1', '1', '2')]
+        list(self.ctrl._count_errors(iter(records)))
+        snap = self.metrics.snapshot()
+        self.assertEqual(3, snap['counters']['check.errors'])
+        hist = snap['histograms']['check.errors_per_photo']
+        self.assertEqual(2, hist['count'])
+        self.assertEqual(2, hist['max'])
+
+    def test_profile_dir(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.ctrl.profile_dir = tmpdir
+        self.ctrl.onecmd('showchanges')
+        dumps = os.listdir(tmpdir)
+        self.assertEqual(1, len(dumps))
+        self.assertTrue(dumps[0].startswith('showchanges-'))
+
 
 class TestBasicSpelling(unittest.TestCase):
 
     def setUp(self):
         self.mock_flickr = mock.Mock(spec=flickr.Flickr)
         self.mock_flickr.login.return_value = True
+        self.mock_flickr.tag_counts.return_value = {}
         self.mock_speller = mock.MagicMock(spec=SpellChecker)
         self.real_speller = SpellChecker(lang=enchant.DictWithPWL("en_US"))
         self.photo = mock.Mock(spec=flickr.SimplePhoto, title='Speling eror',
@@ -211,6 +589,306 @@ class TestBasicSaving(unittest.TestCase):
         self.ctrl.do_savechanges('')
         self.assertEqual(len(self.ctrl.photos), 0)
 
+    def testKeepFailed(self):
+        good = flickr.SimplePhoto('title', 'desc', '1', original_title='')
+        bad = flickr.SimplePhoto('title', 'desc', '2', original_title='')
+
+        def save_meta(photo):
+            if photo is bad:
+                raise flickr.flickrapi.FlickrError('denied')
+        self.mock_flickr.save_meta.side_effect = save_meta
+        self.ctrl.photos = [good, bad]
+        self.ctrl.do_savechanges('')
+        self.assertEqual([bad], list(self.ctrl.photos))
+        self.assertFalse(good.dirty)
+        self.assertTrue(bad.dirty)
+
+    def testUnchangedNotSaved(self):
+        photo = flickr.SimplePhoto('title', 'desc', '1')
+        photo.title = 'titel'
+        photo.title = 'title'
+        self.ctrl.photos = [photo]
+        self.ctrl.do_savechanges('')
+        self.assertFalse(self.mock_flickr.save_meta.called)
+        self.assertEqual(0, len(self.ctrl.photos))
+
+    def testQueueKeyedByPhoto(self):
+        first = flickr.SimplePhoto('title', 'desc', '1', original_title='')
+        again = flickr.SimplePhoto('title', 'desc', '1', original_title='')
+        self.ctrl.photos.extend([first])
+        self.ctrl.photos.extend([again])
+        self.ctrl.do_savechanges('')
+        self.assertEqual(1, self.mock_flickr.save_meta.call_count)
+
+
+class TestJournalController(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.mock_speller = mock.NonCallableMagicMock()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.path = os.path.join(tmpdir, 'journal.jsonl')
+        self.journal = journal.Journal(self.path)
+        self.addCleanup(self.journal.close)
+
+    def controller(self):
+        return controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller,
+                                     stdout=StringIO.StringIO(),
+                                     journal=self.journal)
+
+    def test_pending_reloaded(self):
+        self.journal.append(flickr.SimplePhoto('title', 'desc', '1'))
+        ctrl = self.controller()
+        self.assertEqual(['1'], [photo.photo_id for photo in ctrl.photos])
+
+    def test_corrections_journaled(self):
+        ctrl = self.controller()
+        photo = flickr.SimplePhoto('title', 'desc', '1')
+        ctrl._journal_photos([photo])
+        self.assertEqual(['1'], [p.photo_id for p in self.journal.pending()])
+
+    def test_save_resumes(self):
+        good = flickr.SimplePhoto('title', 'desc', '1', original_title='')
+        bad = flickr.SimplePhoto('title', 'desc', '2', original_title='')
+        self.journal.append(good)
+        self.journal.append(bad)
+
+        def save_meta(photo):
+            if photo.photo_id == '2':
+                raise flickr.flickrapi.FlickrError('denied')
+        self.mock_flickr.save_meta.side_effect = save_meta
+        self.controller().do_savechanges('')
+        self.journal.close()
+        self.journal = journal.Journal(self.path)
+        ctrl = self.controller()
+        self.assertEqual(['2'], [photo.photo_id for photo in ctrl.photos])
+        with open(self.path, 'rb') as journal_file:
+            self.assertEqual(1, len(journal_file.readlines()))
+
+
+class TestWriteBehindController(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.mock_flickr.login.return_value = True
+        # Make the child mock before the saver thread and the test race to
+        self.mock_flickr.save_meta.return_value = None
+        self.photos = [flickr.SimplePhoto('teh %d' % idx, None, str(idx))
+                       for idx in xrange(5)]
+        self.mock_flickr.photos_iter.return_value = iter(self.photos)
+        self.mock_speller = mock.MagicMock(spec=SpellChecker)
+        texts = []
+        self.mock_speller.set_text.side_effect = texts.append
+        self.mock_speller.get_text.side_effect = \
+            lambda: texts[-1].replace('teh', 'the')
+        error = mock.Mock(word='teh', wordpos=0)
+        error.suggest.return_value = ['the']
+        self.mock_speller.__iter__.side_effect = lambda: iter([error])
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.journal = journal.Journal(os.path.join(tmpdir, 'journal.jsonl'))
+        self.addCleanup(self.journal.close)
+        self.out = StringIO.StringIO()
+        self.ctrl = controller.Controller(flickr=self.mock_flickr,
+                                          speller=self.mock_speller,
+                                          stdout=self.out,
+                                          journal=self.journal,
+                                          save_every=2)
+        self.addCleanup(self.ctrl.write_behind.close)
+
+    def test_saved_during_review(self):
+        saved_during_review = []
+
+        def answer(_prompt):
+            if mockraw.call_count == 5:
+                # The first two photos are saved while the last is asked
+                # about, give the background thread time to get to them
+                deadline = time.time() + 5
+                while self.mock_flickr.save_meta.call_count < 2 and \
+                        time.time() < deadline:
+                    time.sleep(0.01)
+                saved_during_review.append(
+                                    self.mock_flickr.save_meta.call_count)
+            return '0'
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.side_effect = answer
+            self.ctrl.do_spellcheck('')
+        self.assertEqual(5, self.mock_flickr.save_meta.call_count)
+        self.assertTrue(saved_during_review[0] >= 2)
+        self.assertEqual([], list(self.ctrl.photos))
+        self.assertEqual([], self.journal.pending())
+        self.assertFalse(self.photos[0].dirty)
+        self.assertTrue('Saved 5 photos, 0 failed' in self.out.getvalue())
+
+    def test_nothing_to_save(self):
+        self.mock_speller.__iter__.side_effect = lambda: iter([])
+        self.ctrl.do_spellcheck('')
+        self.assertFalse(self.mock_flickr.save_meta.called)
+        self.assertFalse('Saved' in self.out.getvalue())
+
+    def test_failures_queued(self):
+        def save_meta(photo):
+            if photo.photo_id == '3':
+                raise flickr.flickrapi.FlickrError('denied')
+        self.mock_flickr.save_meta.side_effect = save_meta
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = '0'
+            self.ctrl.do_spellcheck('')
+        self.assertEqual(['3'], [photo.photo_id for photo in self.ctrl.photos])
+        self.assertEqual(['3'], [photo.photo_id
+                                 for photo in self.journal.pending()])
+
+
+class TestRulesController(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.mock_flickr.login.return_value = True
+        self.mock_speller = mock.MagicMock(spec=SpellChecker)
+        self.mock_speller.suggest.return_value = ['receive', 'relieve']
+        self.photos = [flickr.SimplePhoto('recieve it', None, str(idx))
+                       for idx in xrange(3)]
+        self.mock_flickr.photos_iter.side_effect = lambda **kw: iter(
+                                                                self.photos)
+        self.error = mock.Mock(word='recieve', wordpos=0)
+        self.mock_speller.__iter__.side_effect = lambda: iter([self.error])
+        self.rule_store = rules.RuleStore()
+        self.out = StringIO.StringIO()
+        self.ctrl = controller.Controller(flickr=self.mock_flickr,
+                                          speller=self.mock_speller,
+                                          stdout=self.out,
+                                          rule_store=self.rule_store)
+
+    def test_always_replace_remembered(self):
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = 'R1'
+            self.ctrl.do_spellcheckwords('')
+        self.assertEqual('relieve', self.rule_store.get('recieve').replacement)
+        for photo in self.photos:
+            photo.title = 'recieve it'
+        ctrl = controller.Controller(flickr=self.mock_flickr,
+                                     speller=self.mock_speller,
+                                     stdout=self.out,
+                                     rule_store=self.rule_store)
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            ctrl.do_spellcheckwords('')
+        self.assertFalse(mockraw.called)
+        self.assertEqual(['relieve it'] * 3,
+                         [photo.title for photo in self.photos])
+        self.assertEqual(1, self.rule_store.get('recieve').uses)
+
+    def test_rule_applied_before_prompt(self):
+        self.rule_store.set('recieve', 'receive')
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            self.ctrl.do_spellcheck('')
+        self.assertFalse(mockraw.called)
+        self.assertFalse(self.mock_speller.suggest.called)
+        self.assertEqual(3, self.error.replace.call_count)
+        self.assertEqual(3, len(self.ctrl.photos))
+
+    def test_always_ignore_remembered(self):
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            mockraw.return_value = 'I'
+            self.ctrl.do_spellcheckwords('')
+        self.assertTrue(self.rule_store.ignored('recieve'))
+        self.ctrl.do_scan('')
+        self.assertTrue('0 errors in 0 photos' in self.out.getvalue())
+
+    def test_ignored_photos_not_prompted(self):
+        self.rule_store.set('recieve')
+        checker = mock.MagicMock(spec=SpellChecker)
+        checker.__iter__.side_effect = lambda: iter([self.error])
+        self.ctrl.checker = checker
+        with mock.patch('__builtin__.raw_input') as mockraw:
+            self.ctrl.do_spellcheck('')
+        self.assertFalse(mockraw.called)
+        self.assertFalse(self.mock_speller.set_text.called)
+
+    def test_rule_commands(self):
+        self.ctrl.onecmd('editrule teh the')
+        self.ctrl.onecmd('editrule flickr')
+        self.ctrl.onecmd('rules')
+        self.assertTrue('(ignore)' in self.out.getvalue())
+        self.assertTrue('-> the' in self.out.getvalue())
+        self.ctrl.onecmd('removerule teh')
+        self.assertEqual(None, self.rule_store.get('teh'))
+        self.ctrl.onecmd('expirerules 0')
+        self.assertEqual(0, len(self.rule_store))
+
+
+class TestScopeController(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.mock_flickr.login.return_value = True
+        self.mock_speller = mock.MagicMock(spec=SpellChecker)
+        self.mock_speller.__iter__.side_effect = lambda: iter([])
+        self.photos = [flickr.SimplePhoto('one', None, '1',
+                                          '2012-01-01 10:00:00'),
+                       flickr.SimplePhoto('two', None, '2',
+                                          '2012-03-01 10:00:00')]
+        self.mock_flickr.scoped_photos_iter.side_effect = \
+            lambda **kwargs: iter(self.photos)
+        self.store = store.PhotoStore(':memory:')
+        self.addCleanup(self.store.close)
+        self.out = StringIO.StringIO()
+        self.ctrl = controller.Controller(flickr=self.mock_flickr,
+                                          speller=self.mock_speller,
+                                          stdout=self.out,
+                                          photo_store=self.store,
+                                          album_workers=3)
+
+    def test_albums_and_tags(self):
+        self.ctrl.do_spellcheck('album:1 tag:"New York" 02/01/2012')
+        self.mock_flickr.scoped_photos_iter.assert_called_once_with(
+                        photoset_ids=['1'], tags=[u'newyork'], per_page=None,
+                        workers=3)
+        self.assertFalse(self.mock_flickr.photos_iter.called)
+        self.assertFalse(self.mock_flickr.all_photos_iter.called)
+        # Only the photo taken after the date is checked
+        self.mock_speller.set_text.assert_called_once_with('two')
+
+    def test_collections_resolved(self):
+        self.mock_flickr.collection_photosets.return_value = ['2', '1']
+        self.ctrl.do_scan('album:1 collection:72157')
+        self.mock_flickr.collection_photosets.assert_called_once_with(
+                                                                ['72157'])
+        self.assertEqual(['1', '2'], self.mock_flickr.scoped_photos_iter
+                         .call_args[1]['photoset_ids'])
+
+    def test_unknown_collection(self):
+        self.mock_flickr.collection_photosets.side_effect = \
+            ValueError('No collection 9')
+        self.ctrl.do_spellcheck('collection:9')
+        self.assertTrue('No collection 9' in self.out.getvalue())
+        self.assertFalse(self.mock_flickr.scoped_photos_iter.called)
+
+    def test_bad_selector(self):
+        self.ctrl.do_spellcheck('set:1')
+        self.assertTrue('aborted' in self.out.getvalue())
+        self.assertFalse(self.mock_flickr.login.called)
+
+    def test_verified_skipped(self):
+        self.store.update(self.photos)
+        self.store.mark_verified(self.photos[0])
+        self.ctrl.do_spellcheck('album:1')
+        self.mock_speller.set_text.assert_called_once_with('two')
+        self.assertEqual(None, self.store.last_sync)
+
+    def test_all(self):
+        self.mock_flickr.all_photos_iter.return_value = iter(self.photos)
+        self.ctrl.do_spellcheck('all')
+        self.assertEqual(2, self.mock_speller.set_text.call_count)
+        self.assertFalse(self.mock_flickr.scoped_photos_iter.called)
+
+    def test_albums_listed(self):
+        self.mock_flickr.photoset_list.return_value = [
+                                        flickr.Photoset('721', 'Trip', 12)]
+        self.ctrl.onecmd('albums')
+        self.assertTrue('721     12 Trip' in self.out.getvalue())
+
 
 if __name__ == "__main__":
     unittest.main()
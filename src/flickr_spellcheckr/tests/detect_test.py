@@ -0,0 +1,77 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.detect
+'''
+
+from flickr_spellcheckr.utils import detect
+from flickr_spellcheckr.utils.flickr import SimplePhoto
+import collections
+import re
+import threading
+import unittest
+
+FakeError = collections.namedtuple('FakeError', 'word wordpos')
+
+
+class FakeChecker(object):
+    '''Knows every word except the ones starting with "x"'''
+
+    def __init__(self, lang, pwl=None):
+        self.text = ''
+
+    def set_text(self, text):
+        self.text = text
+
+    def __iter__(self):
+        for match in re.finditer(r'x\w*', self.text):
+            yield FakeError(match.group(), match.start())
+
+
+def broken_checker(lang, pwl=None):
+    raise ValueError('Dictionary for %s not found' % lang)
+
+
+class TestDetect(unittest.TestCase):
+
+    def setUp(self):
+        self.photos = [SimplePhoto('ok xone', None, '1'),
+                       SimplePhoto('fine', 'all fine', '2'),
+                       SimplePhoto('xtwo', 'and xthree', '3')]
+        self.expected = [('1', 'title', 3, 'xone'),
+                         ('3', 'title', 0, 'xtwo'),
+                         ('3', 'description', 4, 'xthree')]
+
+    def test_in_process(self):
+        records = list(detect.errors_iter(FakeChecker('en_US'),
+                                          iter(self.photos)))
+        self.assertEqual(self.expected, records)
+
+    def test_process_pool(self):
+        photos = self.photos * 50
+        detector = detect.Detector('en_US', processes=2, chunk_size=7,
+                                   factory=FakeChecker)
+        records = list(detector.errors_iter(iter(photos)))
+        self.assertEqual(self.expected * 50, records)
+        self.assertEqual('photo_id', records[0]._fields[0])
+
+    def test_factory_failure_raised(self):
+        detector = detect.Detector('xx_XX', processes=2,
+                                   factory=broken_checker)
+        raised = []
+
+        def run():
+            try:
+                list(detector.errors_iter(iter(self.photos)))
+            except ValueError, e:
+                raised.append(e)
+        thread = threading.Thread(target=run)
+        thread.daemon = True  # Don't hold up the tests if it hangs
+        thread.start()
+        thread.join(30)
+        self.assertFalse(thread.is_alive(), 'errors_iter hung')
+        self.assertEqual(['Dictionary for xx_XX not found'],
+                         [str(e) for e in raised])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,19 @@
+# -*- coding: UTF-8 -*-
+
+'''Test doubles shared by the unit tests
+'''
+
+
+class FakeClock(object):
+    '''Clock that only moves when something sleeps on it, pass it as
+    ``clock`` and its :meth:`sleep` as ``sleep``
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
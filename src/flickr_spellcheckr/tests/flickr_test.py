@@ -0,0 +1,691 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.flickr
+'''
+
+from flickr_spellcheckr.tests.fakes import FakeClock
+from flickr_spellcheckr.utils import flickr, httppool, metrics, quota
+from xml.etree import ElementTree
+import datetime
+import mock
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+
+def search_response(page, pages, per_page=2):
+    '''Build a fake photos_search response for the given page'''
+
+    resp = ElementTree.Element('rsp', stat='ok')
+    photos = ElementTree.SubElement(resp, 'photos', page=str(page),
+                                    pages=str(pages),
+                                    total=str(pages * per_page))
+    for idx in xrange(per_page):
+        photo_id = str((page - 1) * per_page + idx)
+        photo = ElementTree.SubElement(photos, 'photo', id=photo_id,
+                                       title='title %s' % photo_id)
+        desc = ElementTree.SubElement(photo, 'description')
+        desc.text = 'description %s' % photo_id
+    return resp
+
+
+class TestSimplePhoto(unittest.TestCase):
+
+    def test_slotted(self):
+        photo = flickr.SimplePhoto('title', 'desc', '1')
+        self.assertFalse(hasattr(photo, '__dict__'))
+
+    def test_dirty(self):
+        photo = flickr.SimplePhoto('title', None, '1')
+        self.assertFalse(photo.dirty)
+        photo.description = 'desc'
+        self.assertTrue(photo.dirty)
+        photo.description = None
+        self.assertFalse(photo.dirty)
+
+    def test_mark_saved(self):
+        photo = flickr.SimplePhoto('title', 'desc', '1')
+        photo.title = 'new'
+        photo.mark_saved()
+        self.assertFalse(photo.dirty)
+        self.assertEqual('new', photo.original_title)
+
+    def test_pickle(self):
+        photo = flickr.SimplePhoto('title', 'desc', '1')
+        photo.title = 'new'
+        copy = pickle.loads(pickle.dumps(photo))
+        self.assertEqual('new', copy.title)
+        self.assertEqual('title', copy.original_title)
+
+    def test_str(self):
+        photo = flickr.SimplePhoto('title', 'desc', '1')
+        self.assertEqual('Title: title\nDescription: desc', str(photo))
+
+
+class TestPhotoQueue(unittest.TestCase):
+
+    def test_one_per_photo(self):
+        first = flickr.SimplePhoto('first', None, '1')
+        other = flickr.SimplePhoto('other', None, '2')
+        again = flickr.SimplePhoto('again', None, '1')
+        queue = flickr.PhotoQueue([first, other])
+        queue.add(again)
+        self.assertEqual([other, again], list(queue))
+        self.assertEqual(2, len(queue))
+        self.assertTrue('1' in queue)
+        self.assertTrue(queue.get('1') is again)
+
+
+class TestLogin(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('flickrapi.FlickrAPI')
+        self.mock_api = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.mock_api.token_cache.get_cached_token_path.return_value = \
+            self.tmpdir
+        self.mock_api.token_cache.token = 'token'
+        self.mock_api.get_token_part_one.return_value = ('token', None)
+        self.mock_api.get_token_part_two.return_value = 'token'
+
+    def test_no_api_until_used(self):
+        flickr.Flickr()
+        self.assertFalse(flickr.flickrapi.FlickrAPI.called)
+
+    def test_checked_token_reused(self):
+        self.assertTrue(flickr.Flickr().login())
+        self.assertTrue(flickr.Flickr().login())
+        self.assertEqual(1, self.mock_api.get_token_part_one.call_count)
+
+    def test_old_check_not_trusted(self):
+        self.assertTrue(flickr.Flickr().login())
+        self.assertTrue(flickr.Flickr(token_check_interval=0).login())
+        self.assertEqual(2, self.mock_api.get_token_part_one.call_count)
+
+    def test_other_token_checked(self):
+        self.assertTrue(flickr.Flickr().login())
+        self.mock_api.token_cache.token = 'new token'
+        self.assertTrue(flickr.Flickr().login())
+        self.assertEqual(2, self.mock_api.get_token_part_one.call_count)
+
+    def test_new_token_needs_authorising(self):
+        self.mock_api.token_cache.token = None
+        self.mock_api.get_token_part_one.return_value = (None, 'frob')
+        finish_login = flickr.Flickr().login()
+        self.assertTrue(callable(finish_login))
+        self.assertFalse(os.listdir(self.tmpdir))
+        self.mock_api.token_cache.token = 'token'
+        self.assertTrue(finish_login())
+        self.assertTrue(flickr.Flickr().login())
+        self.assertEqual(1, self.mock_api.get_token_part_one.call_count)
+
+    def test_unattended_without_token(self):
+        self.mock_api.token_cache.token = None
+        self.assertFalse(flickr.Flickr().login(interactive=False))
+        self.assertFalse(self.mock_api.get_token_part_one.called)
+
+    def test_unattended_rejected_token(self):
+        self.mock_api.get_token_part_one.return_value = (None, 'frob')
+        self.assertFalse(flickr.Flickr().login(interactive=False))
+        self.mock_api.get_token_part_one.assert_called_once_with(
+                                            perms='write', auth_callback=False)
+        self.assertFalse(self.mock_api.get_token_part_two.called)
+
+    def test_paced(self):
+        scheduler = mock.Mock(spec=quota.QuotaScheduler, retries=3)
+        scheduler.acquire.return_value = 0
+        self.mock_api.get_token_part_one.side_effect = [
+            httppool.HTTPStatusError(429, 'Too Many Requests'),
+            ('token', None)]
+        self.assertTrue(flickr.Flickr(scheduler=scheduler).login())
+        # Twice for the throttled token check, then getting the token
+        self.assertEqual([mock.call(quota.READ)] * 3,
+                         scheduler.acquire.call_args_list)
+        self.assertTrue(scheduler.throttled.called)
+
+    def test_rejected_token_forgotten(self):
+        self.assertTrue(flickr.Flickr().login())
+        client = flickr.Flickr()
+        self.assertTrue(client.login())
+        self.mock_api.photos_setMeta.return_value = (
+            '<rsp stat="fail"><err code="98" msg="Invalid auth token" />'
+            '</rsp>')
+        self.assertRaises(flickr.flickrapi.FlickrError, client.save_meta,
+                          flickr.SimplePhoto('title', None, '1'))
+        self.assertFalse(client.logged_in)
+        self.assertTrue(client.login())
+        self.assertEqual(2, self.mock_api.get_token_part_one.call_count)
+
+
+class TestPhotosIter(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('flickrapi.FlickrAPI')
+        self.mock_api = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.metrics = metrics.Metrics()
+        self.flickr = flickr.Flickr(metrics=self.metrics)
+        self.flickr.logged_in = True
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def fake_search(self, pages):
+        def photos_search(page=1, **kwargs):
+            with self.lock:
+                self.calls.append((page, kwargs))
+            return ElementTree.tostring(search_response(page, pages))
+        self.mock_api.photos_search.side_effect = photos_search
+
+    def test_single_page(self):
+        self.fake_search(pages=1)
+        photos = list(self.flickr.photos_iter(workers=4))
+        self.assertEqual(['0', '1'], [p.photo_id for p in photos])
+        # Asking for the total, then the page
+        self.assertEqual([1, flickr.MAX_PER_PAGE],
+                         [c[1]['per_page'] for c in self.calls])
+
+    def test_serial_order(self):
+        self.fake_search(pages=3)
+        photos = list(self.flickr.photos_iter())
+        self.assertEqual([str(i) for i in xrange(6)],
+                         [p.photo_id for p in photos])
+
+    def test_prefetch_order(self):
+        self.fake_search(pages=20)
+        photos = list(self.flickr.photos_iter(workers=4, max_pages=3))
+        self.assertEqual([str(i) for i in xrange(40)],
+                         [p.photo_id for p in photos])
+        self.assertEqual(range(1, 21), sorted(c[0] for c in self.calls[1:]))
+
+    def test_prefetch_bounded(self):
+        self.fake_search(pages=20)
+        photos = self.flickr.photos_iter(workers=4, max_pages=3)
+        photos.next()
+        photos.next()
+        photos.next()  # First photo off page 2, pages 3 & 4 may be pending
+        self.assertTrue(len(self.calls[1:]) <= 4, 'Fetched too many pages')
+        photos.close()
+
+    def test_per_page_capped(self):
+        self.fake_search(pages=1)
+        list(self.flickr.photos_iter(per_page=10000))
+        self.assertEqual(flickr.MAX_PER_PAGE, self.calls[1][1]['per_page'])
+
+    def test_prefetch_error_raised(self):
+        def photos_search(page=1, **kwargs):
+            if page == 3:
+                raise flickr.flickrapi.FlickrError('boom')
+            return ElementTree.tostring(search_response(page, 4))
+        self.mock_api.photos_search.side_effect = photos_search
+        photos = self.flickr.photos_iter(workers=2)
+        self.assertRaises(flickr.flickrapi.FlickrError, list, photos)
+
+    def test_error_response(self):
+        self.mock_api.photos_search.return_value = (
+            '<rsp stat="fail"><err code="99" msg="Insufficient permissions"'
+            ' /></rsp>')
+        try:
+            list(self.flickr.photos_iter())
+        except flickr.flickrapi.FlickrError, e:
+            self.assertEqual(u'Error: 99: Insufficient permissions',
+                             unicode(e))
+        else:
+            self.fail('FlickrError not raised')
+
+    def test_metrics(self):
+        self.fake_search(pages=3)
+        list(self.flickr.photos_iter())
+        snap = self.metrics.snapshot()
+        self.assertEqual(4, snap['counters']['api.calls'])
+        self.assertEqual(3, snap['counters']['photos.pages'])
+        self.assertEqual(6, snap['counters']['photos.fetched'])
+        self.assertTrue(snap['counters']['api.bytes'] > 0)
+        self.assertEqual(4, snap['histograms']['api.photos_search']['count'])
+        self.assertEqual(3,
+                         snap['histograms']['parse.photos_search']['count'])
+
+    def test_format_rest(self):
+        self.fake_search(pages=1)
+        list(self.flickr.photos_iter())
+        self.assertEqual('rest', self.calls[0][1]['format'])
+
+
+class TestAdaptivePages(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('flickrapi.FlickrAPI')
+        self.mock_api = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.flickr = flickr.Flickr(metrics=metrics.Metrics())
+        self.flickr.logged_in = True
+        self.calls = []
+
+    def fake_search(self, total):
+        def photos_search(page=1, per_page=100, **kwargs):
+            self.calls.append((page, per_page))
+            resp = ElementTree.Element('rsp', stat='ok')
+            photos = ElementTree.SubElement(resp, 'photos', page=str(page),
+                                pages=str(max(-(-total // per_page), 1)),
+                                total=str(total))
+            for idx in xrange((page - 1) * per_page,
+                              min(page * per_page, total)):
+                photo = ElementTree.SubElement(photos, 'photo', id=str(idx),
+                                               title='title')
+                ElementTree.SubElement(photo, 'description')
+            return ElementTree.tostring(resp)
+        self.mock_api.photos_search.side_effect = photos_search
+
+    def test_max_page_size_first(self):
+        self.fake_search(total=10)
+        list(self.flickr.photos_iter())
+        self.assertEqual([(1, 1), (1, flickr.MAX_PER_PAGE)], self.calls)
+
+    def test_resized_mid_walk(self):
+        self.fake_search(total=1000)
+        sizes = [100, 150, 50]
+
+        class Sizer(object):
+            size = 100
+
+            def record(self, photos, seconds, nbytes):
+                self.size = sizes.pop(0) if sizes else self.size
+        self.flickr.page_sizer = Sizer()
+        photos = list(self.flickr.photos_iter())
+        self.assertEqual([str(idx) for idx in xrange(1000)],
+                         [photo.photo_id for photo in photos])
+        self.assertEqual((1, 100), self.calls[1])
+        self.assertEqual((2, 150), self.calls[3])  # Photos 150-299
+        self.assertEqual((7, 50), self.calls[4])  # Photos 300-349
+
+    def test_fixed_size_not_resized(self):
+        self.fake_search(total=300)
+        self.flickr.page_sizer.size = 50
+        list(self.flickr.photos_iter(per_page=100))
+        self.assertEqual([(1, 100), (2, 100), (3, 100)], self.calls[1:])
+
+
+class TestDateWindows(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('flickrapi.FlickrAPI')
+        self.mock_api = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.flickr = flickr.Flickr(metrics=metrics.Metrics())
+        self.flickr.logged_in = True
+        self.date_from = datetime.datetime(2010, 1, 1)
+        self.start = int(time.mktime(self.date_from.timetuple()))
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def fake_search(self, photos, use_dates=True):
+        '''Photos taken a minute apart, capped like flickr'''
+
+        def photos_search(page=1, per_page=100, **kwargs):
+            with self.lock:
+                self.calls += 1
+            first, last = 0, photos
+            if use_dates and 'max_taken_date' in kwargs:
+                last = min(int(kwargs['max_taken_date'] - self.start) // 60
+                           + 1, last)
+            if use_dates and 'min_taken_date' in kwargs:
+                first = max(-(-int(kwargs['min_taken_date'] - self.start)
+                              // 60), 0)
+            total = max(last - first, 0)
+            page = min(page, flickr.MAX_SEARCH_RESULTS // per_page)
+            resp = ElementTree.Element('rsp', stat='ok')
+            elem = ElementTree.SubElement(resp, 'photos', page=str(page),
+                                    pages=str(max(-(-total // per_page), 1)),
+                                    total=str(total))
+            start = first + (page - 1) * per_page
+            for idx in xrange(start, min(start + per_page, last)):
+                photo = ElementTree.SubElement(elem, 'photo', id=str(idx),
+                                               title='title')
+                ElementTree.SubElement(photo, 'description')
+            return ElementTree.tostring(resp)
+        self.mock_api.photos_search.side_effect = photos_search
+
+    def date_to(self, photos):
+        return self.date_from + datetime.timedelta(minutes=photos)
+
+    def test_small_search_not_split(self):
+        self.fake_search(100)
+        photos = list(self.flickr.photos_iter(self.date_from,
+                                              self.date_to(100)))
+        self.assertEqual(100, len(photos))
+        self.assertEqual(2, self.calls)  # The total, then one page
+
+    def test_big_search_complete(self):
+        self.fake_search(10000)
+        photos = list(self.flickr.photos_iter(self.date_from,
+                                              self.date_to(10000)))
+        self.assertEqual(sorted(xrange(10000)),
+                         sorted(int(photo.photo_id) for photo in photos))
+
+    def test_big_search_concurrent(self):
+        self.fake_search(10000)
+        photos = list(self.flickr.photos_iter(self.date_from,
+                                              self.date_to(10000),
+                                              workers=4))
+        self.assertEqual(sorted(xrange(10000)),
+                         sorted(int(photo.photo_id) for photo in photos))
+
+    def test_newest_window_first(self):
+        self.fake_search(10000)
+        photos = self.flickr.photos_iter(self.date_from, self.date_to(10000))
+        self.assertTrue(int(photos.next().photo_id) >= 5000)
+
+    def test_dates_ignored(self):
+        self.fake_search(10000, use_dates=False)
+        photos = list(self.flickr.photos_iter(self.date_from,
+                                              self.date_to(10000)))
+        self.assertEqual(flickr.MAX_SEARCH_RESULTS,
+                         len(set(photo.photo_id for photo in photos)))
+        self.assertTrue(self.calls < 30)  # Not split over and over
+
+
+class TestPageSizer(unittest.TestCase):
+
+    def test_fast_small_pages_stay_max(self):
+        sizer = flickr.PageSizer()
+        sizer.record(500, 0.5, 100000)
+        self.assertEqual(flickr.MAX_PER_PAGE, sizer.size)
+
+    def test_slow_pages_shrink(self):
+        sizer = flickr.PageSizer(target_seconds=5)
+        sizer.record(500, 20.0, 100000)
+        self.assertEqual(100, sizer.size)
+
+    def test_big_pages_shrink(self):
+        sizer = flickr.PageSizer(max_bytes=100000)
+        sizer.record(500, 0.5, 500000)
+        self.assertEqual(100, sizer.size)
+
+    def test_never_below_min(self):
+        sizer = flickr.PageSizer()
+        sizer.record(500, 1000.0, 100000)
+        self.assertEqual(flickr.MIN_PER_PAGE, sizer.size)
+
+    def test_small_changes_ignored(self):
+        sizer = flickr.PageSizer(size=200, target_seconds=5)
+        sizer.record(200, 3.0, 1000)
+        self.assertEqual(200, sizer.size)
+
+    def test_empty_page_ignored(self):
+        sizer = flickr.PageSizer()
+        sizer.record(0, 10.0, 100)
+        self.assertEqual(flickr.MAX_PER_PAGE, sizer.size)
+
+
+class TestStreamPhotos(unittest.TestCase):
+
+    def test_photos(self):
+        attrib, photos = flickr._stream_photos(ElementTree.tostring(
+                                                    search_response(1, 3)))
+        self.assertEqual('3', attrib['pages'])
+        self.assertEqual(['0', '1'], [photo.photo_id for photo in photos])
+
+    def test_error(self):
+        self.assertRaises(flickr.flickrapi.FlickrError,
+                          flickr._stream_photos,
+                          '<rsp stat="fail"><err code="1" msg="no" /></rsp>')
+
+
+class TestPooledFlickr(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('flickrapi.FlickrAPI')
+        self.mock_api = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.mock_api.api_key = 'key'
+        self.mock_api.token_cache.token = 'token'
+        self.mock_api.flickr_rest_form = '/services/rest/'
+        self.mock_api.encode_and_sign.side_effect = lambda args: args
+        self.pool = mock.Mock()
+        self.flickr = flickr.PooledFlickr(metrics=metrics.Metrics(),
+                                          pool=self.pool)
+        self.flickr.logged_in = True
+
+    def test_signed_call(self):
+        self.pool.request.return_value = '<rsp stat="ok" />'
+        self.flickr.save_meta(flickr.SimplePhoto('title', None, '1'))
+        args = self.mock_api.encode_and_sign.call_args[0][0]
+        self.assertEqual({'method': 'flickr.photos.setMeta',
+                          'api_key': 'key', 'auth_token': 'token',
+                          'format': 'rest', 'photo_id': '1',
+                          'title': 'title'}, args)
+        self.assertEqual('POST', self.pool.request.call_args[0][0])
+        self.assertEqual('/services/rest/',
+                         self.pool.request.call_args[0][1])
+        self.assertFalse(self.mock_api.photos_setMeta.called)
+
+    def test_photos_iter(self):
+        self.pool.request.side_effect = lambda *args: ElementTree.tostring(
+                                                    search_response(1, 1))
+        photos = list(self.flickr.photos_iter())
+        self.assertEqual(['0', '1'], [photo.photo_id for photo in photos])
+
+
+class TestQuota(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('flickrapi.FlickrAPI')
+        self.mock_api = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.mock_api.api_key = 'key'
+        self.mock_api.token_cache.token = 'token'
+        self.mock_api.encode_and_sign.side_effect = lambda args: args
+        self.pool = mock.Mock()
+        self.clock = FakeClock()
+        self.sleep = mock.Mock(side_effect=self.clock.sleep)
+        self.scheduler = quota.QuotaScheduler(hourly=None, retries=3,
+                                              clock=self.clock,
+                                              sleep=self.sleep)
+        self.flickr = flickr.PooledFlickr(metrics=metrics.Metrics(),
+                                          pool=self.pool,
+                                          scheduler=self.scheduler)
+        self.flickr.logged_in = True
+
+    def test_throttled_retried(self):
+        self.pool.request.side_effect = [
+            httppool.HTTPStatusError(429, 'Too Many Requests'),
+            '<rsp stat="ok" />']
+        self.flickr.save_meta(flickr.SimplePhoto('title', None, '1'))
+        self.assertEqual(2, self.pool.request.call_count)
+        self.assertEqual(1, self.sleep.call_count)
+        self.assertEqual(1, self.flickr.quota()['throttled'])
+        self.assertEqual(1, self.flickr.metrics.counters['api.throttled'])
+
+    def test_gives_up(self):
+        self.pool.request.side_effect = httppool.HTTPStatusError(
+                                                    503, 'Unavailable')
+        self.assertRaises(httppool.HTTPStatusError, self.flickr.save_meta,
+                          flickr.SimplePhoto('title', None, '1'))
+        self.assertEqual(3, self.pool.request.call_count)
+
+    def test_other_errors_not_retried(self):
+        self.pool.request.side_effect = httppool.HTTPStatusError(
+                                                    404, 'Not Found')
+        self.assertRaises(httppool.HTTPStatusError, self.flickr.save_meta,
+                          flickr.SimplePhoto('title', None, '1'))
+        self.assertEqual(1, self.pool.request.call_count)
+        self.assertEqual(0, self.flickr.quota()['throttled'])
+
+    def test_priority(self):
+        self.scheduler.acquire = mock.Mock(return_value=0)
+        self.pool.request.return_value = '<rsp stat="ok" />'
+        self.flickr.save_meta(flickr.SimplePhoto('title', None, '1'))
+        self.scheduler.acquire.assert_called_once_with(quota.WRITE)
+        self.pool.request.return_value = '<rsp stat="ok"><photo id="1">' \
+            '<tags /></photo></rsp>'
+        self.flickr.photo_tags('1')
+        self.scheduler.acquire.assert_called_with(quota.READ)
+
+
+class TestTags(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('flickrapi.FlickrAPI')
+        self.mock_api = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.flickr = flickr.Flickr()
+
+    def tags_response(self):
+        resp = ElementTree.Element('rsp', stat='ok')
+        who = ElementTree.SubElement(resp, 'who', id='me')
+        return resp, ElementTree.SubElement(who, 'tags')
+
+    def test_raw_tags(self):
+        resp, tags = self.tags_response()
+        tag = ElementTree.SubElement(tags, 'tag', clean='newyork')
+        ElementTree.SubElement(tag, 'raw').text = 'New York'
+        ElementTree.SubElement(tag, 'raw').text = 'newyork'
+        ElementTree.SubElement(tags, 'tag', clean='cat')
+        self.mock_api.tags_getListUserRaw.return_value = \
+            ElementTree.tostring(resp)
+        self.assertEqual(['New York', 'newyork', 'cat'],
+                         list(self.flickr.tag_list()))
+
+    def test_tag_counts(self):
+        resp, tags = self.tags_response()
+        ElementTree.SubElement(tags, 'tag', count='12').text = 'cat'
+        ElementTree.SubElement(tags, 'tag', count='3').text = 'dog'
+        self.mock_api.tags_getListUserPopular.return_value = \
+            ElementTree.tostring(resp)
+        self.assertEqual({'cat': 12, 'dog': 3}, self.flickr.tag_counts())
+
+    def test_photo_tags(self):
+        resp = ElementTree.Element('rsp', stat='ok')
+        photo = ElementTree.SubElement(resp, 'photo', id='1')
+        tags = ElementTree.SubElement(photo, 'tags')
+        ElementTree.SubElement(tags, 'tag', id='1-2-3',
+                               raw='New York').text = 'newyork'
+        self.mock_api.tags_getListPhoto.return_value = \
+            ElementTree.tostring(resp)
+        self.assertEqual([flickr.PhotoTag('1-2-3', 'New York', 'newyork')],
+                         self.flickr.photo_tags('1'))
+
+    def test_add_tags_quoted(self):
+        self.mock_api.photos_addTags.return_value = '<rsp stat="ok" />'
+        self.flickr.add_tags('1', [u'New York', u'cat'])
+        self.assertEqual(u'"New York" "cat"',
+                         self.mock_api.photos_addTags.call_args[1]['tags'])
+
+    def test_tagged_photos_iter(self):
+        self.flickr.logged_in = True
+        self.mock_api.photos_search.return_value = ElementTree.tostring(
+                                                    search_response(1, 1))
+        photos = list(self.flickr.tagged_photos_iter('newyork'))
+        self.assertEqual(['0', '1'], [photo.photo_id for photo in photos])
+        self.assertEqual('newyork',
+                         self.mock_api.photos_search.call_args[1]['tags'])
+
+
+class TestAlbums(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('flickrapi.FlickrAPI')
+        self.mock_api = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.metrics = metrics.Metrics()
+        self.flickr = flickr.Flickr(metrics=self.metrics)
+        self.flickr.logged_in = True
+        self.albums = {'a': ['1', '2', '3'], 'b': ['3', '4'], 'c': ['5']}
+        self.mock_api.photosets_getPhotos.side_effect = self.photoset
+        self.lock = threading.Lock()
+        self.running = 0
+        self.overlapped = threading.Event()
+        self.wait_for_overlap = False
+
+    def photoset(self, photoset_id, page=1, per_page=2, **kwargs):
+        with self.lock:
+            self.running += 1
+            if self.running > 1:
+                self.overlapped.set()
+        if self.wait_for_overlap:
+            self.overlapped.wait(5)
+        photo_ids = self.albums[photoset_id]
+        resp = ElementTree.Element('rsp', stat='ok')
+        pages = -(-len(photo_ids) // per_page)
+        photoset = ElementTree.SubElement(resp, 'photoset', id=photoset_id,
+                                          page=str(page), pages=str(pages),
+                                          total=str(len(photo_ids)))
+        for photo_id in photo_ids[(page - 1) * per_page:page * per_page]:
+            photo = ElementTree.SubElement(photoset, 'photo', id=photo_id,
+                                           title='title %s' % photo_id,
+                                           isprimary='0')
+            ElementTree.SubElement(photo, 'description').text = 'text'
+        with self.lock:
+            self.running -= 1
+        return ElementTree.tostring(resp)
+
+    def test_photoset_photos_iter(self):
+        photos = list(self.flickr.photoset_photos_iter('a', per_page=2))
+        self.assertEqual(['1', '2', '3'],
+                         [photo.photo_id for photo in photos])
+        self.assertEqual(2, self.mock_api.photosets_getPhotos.call_count)
+
+    def test_duplicates_dropped(self):
+        photos = list(self.flickr.scoped_photos_iter(['a', 'b', 'c'],
+                                                     per_page=2))
+        self.assertEqual(['1', '2', '3', '4', '5'],
+                         [photo.photo_id for photo in photos])
+        self.assertEqual(1, self.metrics.counters['photos.duplicates'])
+
+    def test_albums_concurrent(self):
+        self.wait_for_overlap = True
+        photos = list(self.flickr.scoped_photos_iter(['a', 'b', 'c'],
+                                                     per_page=1, workers=3))
+        self.assertEqual(['1', '2', '3', '4', '5'],
+                         [photo.photo_id for photo in photos])
+        self.assertTrue(self.overlapped.is_set())
+
+    def test_tags_searched_once(self):
+        self.mock_api.photos_search.return_value = ElementTree.tostring(
+                                                    search_response(1, 1))
+        photos = list(self.flickr.scoped_photos_iter(['c'],
+                                                     tags=['cat', 'dog']))
+        self.assertEqual(['5', '0', '1'],
+                         [photo.photo_id for photo in photos])
+        self.assertEqual('cat,dog',
+                         self.mock_api.photos_search.call_args[1]['tags'])
+
+    def test_collection_photosets(self):
+        resp = ElementTree.Element('rsp', stat='ok')
+        tree = ElementTree.SubElement(resp, 'collections')
+        outer = ElementTree.SubElement(tree, 'collection', id='12-72157')
+        ElementTree.SubElement(outer, 'set', id='a')
+        inner = ElementTree.SubElement(outer, 'collection', id='12-72158')
+        ElementTree.SubElement(inner, 'set', id='b')
+        ElementTree.SubElement(inner, 'set', id='a')
+        self.mock_api.collections_getTree.return_value = \
+            ElementTree.tostring(resp)
+        self.assertEqual(['a', 'b'],
+                         self.flickr.collection_photosets(['72157']))
+        self.assertEqual(['b', 'a'],
+                         self.flickr.collection_photosets(['12-72158']))
+        self.assertRaises(ValueError, self.flickr.collection_photosets,
+                          ['99'])
+
+    def test_photoset_list(self):
+        def photosets_getList(page=1, **kwargs):
+            resp = ElementTree.Element('rsp', stat='ok')
+            photosets = ElementTree.SubElement(resp, 'photosets',
+                                               page=str(page), pages='2')
+            photoset = ElementTree.SubElement(photosets, 'photoset',
+                                              id=str(page), photos='7')
+            ElementTree.SubElement(photoset, 'title').text = 'Trip'
+            return ElementTree.tostring(resp)
+        self.mock_api.photosets_getList.side_effect = photosets_getList
+        self.assertEqual([flickr.Photoset('1', 'Trip', 7),
+                          flickr.Photoset('2', 'Trip', 7)],
+                         self.flickr.photoset_list())
+
+
+if __name__ == "__main__":
+    unittest.main()
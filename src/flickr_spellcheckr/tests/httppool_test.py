@@ -0,0 +1,143 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.httppool
+'''
+
+from flickr_spellcheckr.utils import httppool
+from multiprocessing.pool import ThreadPool
+import httplib
+import threading
+import time
+import unittest
+
+
+class FakeResponse(object):
+    def __init__(self, status=200, body='ok', will_close=False):
+        self.status = status
+        self.reason = 'reason'
+        self.body = body
+        self.will_close = will_close
+
+    def read(self):
+        return self.body
+
+
+class FakeConnection(object):
+    def __init__(self, host, timeout=None):
+        self.host = host
+        self.requests = []
+        self.responses = []
+        self.closed = False
+
+    def request(self, method, path, body, headers):
+        self.requests.append((method, path, body))
+
+    def getresponse(self):
+        if self.responses:
+            response = self.responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return FakeResponse(body=self.requests[-1][2])
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.conns = []
+        self.lock = threading.Lock()
+
+    def factory(self, host, timeout=None):
+        conn = FakeConnection(host, timeout=timeout)
+        with self.lock:
+            self.conns.append(conn)
+        return conn
+
+    def pool(self, size=4):
+        return httppool.ConnectionPool('example.com', size=size,
+                                       connection_factory=self.factory)
+
+    def test_reused(self):
+        pool = self.pool()
+        self.assertEqual('one', pool.request('POST', '/', 'one'))
+        self.assertEqual('two', pool.request('POST', '/', 'two'))
+        self.assertEqual(1, len(self.conns))
+        self.assertEqual(2, len(self.conns[0].requests))
+
+    def test_stale_connection_retried(self):
+        pool = self.pool()
+        pool.request('POST', '/', 'one')
+        self.conns[0].responses.append(httplib.BadStatusLine(''))
+        self.assertEqual('two', pool.request('POST', '/', 'two'))
+        self.assertEqual(2, len(self.conns))
+        self.assertTrue(self.conns[0].closed)
+        self.assertEqual(1, len(pool))
+
+    def test_new_connection_error_raised(self):
+        pool = self.pool()
+        real_factory = self.factory
+
+        def failing(host, timeout=None):
+            conn = real_factory(host, timeout=timeout)
+            conn.responses.append(IOError('refused'))
+            return conn
+        pool._factory = failing
+        self.assertRaises(IOError, pool.request, 'POST', '/', 'one')
+        self.assertEqual(0, len(pool))
+
+    def test_status_error(self):
+        pool = self.pool()
+        pool.request('POST', '/', 'one')
+        self.conns[0].responses.append(FakeResponse(status=503))
+        try:
+            pool.request('POST', '/', 'two')
+        except httppool.HTTPStatusError, e:
+            self.assertEqual(503, e.status)
+        else:
+            self.fail('HTTPStatusError not raised')
+        self.assertEqual(1, len(self.conns))
+
+    def test_will_close_discarded(self):
+        pool = self.pool()
+        pool.request('POST', '/', 'one')
+        self.conns[0].responses.append(FakeResponse(will_close=True))
+        pool.request('POST', '/', 'two')
+        self.assertTrue(self.conns[0].closed)
+        self.assertEqual(0, len(pool))
+
+    def test_size_limit(self):
+        pool = self.pool(size=3)
+        in_flight = [0, 0]  # Now, most seen
+        real_send = pool._send
+
+        def slow_send(*args):
+            with self.lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            time.sleep(0.01)
+            with self.lock:
+                in_flight[0] -= 1
+            return real_send(*args)
+        pool._send = slow_send
+        threads = ThreadPool(8)
+        try:
+            threads.map(lambda idx: pool.request('POST', '/', str(idx)),
+                        range(40))
+        finally:
+            threads.terminate()
+        self.assertTrue(in_flight[1] <= 3)
+        self.assertTrue(len(self.conns) <= 3)
+
+    def test_close(self):
+        pool = self.pool()
+        pool.request('POST', '/', 'one')
+        pool.close()
+        self.assertTrue(self.conns[0].closed)
+        self.assertEqual(0, len(pool))
+
+
+if __name__ == "__main__":
+    unittest.main()
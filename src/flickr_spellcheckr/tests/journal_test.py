@@ -0,0 +1,139 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.journal
+'''
+
+from flickr_spellcheckr.utils import journal
+from flickr_spellcheckr.utils.flickr import SimplePhoto
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'journal.jsonl')
+
+    def open_journal(self, **kwargs):
+        journal_obj = journal.Journal(self.path, **kwargs)
+        self.addCleanup(journal_obj.close)
+        return journal_obj
+
+    def lines(self):
+        with open(self.path, 'rb') as journal_file:
+            return journal_file.readlines()
+
+    def test_empty(self):
+        self.assertEqual([], self.open_journal().pending())
+
+    def test_reload_pending(self):
+        first = self.open_journal()
+        first.append(SimplePhoto(u'tïtle', u'desc', '1', '2012-01-14', 10))
+        first.append(SimplePhoto(u'other', None, '2'))
+        first.close()
+        photos = self.open_journal().pending()
+        self.assertEqual(['1', '2'], [photo.photo_id for photo in photos])
+        self.assertEqual(u'tïtle', photos[0].title)
+        self.assertEqual('2012-01-14', photos[0].date_taken)
+        self.assertEqual(10, photos[0].last_update)
+        self.assertEqual(None, photos[1].description)
+
+    def test_original_text_kept(self):
+        first = self.open_journal()
+        photo = SimplePhoto('title', 'desc', '1')
+        photo.title = 'new title'
+        first.append(photo)
+        first.close()
+        photo = self.open_journal().pending()[0]
+        self.assertEqual('title', photo.original_title)
+        self.assertTrue(photo.dirty)
+
+    def test_newest_correction_wins(self):
+        journal_obj = self.open_journal()
+        journal_obj.append(SimplePhoto('first', 'desc', '1'))
+        journal_obj.append(SimplePhoto('other', 'desc', '2'))
+        journal_obj.append(SimplePhoto('second', 'desc', '1'))
+        photos = journal_obj.pending()
+        self.assertEqual(['2', '1'], [photo.photo_id for photo in photos])
+        self.assertEqual('second', photos[1].title)
+
+    def test_confirmed_not_reloaded(self):
+        first = self.open_journal()
+        photo = SimplePhoto('title', 'desc', '1')
+        first.append(photo)
+        first.append(SimplePhoto('title', 'desc', '2'))
+        first.confirm(photo)
+        first.close()
+        photos = self.open_journal().pending()
+        self.assertEqual(['2'], [photo.photo_id for photo in photos])
+
+    def test_confirm_older_version(self):
+        journal_obj = self.open_journal()
+        journal_obj.append(SimplePhoto('first', 'desc', '1'))
+        journal_obj.append(SimplePhoto('second', 'desc', '1'))
+        journal_obj.confirm(SimplePhoto('first', 'desc', '1'))
+        self.assertEqual(['second'],
+                         [photo.title for photo in journal_obj.pending()])
+
+    def test_torn_write_ignored(self):
+        first = self.open_journal()
+        first.append(SimplePhoto('title', 'desc', '1'))
+        first.close()
+        with open(self.path, 'ab') as journal_file:
+            journal_file.write('{"op": "pend')
+        second = self.open_journal()
+        self.assertEqual(['1'], [photo.photo_id for photo in second.pending()])
+        second.append(SimplePhoto('title', 'desc', '2'))
+        second.close()
+        photos = self.open_journal().pending()
+        self.assertEqual(['1', '2'], [photo.photo_id for photo in photos])
+
+    def test_compact(self):
+        journal_obj = self.open_journal()
+        for idx in xrange(5):
+            photo = SimplePhoto('title', 'desc', str(idx))
+            journal_obj.append(photo)
+            if idx % 2:
+                journal_obj.confirm(photo)
+        self.assertEqual(7, len(self.lines()))
+        journal_obj.compact()
+        self.assertEqual(3, len(self.lines()))
+        journal_obj.append(SimplePhoto('title', 'desc', '9'))
+        self.assertEqual(4, len(self.lines()))
+        self.assertEqual(['0', '2', '4', '9'],
+                         [photo.photo_id for photo in journal_obj.pending()])
+
+    def test_confirm_compacts(self):
+        journal_obj = self.open_journal(compact_min=2)
+        first = SimplePhoto('title', 'desc', '1')
+        journal_obj.append(first)
+        journal_obj.append(SimplePhoto('title', 'desc', '2'))
+        journal_obj.confirm(first)
+        self.assertEqual(1, len(self.lines()))
+
+    def test_sync_batched(self):
+        journal_obj = self.open_journal(sync_every=3, sync_interval=60)
+        with mock.patch('os.fsync') as fsync:
+            for idx in xrange(7):
+                journal_obj.append(SimplePhoto('title', 'desc', str(idx)))
+            self.assertEqual(2, fsync.call_count)
+
+    def test_sync_interval(self):
+        now = [0.0]
+        journal_obj = self.open_journal(sync_every=100, sync_interval=1,
+                                        clock=lambda: now[0])
+        with mock.patch('os.fsync') as fsync:
+            journal_obj.append(SimplePhoto('title', 'desc', '1'))
+            self.assertEqual(0, fsync.call_count)
+            now[0] = 2.0
+            journal_obj.append(SimplePhoto('title', 'desc', '2'))
+            self.assertEqual(1, fsync.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
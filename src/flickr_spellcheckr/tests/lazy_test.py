@@ -0,0 +1,70 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.lazy
+'''
+
+from flickr_spellcheckr.utils import lazy
+import mock
+import sys
+import threading
+import unittest
+
+
+class TestLazyModule(unittest.TestCase):
+
+    def test_imported_on_use(self):
+        sys.modules.pop('colorsys', None)
+        module = lazy.LazyModule('colorsys')
+        self.assertFalse('colorsys' in sys.modules)
+        self.assertEqual((0.0, 0.0, 1.0), module.rgb_to_hsv(1, 1, 1))
+        self.assertTrue('colorsys' in sys.modules)
+
+    def test_patch_seen(self):
+        module = lazy.LazyModule('colorsys')
+        with mock.patch('colorsys.rgb_to_hsv') as patched:
+            self.assertTrue(module.rgb_to_hsv is patched)
+
+    def test_missing_attribute(self):
+        module = lazy.LazyModule('colorsys')
+        self.assertRaises(AttributeError, getattr, module, 'no_such_thing')
+
+
+class TestBackground(unittest.TestCase):
+
+    def test_built_on_other_thread(self):
+        threads = []
+
+        def factory(value, extra=None):
+            threads.append(threading.current_thread())
+            return [value, extra]
+        loaded = lazy.Background(factory, 1, extra=2)
+        self.assertEqual([1, 2], loaded.result())
+        self.assertFalse(threading.current_thread() in threads)
+
+    def test_used_as_result(self):
+        loaded = lazy.Background(list, 'abc')
+        self.assertEqual(1, loaded.index('b'))
+        self.assertEqual(['a', 'b', 'c'], [char for char in loaded])
+
+    def test_waits_for_build(self):
+        release = threading.Event()
+
+        def factory():
+            release.wait()
+            return 'done'
+        loaded = lazy.Background(factory)
+        self.assertFalse(loaded.ready())
+        release.set()
+        self.assertEqual('done', loaded.result())
+        self.assertTrue(loaded.ready())
+
+    def test_error_raised_on_use(self):
+        def factory():
+            raise ValueError('no dictionary')
+        loaded = lazy.Background(factory)
+        self.assertRaises(ValueError, loaded.result)
+        self.assertRaises(ValueError, getattr, loaded, 'check')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.lexicon
+'''
+
+from flickr_spellcheckr.utils import detect, lexicon
+from flickr_spellcheckr.utils.flickr import SimplePhoto
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+
+def tokenize(text):
+    for match in re.finditer(r'\w+', text, re.UNICODE):
+        yield match.group(), match.start()
+
+
+class FakeDict(object):
+    '''Knows every word except the ones starting with "x"'''
+
+    def __init__(self):
+        self.checked = []
+
+    def check(self, word):
+        self.checked.append(word)
+        return not word.startswith('x')
+
+
+def make_checker(lang, pwl=None):
+    return lexicon.IndexedChecker(
+                    lexicon.Lexicon(lexicon.index_path(lang, pwl), pwl=pwl),
+                    FakeDict, tokenize)
+
+
+class LexiconTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'words')
+        self.pwl = os.path.join(self.tmpdir, 'pwl')
+        self.lexicons = []
+
+    def tearDown(self):
+        for lex in self.lexicons:
+            lex.close()
+
+    def write_pwl(self, words, mode='wb'):
+        with open(self.pwl, mode) as pwl:
+            pwl.write(u''.join(word + u'\n' for word in words)
+                      .encode('utf-8'))
+
+    def open(self, **kwargs):
+        lex = lexicon.Lexicon(self.path, pwl=self.pwl, **kwargs)
+        self.lexicons.append(lex)
+        return lex
+
+
+class TestLexicon(LexiconTestCase):
+
+    def test_pwl_words_known(self):
+        self.write_pwl([u'flickr', u'Zürich'])
+        lex = self.open()
+        self.assertTrue(u'flickr' in lex)
+        self.assertTrue(u'Zürich' in lex)
+        self.assertFalse(u'Zurich' in lex)
+        self.assertEqual(2, len(lex))
+
+    def test_unknown_batch(self):
+        self.write_pwl([u'one', u'two'])
+        lex = self.open()
+        self.assertEqual([u'three', u'four'], lex.unknown(
+                [u'one', u'three', u'two', u'four', u'three']))
+
+    def test_learned_shared(self):
+        self.write_pwl([])
+        lex = self.open()
+        lex.learn([u'cat', u'dog'])
+        self.assertTrue(u'cat' in lex)
+        other = self.open()
+        self.assertTrue(u'dog' in other)
+
+    def test_learned_merged(self):
+        self.write_pwl([])
+        words = [u'word%d' % idx for idx in xrange(50)]
+        self.open().learn(words)
+        lex = self.open(merge_min=10)
+        self.assertFalse(os.path.exists(self.path + '.new'))
+        self.assertEqual([], lex.unknown(words))
+        self.assertEqual(50, len(lex))
+
+    def test_pwl_additions_learned(self):
+        self.write_pwl([u'one'])
+        self.open()
+        self.write_pwl([u'two'], mode='ab')
+        lex = self.open()
+        self.assertEqual([], lex.unknown([u'one', u'two']))
+        self.open()
+        with open(self.path + '.new') as new:
+            self.assertEqual(['two\n'], new.readlines())
+
+    def test_pwl_removal_rebuilds(self):
+        self.write_pwl([u'one', u'two'])
+        self.open().learn([u'three'])
+        self.write_pwl([u'one'])
+        lex = self.open()
+        self.assertEqual([u'two', u'three'],
+                         lex.unknown([u'one', u'two', u'three']))
+
+    def test_bad_index_rebuilt(self):
+        self.write_pwl([u'one'])
+        with open(self.path, 'wb') as index:
+            index.write('junk')
+        self.assertTrue(u'one' in self.open())
+
+
+class TestIndexedChecker(LexiconTestCase):
+
+    def setUp(self):
+        LexiconTestCase.setUp(self)
+        self.write_pwl([u'flickr'])
+        self.dictionary = FakeDict()
+        self.made = 0
+
+    def checker(self):
+        def dictionary():
+            self.made += 1
+            return self.dictionary
+        return lexicon.IndexedChecker(self.open(), dictionary, tokenize)
+
+    def test_errors(self):
+        checker = self.checker()
+        checker.set_text(u'flickr xcat and xdog, xcat')
+        self.assertEqual([(u'xcat', 7), (u'xdog', 16), (u'xcat', 22)],
+                         [(err.word, err.wordpos) for err in checker])
+        self.assertEqual(u'flickr xcat and xdog, xcat', checker.get_text())
+        self.assertEqual([u'xcat', u'and', u'xdog'], self.dictionary.checked)
+
+    def test_accepted_words_learned(self):
+        self.checker().set_text(u'and then')
+        checker = self.checker()
+        checker.set_text(u'then and flickr')
+        self.assertEqual([], list(checker))
+        self.assertEqual(1, self.made)
+
+    def test_no_dictionary_without_misses(self):
+        checker = self.checker()
+        checker.set_text(u'flickr flickr')
+        self.assertEqual([], list(checker))
+        self.assertEqual(0, self.made)
+
+    def test_process_pool(self):
+        photos = [SimplePhoto(u'flickr xone', u'fine', str(idx))
+                  for idx in xrange(20)]
+        detector = detect.Detector('en_US', pwl=self.pwl, processes=2,
+                                   chunk_size=3, factory=make_checker)
+        records = list(detector.errors_iter(iter(photos)))
+        self.assertEqual([(str(idx), 'title', 7, u'xone')
+                          for idx in xrange(20)], records)
+        lex = lexicon.Lexicon(lexicon.index_path('en_US', self.pwl),
+                              pwl=self.pwl)
+        self.lexicons.append(lex)
+        self.assertEqual([u'xone'], lex.unknown([u'flickr', u'fine',
+                                                 u'xone']))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.markup
+'''
+
+from flickr_spellcheckr.utils import markup
+import array
+import mock
+import sys
+import types
+import unittest
+
+
+def unchecked(text, **kwargs):
+    regex = markup.skip_regex(**kwargs)
+    return [text[start:end] for start, end in markup.chunks(text, regex)]
+
+
+class TestSpans(unittest.TestCase):
+
+    def test_html(self):
+        self.assertEqual([u'Taken ', u'here', u' ', u' there'], unchecked(
+                u'Taken <a href="http://x.com/a">here</a> &amp; there'))
+
+    def test_url_and_email(self):
+        self.assertEqual([u'See ', u' or mail ', u' now'], unchecked(
+                u'See www.exmaple.com/pics?id=1 or mail joe.b@exmaple.com '
+                u'now'))
+        self.assertEqual([u'At ', u'.'],
+                         unchecked(u'At https://flic.kr/p/abc.'))
+
+    def test_hashtags(self):
+        self.assertEqual([u'Sunset ', u' by '],
+                         unchecked(u'Sunset #goldenhour by @jbloggs'))
+
+    def test_only_chosen_filters(self):
+        self.assertEqual([u'<b>#tag</b> '],
+                         unchecked(u'<b>#tag</b> www.x.com',
+                                   filters=('url', )))
+
+    def test_user_patterns(self):
+        self.assertEqual([u'Shot with ', u' nice'], unchecked(
+                u'Shot with EF-S f/2.8 1/250s, nice', filters=(),
+                patterns=(r'EF-S f/\S+ \S+', )))
+
+    def test_empty_matches_skipped(self):
+        self.assertEqual([u'abc'], unchecked(u'abc', filters=(),
+                                             patterns=(r'x*', )))
+
+    def test_no_filters(self):
+        self.assertEqual(None, markup.skip_regex(filters=()))
+        self.assertEqual(None, markup.word_filter(filters=()))
+
+
+class TestWords(unittest.TestCase):
+
+    def test_camel_case(self):
+        for word in (u'iPhone', u'PhotoShop', u'deviantArt'):
+            self.assertTrue(markup.is_camel_case(word), word)
+        for word in (u'Photo', u'NASA', u'photo', u'UFOs'):
+            self.assertFalse(markup.is_camel_case(word), word)
+
+    def test_digits(self):
+        self.assertTrue(markup.has_digit(u'D700'))
+        self.assertTrue(markup.has_digit(u'18mm'))
+        self.assertFalse(markup.has_digit(u'Nikon'))
+
+    def test_word_filter(self):
+        skip = markup.word_filter(filters=('alphanumeric', ))
+        self.assertTrue(skip(u'D700'))
+        self.assertFalse(skip(u'iPhone'))
+
+
+class FakeTokenize(object):
+    '''Just enough of enchant.tokenize's base classes'''
+
+    def __init__(self, text):
+        self._text = text
+        self._offset = 0
+
+    def __iter__(self):
+        return self
+
+
+class FakeFilter(object):
+    def __init__(self, tokenizer):
+        self._tokenizer = tokenizer
+
+
+class TestTokenizerArgs(unittest.TestCase):
+
+    def setUp(self):
+        tokenize = types.ModuleType('enchant.tokenize')
+        tokenize.Chunker = FakeTokenize
+        tokenize.Filter = FakeFilter
+        enchant = types.ModuleType('enchant')
+        enchant.tokenize = tokenize
+        patcher = mock.patch.dict(sys.modules, {'enchant': enchant,
+                                                'enchant.tokenize': tokenize})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_chunks_keep_offsets(self):
+        chunkers, _filters = markup.tokenizer_args()
+        text = u'A <b>good</b> photo'
+        self.assertEqual([(u'A ', 0), (u'good', 5), (u' photo', 13)],
+                         list(chunkers[0](text)))
+
+    def test_edited_text_followed(self):
+        chunkers, _filters = markup.tokenizer_args()
+        text = array.array('u', u'teh <b>cat</b>')
+        chunker = chunkers[0](text)
+        self.assertEqual((array.array('u', u'teh '), 0), chunker.next())
+        text[0:3] = array.array('u', u'the')
+        text[7:10] = array.array('u', u'dogs')
+        self.assertEqual((array.array('u', u'dogs'), 7), chunker.next())
+        self.assertRaises(StopIteration, chunker.next)
+
+    def test_word_filter(self):
+        _chunkers, filters = markup.tokenizer_args(filters=('camelcase', ))
+        word_filter = filters[0](None)
+        self.assertTrue(word_filter._skip(u'iPhone'))
+        self.assertFalse(word_filter._skip(u'phone'))
+
+    def test_nothing_to_filter(self):
+        self.assertEqual(([], []), markup.tokenizer_args(filters=()))
+
+
+class TestSpellChecker(unittest.TestCase):
+    '''tokenizer_args driving a real enchant SpellChecker'''
+
+    def setUp(self):
+        try:
+            from enchant.checker import SpellChecker
+        except ImportError:
+            self.skipTest('pyenchant is not installed')
+        chunkers, filters = markup.tokenizer_args()
+        self.checker = SpellChecker('en_US', chunkers=chunkers,
+                                    filters=filters)
+
+    def test_skipped_spans_unchanged(self):
+        corrections = {u'phtos': u'photos', u'teh': u'the'}
+        self.checker.set_text(u'Nice phtos <b>http://example.com/teh</b> '
+                              u'D700 teh')
+        words = []
+        for error in self.checker:
+            words.append(error.word)
+            error.replace(corrections[error.word])
+        self.assertEqual([u'phtos', u'teh'], words)
+        self.assertEqual(u'Nice photos <b>http://example.com/teh</b> '
+                         u'D700 the', self.checker.get_text())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.metrics
+'''
+
+from flickr_spellcheckr.utils import metrics
+import unittest
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_empty(self):
+        hist = metrics.Histogram()
+        self.assertEqual(None, hist.percentile(50))
+        self.assertEqual(None, hist.snapshot()['mean'])
+
+    def test_percentiles(self):
+        hist = metrics.Histogram(base=1)
+        for value in xrange(1, 101):
+            hist.observe(value)
+        self.assertEqual(100, hist.count)
+        self.assertEqual(5050, hist.total)
+        self.assertEqual(64, hist.percentile(50))
+        self.assertEqual(100, hist.percentile(99))
+        self.assertEqual(1, hist.min)
+        self.assertEqual(100, hist.max)
+
+    def test_overflow_bucket(self):
+        hist = metrics.Histogram(base=1)
+        hist.observe(2 ** 40)
+        self.assertEqual(1, hist.buckets[-1])
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = metrics.Metrics()
+
+    def test_incr(self):
+        self.metrics.incr('calls')
+        self.metrics.incr('calls', 2)
+        self.assertEqual({'calls': 3}, self.metrics.snapshot()['counters'])
+
+    def test_timer(self):
+        with self.metrics.timer('work'):
+            pass
+        hist = self.metrics.snapshot()['histograms']['work']
+        self.assertEqual(1, hist['count'])
+
+    def test_timer_error(self):
+        def fail():
+            with self.metrics.timer('work'):
+                raise ValueError('boom')
+        self.assertRaises(ValueError, fail)
+        snap = self.metrics.snapshot()
+        self.assertEqual(1, snap['counters']['work.errors'])
+        self.assertEqual(1, snap['histograms']['work']['count'])
+
+    def test_reset(self):
+        self.metrics.incr('calls')
+        self.metrics.observe('work', 1)
+        self.metrics.reset()
+        snap = self.metrics.snapshot()
+        self.assertEqual({}, snap['counters'])
+        self.assertEqual({}, snap['histograms'])
+
+    def test_report(self):
+        self.metrics.incr('api.calls', 4)
+        self.metrics.observe('api.photos_search', 0.25)
+        report = '\n'.join(self.metrics.report())
+        self.assertTrue('api.calls' in report)
+        self.assertTrue('api.photos_search' in report)
+
+
+if __name__ == "__main__":
+    unittest.main()
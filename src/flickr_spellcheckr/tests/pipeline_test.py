@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.pipeline
+'''
+
+from flickr_spellcheckr.utils import pipeline
+import threading
+import unittest
+
+
+class TestBackgroundFilter(unittest.TestCase):
+
+    def test_filtered_in_order(self):
+        result = list(pipeline.background_filter(xrange(100),
+                                                 lambda x: x % 3 == 0))
+        self.assertEqual(range(0, 100, 3), result)
+
+    def test_rejected_reported(self):
+        rejected = []
+        list(pipeline.background_filter(xrange(10), lambda x: x < 5,
+                                        on_reject=rejected.append))
+        self.assertEqual(range(5, 10), rejected)
+
+    def test_runs_on_other_thread(self):
+        threads = set()
+
+        def predicate(item):
+            threads.add(threading.current_thread())
+            return True
+        list(pipeline.background_filter(xrange(5), predicate))
+        self.assertEqual(1, len(threads))
+        self.assertFalse(threading.current_thread() in threads)
+
+    def test_bounded(self):
+        seen = []
+
+        def items():
+            for idx in xrange(1000):
+                seen.append(idx)
+                yield idx
+        filtered = pipeline.background_filter(items(), lambda x: True,
+                                              maxsize=5)
+        filtered.next()
+        filtered.close()
+        self.assertTrue(len(seen) < 20, 'Producer ran ahead unbounded')
+
+    def test_error_raised(self):
+        def items():
+            yield 1
+            raise ValueError('bad page')
+        filtered = pipeline.background_filter(items(), lambda x: True)
+        self.assertEqual(1, filtered.next())
+        self.assertRaises(ValueError, filtered.next)
+
+
+if __name__ == "__main__":
+    unittest.main()
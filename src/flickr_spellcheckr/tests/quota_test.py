@@ -0,0 +1,92 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.quota
+'''
+
+from flickr_spellcheckr.tests.fakes import FakeClock
+from flickr_spellcheckr.utils import quota
+import mock
+import unittest
+
+
+class TestQuotaScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def scheduler(self, **kwargs):
+        return quota.QuotaScheduler(clock=self.clock, sleep=self.clock.sleep,
+                                    **kwargs)
+
+    def test_no_limit(self):
+        scheduler = self.scheduler(hourly=None)
+        for _ in xrange(10):
+            self.assertEqual(0, scheduler.acquire())
+        self.assertEqual(0.0, self.clock.now)
+        snap = scheduler.snapshot()
+        self.assertEqual(10, snap['calls_last_hour'])
+        self.assertEqual(None, snap['remaining_this_hour'])
+
+    def test_hourly_rate(self):
+        scheduler = self.scheduler(hourly=7200, burst=1)
+        for _ in xrange(5):
+            scheduler.acquire()
+        # One free token, then 4 more at 2 per second
+        self.assertAlmostEqual(2.0, self.clock.now)
+        self.assertEqual(7195, scheduler.snapshot()['remaining_this_hour'])
+
+    def test_burst(self):
+        scheduler = self.scheduler(hourly=3600, burst=5)
+        for _ in xrange(5):
+            scheduler.acquire()
+        self.assertEqual(0.0, self.clock.now)
+        scheduler.acquire()
+        self.assertAlmostEqual(1.0, self.clock.now)
+
+    def test_old_calls_forgotten(self):
+        scheduler = self.scheduler(hourly=3600)
+        scheduler.acquire()
+        self.clock.now += quota.HOUR + 1
+        scheduler.acquire()
+        self.assertEqual(1, scheduler.snapshot()['calls_last_hour'])
+
+    def test_throttled_backs_off(self):
+        scheduler = self.scheduler(hourly=None, backoff=1.0, max_backoff=3.0)
+        scheduler.throttled()
+        self.assertEqual(1.0, scheduler.acquire())
+        scheduler.throttled()
+        self.assertEqual(2.0, scheduler.snapshot()['paused_for'])
+        scheduler.throttled()  # Capped
+        self.assertEqual(3.0, scheduler.snapshot()['paused_for'])
+        self.assertEqual(3, scheduler.snapshot()['throttled'])
+
+    def test_success_resets_backoff(self):
+        scheduler = self.scheduler(hourly=None, backoff=1.0)
+        scheduler.throttled()
+        scheduler.throttled()
+        scheduler.acquire()
+        scheduler.succeeded()
+        scheduler.throttled()
+        self.assertEqual(1.0, scheduler.snapshot()['paused_for'])
+
+    def test_no_burst_after_pause(self):
+        scheduler = self.scheduler(hourly=3600, burst=10, backoff=5.0)
+        scheduler.throttled()
+        scheduler.acquire()
+        scheduler.acquire()
+        self.assertAlmostEqual(7.0, self.clock.now)
+
+    def test_write_waits_for_read(self):
+        scheduler = self.scheduler(hourly=3600, burst=10)
+        scheduler._waiting[quota.READ] = 1
+        sleep = mock.Mock(side_effect=lambda seconds:
+                          scheduler._waiting.update({quota.READ: 0}))
+        scheduler._sleep = sleep
+        scheduler.acquire(quota.WRITE)
+        self.assertEqual(1, sleep.call_count)
+        scheduler.acquire(quota.READ)
+        self.assertEqual(1, sleep.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
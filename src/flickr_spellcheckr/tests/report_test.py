@@ -0,0 +1,110 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.report
+'''
+
+from flickr_spellcheckr import report
+from flickr_spellcheckr.utils.detect import ErrorRecord
+from flickr_spellcheckr.utils.flickr import SimplePhoto
+import StringIO
+import json
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def fake_records(photos):
+    for photo in photos:
+        if 'teh' in photo.title:
+            yield ErrorRecord(photo.photo_id, 'title',
+                              photo.title.index('teh'), 'teh')
+
+
+class TestReport(unittest.TestCase):
+
+    def setUp(self):
+        self.photos = [SimplePhoto('teh cat', None, '1'),
+                       SimplePhoto('a dog', None, '2'),
+                       SimplePhoto('on teh mat', None, '3')]
+
+    def test_rows(self):
+        rows = list(report.report_rows(iter(self.photos), fake_records,
+                                       suggester=lambda word: ['the', 'ten',
+                                                               'tea', 'tee'],
+                                       max_suggestions=2))
+        self.assertEqual(['1', '3'], [row['photo_id'] for row in rows])
+        self.assertEqual(['the', 'ten'], rows[0]['suggestions'])
+        self.assertEqual('on teh mat', rows[1]['context'])
+
+    def test_context_trimmed(self):
+        text = 'a' * 50 + ' teh ' + 'b' * 50
+        snippet = report.context(text, 51, 'teh', chars=5)
+        self.assertEqual('...aaaa teh bbbb...', snippet)
+
+    def test_jsonl(self):
+        out = StringIO.StringIO()
+        writer = report.JsonLinesWriter(out)
+        for row in report.report_rows(iter(self.photos), fake_records):
+            writer.write(row)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual('teh', json.loads(lines[0])['word'])
+
+    def test_csv(self):
+        out = StringIO.StringIO()
+        writer = report.CsvWriter(out)
+        writer.write({'photo_id': '1', 'field': 'title', 'offset': 0,
+                      'word': u'teh', 'suggestions': ['the', 'ten'],
+                      'context': u'teh caf\xe9'})
+        lines = out.getvalue().splitlines()
+        self.assertEqual(','.join(report.COLUMNS), lines[0])
+        self.assertEqual('1,title,0,teh,the|ten,teh caf\xc3\xa9', lines[1])
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.mock_flickr = mock.Mock()
+        self.mock_flickr.login.return_value = True
+        for target, value in (
+                ('flickr.Flickr', mock.Mock(return_value=self.mock_flickr)),
+                ('lazy.Background', mock.Mock()),
+                ('detect.Detector', mock.Mock()),
+                ('get_local_settings', mock.Mock(return_value=None)),
+                ('get_local_file', lambda suffix: os.path.join(
+                                                    tmpdir, 'f' + suffix)),
+                ('sys.stderr', StringIO.StringIO())):
+            patcher = mock.patch('flickr_spellcheckr.report.' + target,
+                                 value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_not_authorised(self):
+        self.mock_flickr.login.return_value = False
+        self.assertEqual(report.EXIT_NOT_AUTHORISED, report.main([]))
+        self.mock_flickr.login.assert_called_once_with(interactive=False)
+        self.assertFalse(self.mock_flickr.photos_iter.called)
+
+    def test_crash_is_failure(self):
+        self.mock_flickr.photos_iter.side_effect = ValueError(
+                                            'Flickr XML response in '
+                                            'unexpected format')
+        self.assertEqual(report.EXIT_FAILURE, report.main([]))
+        self.assertTrue(self.mock_flickr.close.called)
+
+    def test_login_crash_is_failure(self):
+        self.mock_flickr.login.side_effect = IOError('connection refused')
+        self.assertEqual(report.EXIT_FAILURE, report.main([]))
+
+    def test_bad_output_is_failure(self):
+        self.mock_flickr.photos_iter.return_value = iter([])
+        self.assertEqual(report.EXIT_FAILURE,
+                         report.main(['-o', '/nonexistent/dir/out.jsonl']))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.rules
+'''
+
+from flickr_spellcheckr.utils import rules
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestRuleStore(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.store = rules.RuleStore(clock=lambda: self.now)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_replace_and_ignore(self):
+        self.store.set(u'teh', u'the')
+        self.store.set(u'flickr')
+        self.assertEqual(u'the', self.store.get(u'teh').replacement)
+        self.assertTrue(self.store.ignored(u'flickr'))
+        self.assertFalse(self.store.ignored(u'teh'))
+        self.assertEqual(None, self.store.get(u'cat'))
+        self.assertEqual([u'flickr', u'teh'],
+                         [rule.word for rule in self.store.rules()])
+
+    def test_edit_replaces(self):
+        self.store.set(u'teh', u'the')
+        self.store.set(u'teh')
+        self.assertTrue(self.store.ignored(u'teh'))
+        self.assertEqual(1, len(self.store))
+
+    def test_remove(self):
+        self.store.set(u'teh', u'the')
+        self.assertTrue(self.store.remove(u'teh'))
+        self.assertFalse(self.store.remove(u'teh'))
+        self.assertEqual(None, self.store.get(u'teh'))
+
+    def test_record_use(self):
+        self.store.set(u'teh', u'the')
+        self.now = 2000.0
+        self.store.record_use(u'teh')
+        self.store.record_use(u'teh')
+        rule = self.store.get(u'teh')
+        self.assertEqual((2, 2000.0), (rule.uses, rule.used))
+
+    def test_expire_unused(self):
+        self.store.set(u'old')
+        self.store.set(u'used')
+        self.now = 5000.0
+        self.store.set(u'new')
+        self.store.record_use(u'used')
+        self.now = 5500.0
+        expired = self.store.expire(1000)
+        self.assertEqual([u'old'], [rule.word for rule in expired])
+        self.assertEqual([u'new', u'used'],
+                         [rule.word for rule in self.store.rules()])
+
+
+class TestRuleStoreFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'rules.sqlite')
+
+    def test_kept_between_sessions(self):
+        store = rules.RuleStore(self.path)
+        store.set(u'teh', u'the')
+        store.set(u'flickr')
+        store.record_use(u'flickr')
+        store.close()
+        store = rules.RuleStore(self.path)
+        self.assertEqual(u'the', store.get(u'teh').replacement)
+        self.assertEqual(1, store.get(u'flickr').uses)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.scope
+'''
+
+from flickr_spellcheckr.utils import scope
+from flickr_spellcheckr.utils.flickr import SimplePhoto
+import datetime
+import unittest
+
+
+class TestParse(unittest.TestCase):
+
+    def test_dates_only(self):
+        photo_scope, date_range = scope.parse('01/14/2012 02/01/2012')
+        self.assertFalse(photo_scope)
+        self.assertEqual([datetime.datetime(2012, 1, 14),
+                          datetime.datetime(2012, 2, 1)], date_range)
+
+    def test_empty(self):
+        photo_scope, date_range = scope.parse('')
+        self.assertFalse(photo_scope)
+        self.assertEqual([], date_range)
+
+    def test_selectors(self):
+        photo_scope, date_range = scope.parse(
+                'album:721 tag:"New York" collection:88 album:722 '
+                '01/14/2012')
+        self.assertEqual(['721', '722'], photo_scope.albums)
+        self.assertEqual(['88'], photo_scope.collections)
+        self.assertEqual([u'newyork'], photo_scope.tags)
+        self.assertEqual([datetime.datetime(2012, 1, 14)], date_range)
+        self.assertEqual('2 albums, 1 collection, 1 tag', str(photo_scope))
+
+    def test_unicode_tag(self):
+        photo_scope, _ = scope.parse(u'tag:Zürich')
+        self.assertEqual([u'zürich'], photo_scope.tags)
+
+    def test_all(self):
+        photo_scope, _ = scope.parse('all')
+        self.assertTrue(photo_scope)
+        self.assertTrue(photo_scope.everything)
+        self.assertRaises(ValueError, scope.parse, 'all album:1')
+        self.assertRaises(ValueError, scope.parse, 'all 01/14/2012')
+
+    def test_bad_words(self):
+        for line in ('set:1', 'album:', '14/01/2012', 'tag:"open',
+                     '01/01/2012 01/02/2012 01/03/2012'):
+            self.assertRaises(ValueError, scope.parse, line)
+
+
+class TestTakenBetween(unittest.TestCase):
+
+    def test_between(self):
+        photos = [SimplePhoto('', None, '1', '2012-01-01 10:00:00'),
+                  SimplePhoto('', None, '2', '2012-02-01 10:00:00'),
+                  SimplePhoto('', None, '3', '2012-03-01 10:00:00'),
+                  SimplePhoto('', None, '4')]
+        kept = scope.taken_between(photos, datetime.datetime(2012, 1, 15),
+                                   datetime.datetime(2012, 2, 15))
+        self.assertEqual(['2', '4'], [photo.photo_id for photo in kept])
+        self.assertEqual(4, len(list(scope.taken_between(photos))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.store
+'''
+
+from flickr_spellcheckr.utils import store
+from flickr_spellcheckr.utils.flickr import SimplePhoto
+import datetime
+import unittest
+
+
+class TestPhotoStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = store.PhotoStore(':memory:')
+        self.store.update([
+            SimplePhoto('one', 'first', '1', '2012-01-01 10:00:00', 100),
+            SimplePhoto('two', 'second', '2', '2012-02-01 10:00:00', 100),
+            SimplePhoto('three', None, '3', '2012-03-01 10:00:00', 100),
+        ])
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_last_sync(self):
+        self.assertEqual(None, self.store.last_sync)
+        self.store.last_sync = 1234.5
+        self.assertEqual(1234.5, self.store.last_sync)
+
+    def test_date_range(self):
+        photos = list(self.store.photos(
+                                    date_from=datetime.datetime(2012, 1, 15),
+                                    date_to=datetime.datetime(2012, 2, 15)))
+        self.assertEqual(['2'], [photo.photo_id for photo in photos])
+        self.assertEqual('second', photos[0].description)
+
+    def test_verified_skipped(self):
+        self.store.mark_verified(SimplePhoto('one', 'first', '1'))
+        ids = sorted(photo.photo_id for photo in self.store.photos())
+        self.assertEqual(['2', '3'], ids)
+        self.assertEqual(3, len(list(self.store.photos(unverified=False))))
+
+    def test_unchanged_sync_stays_verified(self):
+        self.store.mark_verified(SimplePhoto('three', None, '3'))
+        self.store.update([SimplePhoto('three', None, '3',
+                                       '2012-03-01 10:00:00', 200)])
+        ids = sorted(photo.photo_id for photo in self.store.photos())
+        self.assertEqual(['1', '2'], ids)
+
+    def test_changed_sync_clears_verified(self):
+        self.store.mark_verified(SimplePhoto('one', 'first', '1'))
+        self.store.update([SimplePhoto('one', 'frist', '1',
+                                       '2012-01-01 10:00:00', 200)])
+        ids = sorted(photo.photo_id for photo in self.store.photos())
+        self.assertEqual(['1', '2', '3'], ids)
+
+    def test_paged(self):
+        self.store.update([
+            SimplePhoto('four', None, '4', '2012-02-01 10:00:00', 100),
+            SimplePhoto('five', None, '5', None, 100),
+        ])
+        photos = self.store.photos(page_size=2)
+        ids = [photo.photo_id for photo in photos]
+        self.assertEqual(['3', '4', '2', '1', '5'], ids)
+
+    def test_verified_while_paging(self):
+        photos = self.store.photos(page_size=1)
+        for photo in photos:
+            self.store.mark_verified(photo)
+        self.assertEqual([], list(self.store.photos()))
+
+    def test_is_verified(self):
+        self.store.mark_verified(SimplePhoto('three', None, '3'))
+        self.assertTrue(self.store.is_verified(SimplePhoto('three', None,
+                                                           '3')))
+        self.assertFalse(self.store.is_verified(SimplePhoto('three', 'new',
+                                                            '3')))
+        self.assertFalse(self.store.is_verified(SimplePhoto('one', 'first',
+                                                            '1')))
+        self.assertFalse(self.store.is_verified(SimplePhoto('four', None,
+                                                            '4')))
+
+    def test_len(self):
+        self.assertEqual(3, len(self.store))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.suggest
+'''
+
+from flickr_spellcheckr.utils import metrics, suggest
+import mock
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+
+class TestSuggestionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pwl = os.path.join(self.tmpdir, 'pwl.txt')
+        self.path = os.path.join(self.tmpdir, 'cache.sqlite')
+        with open(self.pwl, 'w') as pwl:
+            pwl.write('flickr\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_miss_then_hit(self):
+        cache = suggest.SuggestionCache('en_US', pwl=self.pwl)
+        suggester = mock.Mock(return_value=['receive'])
+        self.assertEqual(['receive'], cache.suggest('recieve', suggester))
+        self.assertEqual(['receive'], cache.suggest('recieve', suggester))
+        self.assertEqual(1, suggester.call_count)
+
+    def test_memory_lru(self):
+        cache = suggest.SuggestionCache('en_US', max_memory=2)
+        cache.put('a', ['1'])
+        cache.put('b', ['2'])
+        cache.get('a')
+        cache.put('c', ['3'])
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(['1'], cache.get('a'))
+
+    def test_persisted(self):
+        cache = suggest.SuggestionCache('en_US', pwl=self.pwl, path=self.path)
+        cache.put(u'recieve', [u'receive', u'relieve'])
+        cache.close()
+        cache = suggest.SuggestionCache('en_US', pwl=self.pwl, path=self.path)
+        self.assertEqual([u'receive', u'relieve'], cache.get(u'recieve'))
+        cache.close()
+
+    def test_disk_eviction(self):
+        cache = suggest.SuggestionCache('en_US', path=self.path,
+                                        max_memory=1, max_disk=2)
+        cache.put('a', ['1'])
+        cache.put('b', ['2'])
+        cache.get('a')
+        cache.put('c', ['3'])
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(['1'], cache.get('a'))
+        self.assertEqual(['3'], cache.get('c'))
+        cache.close()
+
+    def test_pwl_change_invalidates(self):
+        cache = suggest.SuggestionCache('en_US', pwl=self.pwl, path=self.path)
+        cache.put('recieve', ['receive'])
+        with open(self.pwl, 'a') as pwl:
+            pwl.write('recieve\n')
+        cache.refresh()
+        self.assertEqual(None, cache.get('recieve'))
+        cache.close()
+
+    def test_pwl_change_between_runs(self):
+        cache = suggest.SuggestionCache('en_US', pwl=self.pwl, path=self.path)
+        cache.put('recieve', ['receive'])
+        cache.close()
+        with open(self.pwl, 'a') as pwl:
+            pwl.write('recieve\n')
+        cache = suggest.SuggestionCache('en_US', pwl=self.pwl, path=self.path)
+        self.assertEqual(None, cache.get('recieve'))
+        cache.close()
+
+
+class TestSuggestionPrefetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.threads = []
+        self.made = 0
+        self.metrics = metrics.Metrics()
+
+    def factory(self):
+        self.made += 1
+
+        def suggester(word):
+            self.threads.append(threading.current_thread())
+            return [word.upper()]
+        return suggester
+
+    def prefetcher(self, **kwargs):
+        prefetcher = suggest.SuggestionPrefetcher(self.factory,
+                                                  metrics=self.metrics,
+                                                  **kwargs)
+        self.addCleanup(prefetcher.close)
+        return prefetcher
+
+    def test_worked_out_on_worker(self):
+        prefetcher = self.prefetcher()
+        prefetcher.prefetch(['teh'])
+        fallback = mock.Mock()
+        self.assertEqual(['TEH'], prefetcher.suggest('teh', fallback))
+        self.assertFalse(fallback.called)
+        self.assertFalse(threading.current_thread() in self.threads)
+        self.assertEqual(1, self.metrics.snapshot()['counters']
+                         ['suggest.prefetched'])
+
+    def test_not_queued(self):
+        prefetcher = self.prefetcher()
+        fallback = mock.Mock(return_value=['the'])
+        self.assertEqual(['the'], prefetcher.suggest('teh', fallback))
+        self.assertEqual([], self.threads)
+
+    def test_one_dictionary_per_worker(self):
+        prefetcher = self.prefetcher(workers=2)
+        words = ['word%d' % idx for idx in xrange(20)]
+        prefetcher.prefetch(words)
+        for word in words:
+            prefetcher.suggest(word, mock.Mock())
+        self.assertEqual(len(set(self.threads)), self.made)
+
+    def test_cache_shared(self):
+        cache = suggest.SuggestionCache('en_US')
+        cache.put('teh', ['the'])
+        prefetcher = self.prefetcher(cache=cache)
+        prefetcher.prefetch(['teh', 'recieve'])
+        self.assertEqual(['the'], prefetcher.suggest('teh', mock.Mock()))
+        self.assertEqual(['RECIEVE'], prefetcher.suggest('recieve',
+                                                         mock.Mock()))
+        self.assertEqual(['RECIEVE'], cache.get('recieve'))
+        self.assertEqual(['the'], prefetcher.suggest('teh', mock.Mock()))
+
+    def test_passed_over_dropped(self):
+        prefetcher = self.prefetcher()
+        prefetcher.prefetch(['one', 'two'])
+        prefetcher.suggest('two', mock.Mock())
+        fallback = mock.Mock(return_value=[])
+        prefetcher.suggest('one', fallback)
+        self.assertTrue(fallback.called)
+
+    def test_max_pending(self):
+        prefetcher = self.prefetcher(max_pending=1)
+        prefetcher.prefetch(['one', 'two'])
+        fallback = mock.Mock(return_value=[])
+        prefetcher.suggest('two', fallback)
+        self.assertTrue(fallback.called)
+
+    def test_clear_makes_new_dictionary(self):
+        prefetcher = self.prefetcher()
+        prefetcher.prefetch(['one'])
+        prefetcher.suggest('one', mock.Mock())
+        prefetcher.clear()
+        prefetcher.prefetch(['one'])
+        prefetcher.suggest('one', mock.Mock())
+        self.assertEqual(2, self.made)
+
+    def test_error_falls_back(self):
+        def factory():
+            raise ValueError('no dictionary')
+        prefetcher = suggest.SuggestionPrefetcher(factory,
+                                                  metrics=self.metrics)
+        self.addCleanup(prefetcher.close)
+        prefetcher.prefetch(['teh'])
+        fallback = mock.Mock(return_value=['the'])
+        self.assertEqual(['the'], prefetcher.suggest('teh', fallback))
+        self.assertEqual(1, self.metrics.snapshot()['counters']
+                         ['suggest.prefetch_errors'])
+
+
+if __name__ == "__main__":
+    unittest.main()
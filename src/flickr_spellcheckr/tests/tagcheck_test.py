@@ -0,0 +1,38 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.tagcheck
+'''
+
+from flickr_spellcheckr.utils import tagcheck
+import mock
+import unittest
+
+
+class TestTagCheck(unittest.TestCase):
+
+    def test_unique_tags(self):
+        tags = ['cat', 'dog', 'cat', '', None, 'upcoming:event=123', 'dog']
+        self.assertEqual(['cat', 'dog'], list(tagcheck.unique_tags(tags)))
+
+    def test_clean_tag(self):
+        self.assertEqual('newyork', tagcheck.clean_tag(u'New York!'))
+
+    def test_tag_words(self):
+        self.assertEqual(["don't", 'stop', 'me'],
+                         tagcheck.tag_words("don't stop 2012 me stop"))
+
+    def test_find_misspelled_checks_once(self):
+        check = mock.Mock(side_effect=lambda word: word != 'teh')
+        tags = ['teh cat', 'teh dog', 'cat dog']
+        misspelled = list(tagcheck.find_misspelled(tags, check))
+        self.assertEqual([('teh cat', ['teh']), ('teh dog', ['teh'])],
+                         misspelled)
+        self.assertEqual(3, check.call_count)
+
+    def test_replace_word(self):
+        self.assertEqual('the theme the',
+                         tagcheck.replace_word('teh theme teh', 'teh', 'the'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.tagrename
+'''
+
+from flickr_spellcheckr.utils import flickr, httppool, quota, tagrename
+from flickr_spellcheckr.utils.flickr import PhotoTag, SimplePhoto
+import mock
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+
+class TestRenameLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'renames.jsonl')
+
+    def open_log(self):
+        log = tagrename.RenameLog(self.path)
+        self.addCleanup(log.close)
+        return log
+
+    def test_reload_pending(self):
+        first = self.open_log()
+        first.start(u'teh', u'the')
+        first.photo_done(u'teh', '1')
+        first.start(u'Nwe York', u'New York')
+        first.close()
+        log = self.open_log()
+        self.assertEqual([(u'teh', u'the'), (u'Nwe York', u'New York')],
+                         log.pending())
+        self.assertEqual(set(['1']), log.done(u'teh'))
+
+    def test_restart_keeps_done(self):
+        log = self.open_log()
+        log.start(u'teh', u'the')
+        log.photo_done(u'teh', '1')
+        log.start(u'teh', u'the')
+        self.assertEqual(set(['1']), log.done(u'teh'))
+        log.start(u'teh', u'tea')
+        self.assertEqual(set(), log.done(u'teh'))
+
+    def test_finished_compacted(self):
+        log = self.open_log()
+        log.start(u'teh', u'the')
+        log.photo_done(u'teh', '1')
+        log.finish(u'teh')
+        self.assertEqual([], log.pending())
+        self.assertEqual(0, os.path.getsize(self.path))
+
+    def test_torn_record_dropped(self):
+        log = self.open_log()
+        log.start(u'teh', u'the')
+        log.close()
+        with open(self.path, 'ab') as log_file:
+            log_file.write('{"op": "done", "ol')
+        log = self.open_log()
+        log.photo_done(u'teh', '2')
+        log.close()
+        self.assertEqual(set(['2']), self.open_log().done(u'teh'))
+
+
+class TestTagRenamer(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        self.tags = {'1': [PhotoTag('t1', u'teh', u'teh')],
+                     '2': [PhotoTag('t2', u'teh', u'teh'),
+                           PhotoTag('t3', u'the', u'the')],
+                     '3': []}
+        self.mock_flickr.photo_tags.side_effect = lambda photo_id: \
+            self.tags[photo_id]
+        self.mock_flickr.tagged_photos_iter.side_effect = lambda tag: iter(
+                [SimplePhoto('', None, photo_id) for photo_id in '123'])
+        # Make the methods the worker threads call before they race to
+        # create them, calls on a copy that lost the race would be lost
+        self.mock_flickr.add_tags.return_value = None
+        self.mock_flickr.remove_tag.return_value = None
+        self.sleep = mock.Mock()
+
+    def renamer(self, **kwargs):
+        return tagrename.TagRenamer(self.mock_flickr, workers=3,
+                                    sleep=self.sleep, **kwargs)
+
+    def test_renamed(self):
+        results = self.renamer().rename_all([(u'teh', u'the')])
+        self.mock_flickr.tagged_photos_iter.assert_called_once_with(u'teh')
+        self.assertEqual(['1', '2'], sorted(result.photo_id
+                                            for result in results
+                                            if result.changed))
+        self.assertTrue(all(result.ok for result in results))
+        self.mock_flickr.add_tags.assert_called_once_with('1', [u'the'])
+        self.assertEqual(['t1', 't2'], sorted(
+                call[0][0]
+                for call in self.mock_flickr.remove_tag.call_args_list))
+
+    def test_added_before_removed(self):
+        calls = []
+        self.mock_flickr.add_tags.side_effect = \
+            lambda *args: calls.append('add')
+        self.mock_flickr.remove_tag.side_effect = \
+            lambda *args: calls.append('remove')
+        self.renamer().rename_one(u'teh', u'the', '1')
+        self.assertEqual(['add', 'remove'], calls)
+
+    def test_same_clean_tag(self):
+        self.tags['1'] = [PhotoTag('t1', u'newyork', u'newyork')]
+        calls = []
+        self.mock_flickr.add_tags.side_effect = \
+            lambda *args: calls.append(('add', ) + args)
+        self.mock_flickr.remove_tag.side_effect = \
+            lambda *args: calls.append(('remove', ) + args)
+        result = self.renamer().rename_one(u'newyork', u'New York', '1')
+        self.assertTrue(result.changed)
+        self.assertEqual([('remove', 't1'), ('add', '1', [u'New York'])],
+                         calls)
+
+    def test_transient_error_retried(self):
+        self.mock_flickr.add_tags.side_effect = [socket.error('reset'),
+                                                 None]
+        result = self.renamer().rename_one(u'teh', u'the', '1')
+        self.assertTrue(result.ok)
+        self.assertEqual(4, result.calls)
+        self.assertEqual(1, self.sleep.call_count)
+
+    def test_client_error_not_retried(self):
+        self.mock_flickr.add_tags.side_effect = httppool.HTTPStatusError(
+                                                        404, 'Not Found')
+        result = self.renamer().rename_one(u'teh', u'the', '1')
+        self.assertFalse(result.ok)
+        self.assertEqual(2, result.calls)
+        self.assertFalse(self.sleep.called)
+
+    def test_throttled_not_retried_twice(self):
+        # flickr's scheduler has already retried the call
+        self.mock_flickr.scheduler = quota.QuotaScheduler()
+        self.mock_flickr.add_tags.side_effect = httppool.HTTPStatusError(
+                                                        503, 'Unavailable')
+        result = self.renamer(rate=1).rename_one(u'teh', u'the', '1')
+        self.assertFalse(result.ok)
+        self.assertEqual(2, result.calls)
+        self.assertFalse(self.sleep.called)
+
+    def test_failure_reported(self):
+        self.mock_flickr.remove_tag.side_effect = ValueError('no such tag')
+        results = self.renamer().rename_all([(u'teh', u'the')])
+        self.assertEqual(['1', '2'], sorted(result.photo_id
+                                            for result in results
+                                            if not result.ok))
+
+    def test_resumed_from_log(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        log = tagrename.RenameLog(os.path.join(tmpdir, 'renames.jsonl'))
+        self.addCleanup(log.close)
+        self.mock_flickr.remove_tag.side_effect = lambda tag_id: \
+            self.fail_once(tag_id)
+        self.failed = False
+        renamer = self.renamer(log=log)
+        renamer.rename_all([(u'teh', u'the')])
+        self.assertEqual([(u'teh', u'the')], renamer.pending())
+        self.mock_flickr.photo_tags.reset_mock()
+        results = renamer.rename_all(renamer.pending())
+        self.assertEqual(1, len(results))
+        self.assertEqual(1, self.mock_flickr.photo_tags.call_count)
+        self.assertEqual([], renamer.pending())
+
+    def fail_once(self, tag_id):
+        if tag_id == 't2' and not self.failed:
+            self.failed = True
+            raise ValueError('tag not found')
+
+
+class TestDistinctRenames(unittest.TestCase):
+
+    def test_distinct(self):
+        self.assertEqual([(u'Nwe York', u'New York'), (u'teh', u'the')],
+                         tagrename.distinct_renames([
+                            (u'Nwe York', u'New York'),
+                            (u'nweyork', u'newyork'),
+                            (u'same', u'same'),
+                            (u'teh', u'the')]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.wordindex
+'''
+
+from flickr_spellcheckr.utils import wordindex
+from flickr_spellcheckr.utils.flickr import SimplePhoto
+import unittest
+
+
+class TestWordIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.one = SimplePhoto('teh cat teh dog', 'a speling', '1')
+        self.two = SimplePhoto('teh end', None, '2')
+        self.index = wordindex.WordIndex()
+        self.index.add('teh', self.one, 'title', 0)
+        self.index.add('teh', self.one, 'title', 8)
+        self.index.add('speling', self.one, 'description', 2)
+        self.index.add('teh', self.two, 'title', 0)
+
+    def test_most_common(self):
+        self.assertEqual(['teh', 'speling'],
+                         [word for word, _occ in self.index.most_common()])
+        self.assertEqual(2, self.index.photo_count('teh'))
+        self.assertEqual(2, len(self.index))
+
+    def test_apply_everywhere(self):
+        changed = self.index.apply({'teh': 'the'})
+        self.assertEqual('the cat the dog', self.one.title)
+        self.assertEqual('the end', self.two.title)
+        self.assertEqual('a speling', self.one.description)
+        self.assertEqual(set(['1', '2']),
+                         set(photo.photo_id for photo in changed))
+
+    def test_apply_length_change(self):
+        self.index.apply({'teh': 'these', 'speling': 'spelling'})
+        self.assertEqual('these cat these dog', self.one.title)
+        self.assertEqual('a spelling', self.one.description)
+
+    def test_apply_nothing(self):
+        self.assertEqual([], self.index.apply({}))
+        self.assertEqual('teh cat teh dog', self.one.title)
+
+
+if __name__ == "__main__":
+    unittest.main()
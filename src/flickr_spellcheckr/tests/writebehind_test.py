@@ -0,0 +1,127 @@
+# -*- coding: UTF-8 -*-
+
+'''Unit tests for flickr_spellcheckr.utils.writebehind
+'''
+
+from flickr_spellcheckr.utils import bulksave, flickr, writebehind
+import mock
+import threading
+import time
+import unittest
+
+
+class TestWriteBehind(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_flickr = mock.Mock(spec=flickr.Flickr)
+        # Make the child mock before the worker threads race to
+        self.mock_flickr.save_meta.return_value = None
+        self.saver = bulksave.BulkSaver(self.mock_flickr, workers=2,
+                                        sleep=mock.Mock())
+        self.photos = []
+        for idx in xrange(5):
+            photo = flickr.SimplePhoto('title', 'desc', str(idx))
+            photo.title = 'fixed'
+            self.photos.append(photo)
+
+    def writer(self, **kwargs):
+        writer = writebehind.WriteBehind(self.saver, **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def saved_ids(self):
+        return sorted(call[0][0].photo_id for call in
+                      self.mock_flickr.save_meta.call_args_list)
+
+    def wait_for_saves(self, count):
+        deadline = time.time() + 5
+        while self.mock_flickr.save_meta.call_count < count and \
+                time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_saved_once_count_reached(self):
+        writer = self.writer(max_count=3, max_age=60)
+        for photo in self.photos[:2]:
+            writer.add(photo)
+        time.sleep(0.05)
+        self.assertFalse(self.mock_flickr.save_meta.called)
+        writer.add(self.photos[2])
+        self.wait_for_saves(3)
+        self.assertEqual(['0', '1', '2'], self.saved_ids())
+
+    def test_saved_once_old_enough(self):
+        writer = self.writer(max_count=100, max_age=0.05)
+        writer.add(self.photos[0])
+        self.wait_for_saves(1)
+        self.assertEqual(['0'], self.saved_ids())
+
+    def test_flush(self):
+        results = []
+        writer = self.writer(max_count=100, max_age=60,
+                             on_result=results.append)
+        for photo in self.photos:
+            writer.add(photo)
+        self.assertEqual((5, []), writer.flush())
+        self.assertEqual(0, len(writer))
+        self.assertEqual(5, len(results))
+        self.assertEqual((0, []), writer.flush())
+
+    def test_newest_text_saved_once(self):
+        writer = self.writer(max_count=100, max_age=60)
+        again = flickr.SimplePhoto('title', 'desc', '0')
+        again.title = 'fixed again'
+        writer.add(self.photos[0])
+        writer.add(again)
+        writer.flush()
+        self.mock_flickr.save_meta.assert_called_once_with(again)
+
+    def test_unchanged_not_saved(self):
+        writer = self.writer(max_count=100, max_age=60)
+        writer.add(flickr.SimplePhoto('title', 'desc', '9'))
+        self.assertEqual((1, []), writer.flush())
+        self.assertFalse(self.mock_flickr.save_meta.called)
+
+    def test_failures_returned(self):
+        self.mock_flickr.save_meta.side_effect = \
+            lambda photo: photo.photo_id == '1' and 1 / 0
+        writer = self.writer(max_count=100, max_age=60)
+        for photo in self.photos:
+            writer.add(photo)
+        saved, failed = writer.flush()
+        self.assertEqual(4, saved)
+        self.assertEqual(['1'], [result.photo.photo_id for result in failed])
+
+    def test_broken_callback_fails_batch(self):
+        def on_result(result):
+            raise ValueError('journal gone')
+        writer = self.writer(max_count=100, max_age=60, on_result=on_result)
+        writer.add(self.photos[0])
+        saved, failed = writer.flush()
+        self.assertEqual(0, saved)
+        self.assertEqual(1, len(failed))
+
+    def test_add_waits_for_slow_batch(self):
+        release = threading.Event()
+        self.mock_flickr.save_meta.side_effect = lambda photo: release.wait()
+        writer = self.writer(max_count=1, max_age=60)
+        writer.add(self.photos[0])
+        self.wait_for_saves(1)
+        writer.add(self.photos[1])
+        adder = threading.Thread(target=writer.add, args=(self.photos[2], ))
+        adder.start()
+        adder.join(0.1)
+        self.assertTrue(adder.is_alive())
+        release.set()
+        adder.join(5)
+        self.assertFalse(adder.is_alive())
+
+    def test_close_saves_waiting(self):
+        writer = writebehind.WriteBehind(self.saver, max_count=100,
+                                         max_age=60)
+        writer.add(self.photos[0])
+        writer.close()
+        self.assertEqual(['0'], self.saved_ids())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.bulksave
+=================================
+
+Save a large batch of photos back to flickr using a pool of threads, while
+staying under a requests per second ceiling and retrying the failures that
+are worth retrying.
+'''
+
+from flickr_spellcheckr.utils import quota
+from multiprocessing.pool import ThreadPool
+import httplib
+import threading
+import time
+
+# Errors worth another go, anything else (e.g. a FlickrError) is final.
+# Of the HTTP status errors only some are, see is_transient
+TRANSIENT_ERRORS = (IOError, httplib.HTTPException)
+
+
+class RateLimiter(object):
+    def __init__(self, rate, burst=1, clock=time.time, sleep=time.sleep):
+        '''Thread safe token bucket
+
+        :param rate: Tokens added per second. None or 0 means no limit
+        :keyword burst: Most tokens the bucket can hold
+        :keyword clock: Callable returning the current time in seconds
+        :keyword sleep: Callable used to wait for a token
+        '''
+
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.burst)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''Block until a token is available and take it
+        '''
+
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.burst, self._tokens +
+                                   (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class SaveResult(object):
+    def __init__(self, photo, error=None, attempts=1):
+        '''Outcome of saving one photo
+
+        :param photo: The :obj:`~flickr_spellcheckr.utils.flickr.SimplePhoto`
+        :keyword error: Exception from the last failed attempt, None if saved
+        :keyword attempts: How many calls to flickr it took
+        '''
+
+        self.photo = photo
+        self.error = error
+        self.attempts = attempts
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BulkSaver(object):
+    def __init__(self, flickr, workers=4, rate=None, retries=3, backoff=1.0,
+                 sleep=time.sleep):
+        '''Save photos to flickr concurrently
+
+        :param flickr: :obj:`~flickr_spellcheckr.utils.flickr.Flickr` object
+            used to save each photo
+        :keyword workers: Number of saves in flight at once
+        :keyword rate: Most save calls started per second. Default: no limit.
+            Ignored when ``flickr`` paces its calls with a
+            :obj:`~flickr_spellcheckr.utils.quota.QuotaScheduler`
+        :keyword retries: Attempts per photo for transient errors. Calls
+            the scheduler has already retried after being throttled are not
+            tried again
+        :keyword backoff: Seconds to wait before the first retry, doubled on
+            each retry after that
+        :keyword sleep: Callable used to wait between retries
+        '''
+
+        self.flickr = flickr
+        self.workers = max(workers, 1)
+        self.retries = max(retries, 1)
+        self.backoff = backoff
+        self.limiter = RateLimiter(None if is_paced(flickr) else rate,
+                                   sleep=sleep)
+        self._sleep = sleep
+        self._scheduled = getattr(flickr, 'scheduler', None) is not None
+
+    def save_all(self, photos, progress=None, on_result=None):
+        '''Save every photo, never stopping early on a failure
+
+        :param photos: List of photos to save
+        :keyword progress: Callable taking (done, total), called as each
+            photo finishes
+        :keyword on_result: Callable taking each :obj:`SaveResult` as soon
+            as its photo finishes, called on the calling thread
+        :returns: List of :obj:`SaveResult` in the same order as ``photos``
+        '''
+
+        photos = list(photos)
+        results = [None] * len(photos)
+        if not photos:
+            return results
+        pool = ThreadPool(min(self.workers, len(photos)))
+        try:
+            done = 0
+            for idx, result in pool.imap_unordered(self._save_indexed,
+                                                   enumerate(photos)):
+                results[idx] = result
+                done += 1
+                if on_result is not None:
+                    on_result(result)
+                if progress is not None:
+                    progress(done, len(photos))
+        finally:
+            pool.terminate()
+        return results
+
+    def _save_indexed(self, args):
+        idx, photo = args
+        return idx, self.save_one(photo)
+
+    def save_one(self, photo):
+        '''Save a single photo retrying transient errors
+
+        :returns: :obj:`SaveResult`
+        '''
+
+        for attempt in xrange(1, self.retries + 1):
+            self.limiter.acquire()
+            try:
+                self.flickr.save_meta(photo)
+            except TRANSIENT_ERRORS, e:
+                # The scheduler has already retried a throttled call
+                if attempt == self.retries or not is_transient(e) or (
+                        self._scheduled and quota.is_throttled(e)):
+                    return SaveResult(photo, error=e, attempts=attempt)
+                self._sleep(self.backoff * 2 ** (attempt - 1))
+            except Exception, e:
+                return SaveResult(photo, error=e, attempts=attempt)
+            else:
+                return SaveResult(photo, attempts=attempt)
+
+
+def is_transient(error):
+    '''Return True for an error worth trying the call again for
+
+    A response with an HTTP status is only retried if flickr throttled the
+    call or failed it on its side. Any other 4xx fails the same every time.
+    '''
+
+    if not isinstance(error, TRANSIENT_ERRORS):
+        return False
+    # HTTPStatusError has status, urllib2's HTTPError code
+    status = getattr(error, 'status', None) or getattr(error, 'code', None)
+    return not isinstance(status, int) or quota.is_throttled(error)
+
+
+def is_paced(flickr):
+    '''Return True if every call made through ``flickr`` is already paced
+    by its :obj:`~flickr_spellcheckr.utils.quota.QuotaScheduler`, so a
+    saver's own rate limit would only slow it down twice
+    '''
+
+    scheduler = getattr(flickr, 'scheduler', None)
+    return scheduler is not None and bool(scheduler.rate)
@@ -0,0 +1,149 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.detect
+===============================
+
+Non-interactive spelling error detection. Finding the errors in a large
+library is CPU bound, so photos are split into chunks and checked by a pool
+of processes, each with its own dictionary. Only compact
+:obj:`ErrorRecord` tuples are sent back to the parent.
+'''
+
+from flickr_spellcheckr.utils import markup, pipeline
+from multiprocessing.pool import Pool
+import collections
+import multiprocessing
+
+ErrorRecord = collections.namedtuple('ErrorRecord',
+                                     'photo_id field offset word')
+_PhotoText = collections.namedtuple('_PhotoText', 'photo_id title description')
+FIELDS = ('title', 'description')
+DEFAULT_CHUNK_SIZE = 200  # Photos sent to a worker at a time
+
+_checker = None  # The worker process' own spellchecker
+_init_error = None  # Why the worker process' spellchecker couldn't be made
+
+
+def make_checker(lang, pwl=None, filters=markup.DEFAULT_FILTERS,
+                 patterns=()):
+    '''Return a new :obj:`~enchant.checker.SpellChecker` for the language
+
+    :keyword filters: Markup to skip, names from
+        :data:`~flickr_spellcheckr.utils.markup.FILTERS`
+    :keyword patterns: Extra regular expressions of text to skip
+    '''
+
+    import enchant
+    from enchant.checker import SpellChecker
+
+    chunkers, token_filters = markup.tokenizer_args(filters, patterns)
+    return SpellChecker(lang=enchant.DictWithPWL(lang, pwl=pwl),
+                        chunkers=chunkers, filters=token_filters)
+
+
+def check_photos(checker, photos):
+    '''Return the spelling errors in the photos' titles and descriptions
+
+    :param checker: :obj:`~enchant.checker.SpellChecker` to check with
+    :param photos: Iterable of objects with ``photo_id``, ``title`` and
+        ``description`` attributes
+    :returns: List of :obj:`ErrorRecord`
+    '''
+
+    records = []
+    for photo in photos:
+        for field in FIELDS:
+            text = getattr(photo, field)
+            # pyenchant doesn't like having set_text(None) called...
+            if text is None:
+                continue
+            checker.set_text(text)
+            for err in checker:
+                records.append(ErrorRecord(photo.photo_id, field, err.wordpos,
+                                           err.word))
+    return records
+
+
+def errors_iter(checker, photos):
+    '''Iterate over the spelling errors in the photos, in this process
+    '''
+
+    for photo in photos:
+        for record in check_photos(checker, (photo, )):
+            yield record
+
+
+def _init_worker(factory, lang, pwl):
+    global _checker, _init_error
+    try:
+        _checker = factory(lang, pwl)
+    except Exception, e:
+        # A worker that dies starting up is restarted by the pool forever,
+        # keep it alive and fail its first chunk instead
+        _init_error = e
+
+
+def _check_chunk(chunk):
+    if _init_error is not None:
+        raise _init_error
+    return check_photos(_checker, chunk)
+
+
+def _chunks(photos, size):
+    chunk = []
+    for photo in photos:
+        # Only send what is needed, not the whole photo object
+        chunk.append(_PhotoText(photo.photo_id, photo.title,
+                                photo.description))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Detector(object):
+    def __init__(self, lang, pwl=None, processes=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, factory=make_checker):
+        '''Find spelling errors using a pool of processes
+
+        :param lang: Dictionary tag, e.g. ``en_US``
+        :keyword pwl: Path of the personal word list
+        :keyword processes: Number of worker processes. Default: one per CPU
+        :keyword chunk_size: Photos sent to a worker at a time
+        :keyword factory: Module level callable taking (lang, pwl) that
+            returns the spellchecker each worker uses
+        '''
+
+        self.lang = lang
+        self.pwl = pwl
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = max(processes, 1)
+        self.chunk_size = max(chunk_size, 1)
+        self.factory = factory
+
+    def errors_iter(self, photos):
+        '''Iterate over the spelling errors in the photos
+
+        Photos are read from ``photos`` only as fast as the workers get
+        through them. Errors are yielded in the order of the photos.
+
+        :param photos: Iterable of
+            :obj:`~flickr_spellcheckr.utils.flickr.SimplePhoto`
+        :returns: Iterator of :obj:`ErrorRecord`
+        :raises: Whatever ``factory`` raised if a worker's spellchecker
+            couldn't be made
+        '''
+
+        pool = Pool(self.processes, initializer=_init_worker,
+                    initargs=(self.factory, self.lang, self.pwl))
+        try:
+            for records in pipeline.bounded_imap(pool, _check_chunk,
+                                    _chunks(photos, self.chunk_size),
+                                    max_pending=self.processes * 2):
+                for record in records:
+                    yield record
+        finally:
+            pool.terminate()
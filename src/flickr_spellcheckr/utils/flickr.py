@@ -7,137 +7,1003 @@ flickr_spellcheckr.utils.flickr
 Module to handle all the query nastiness and pagination with flickr
 '''
 
+from flickr_spellcheckr.utils import httppool, lazy, \
+    metrics as metrics_module, pipeline, quota
+from multiprocessing.pool import ThreadPool
+from cStringIO import StringIO
+from xml.etree import ElementTree
+import collections
+import contextlib
 import datetime
-import flickrapi
+import json
+import os
+import sys
+import threading
 import time
 
+# Importing flickrapi takes as long as the rest of startup, put it off until
+# the first call to flickr
+flickrapi = lazy.LazyModule('flickrapi')
+
 APIKEY = 'b60fd0ba95f8c583d8ef513d060c68e8'
 APISECRET = '9479730e8bc2c49a'
+MAX_PER_PAGE = 500  # Largest page size flickr.photos.search will return
+MIN_PER_PAGE = 50  # Smallest page size the page sizer will pick
+MAX_SEARCH_RESULTS = 4000  # photos.search repeats itself past this many
+WINDOW_RESULTS = 2000  # Photos aimed for in each window of a split search
+TARGET_PAGE_SECONDS = 5.0  # Page sizer aims for pages no slower than this
+MAX_PAGE_BYTES = 1 << 20  # Page sizer aims for pages no bigger than this
+DEFAULT_SEARCH_DAYS = 40  # How far back photos_iter looks by default
+PHOTO_EXTRAS = 'description,date_taken,last_update'
+MAX_POPULAR_TAGS = 100000  # Ask for every tag's usage count
+TOKEN_CHECK_INTERVAL = 24 * 60 * 60  # Seconds a checked token is trusted
+INVALID_TOKEN = 98  # Flickr's error code for a bad or revoked token
+# Calls that change photos, made after any reads waiting on the quota
+WRITE_METHODS = frozenset(['photos_setMeta', 'photos_addTags',
+                           'photos_removeTag'])
+
+POST_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+_UNCHANGED = object()  # Default for SimplePhoto's original text
+
+# A tag on one photo, tag_id is what photos.removeTag needs
+PhotoTag = collections.namedtuple('PhotoTag', 'tag_id raw clean')
+
+# An album, photos is how many photos flickr says it holds
+Photoset = collections.namedtuple('Photoset', 'photoset_id title photos')
 
 
 class SimplePhoto(object):
-    def __init__(self, title, description, photo_id):
+    __slots__ = ('title', 'description', 'photo_id', 'date_taken',
+                 'last_update', 'original_title', 'original_description')
+
+    def __init__(self, title, description, photo_id, date_taken=None,
+                 last_update=None, original_title=_UNCHANGED,
+                 original_description=_UNCHANGED):
         '''Easier to deal with Photo object from flickr
 
+        Slotted to keep large photostreams small in memory. The text the
+        photo had on flickr is kept alongside any edits so that
+        :attr:`dirty` can tell if the photo needs saving at all.
+
         :param title: Text of the photo title
         :param description: Text for the description
         :param photo_id: The photo ID
+        :keyword date_taken: Taken date as flickr formats it,
+            ``YYYY-MM-DD HH:MM:SS``
+        :keyword last_update: Unix timestamp of the last change on flickr
+        :keyword original_title: Title on flickr. Default: ``title``
+        :keyword original_description: Description on flickr. Default:
+            ``description``
         '''
 
         self.title = title
         self.description = description
         self.photo_id = photo_id
+        self.date_taken = date_taken
+        self.last_update = last_update
+        if original_title is _UNCHANGED:
+            original_title = title
+        if original_description is _UNCHANGED:
+            original_description = description
+        self.original_title = original_title
+        self.original_description = original_description
+
+    @property
+    def dirty(self):
+        '''True if the title or description differ from flickr's
+        '''
+
+        return (self.title != self.original_title or
+                self.description != self.original_description)
+
+    def mark_saved(self):
+        '''Record that flickr now has the photo's current text
+        '''
+
+        self.original_title = self.title
+        self.original_description = self.description
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
 
     def __unicode__(self):
-        return u'Title: %(title)s\nDescription: %(description)s' % (
-                                                            self.__dict__)
+        return u'Title: %s\nDescription: %s' % (self.title, self.description)
 
     def __str__(self):
-        return 'Title: %(title)s\nDescription: %(description)s' % self.__dict__
+        return 'Title: %s\nDescription: %s' % (self.title, self.description)
+
+
+class PhotoQueue(object):
+    def __init__(self, photos=()):
+        '''Photos waiting to be saved, at most one per photo ID
+
+        Queueing a photo that is already queued replaces it and moves it to
+        the back, so overlapping spellcheck runs can't save a photo twice.
+
+        :param photos: Iterable of :obj:`SimplePhoto` to start with
+        '''
+
+        self._photos = collections.OrderedDict()
+        self.extend(photos)
+
+    def add(self, photo):
+        self._photos.pop(photo.photo_id, None)
+        self._photos[photo.photo_id] = photo
+
+    def extend(self, photos):
+        for photo in photos:
+            self.add(photo)
+
+    def get(self, photo_id, default=None):
+        return self._photos.get(photo_id, default)
+
+    def __contains__(self, photo_id):
+        return photo_id in self._photos
+
+    def __iter__(self):
+        return self._photos.itervalues()
+
+    def __len__(self):
+        return len(self._photos)
+
+
+class PageSizer(object):
+    def __init__(self, size=MAX_PER_PAGE, target_seconds=TARGET_PAGE_SECONDS,
+                 max_bytes=MAX_PAGE_BYTES, smoothing=0.3):
+        '''Pick search page sizes from how long pages take and their size
+
+        Starts at the largest page flickr allows, fewest round trips, and
+        shrinks pages that would take longer than ``target_seconds`` or be
+        bigger than ``max_bytes``. Sizes only change by a factor of two or
+        more so walks aren't resized for every bit of jitter.
+
+        :keyword size: Page size to start with
+        :keyword target_seconds: Slowest page wanted
+        :keyword max_bytes: Biggest response wanted
+        :keyword smoothing: Weight of each new page in the running averages
+        :ivar size: Page size to use for the next page
+        '''
+
+        self.size = size
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.smoothing = smoothing
+        self._seconds = None  # Running average per photo
+        self._bytes = None
+        self._lock = threading.Lock()
+
+    def record(self, photos, seconds, nbytes):
+        '''Update :attr:`size` after fetching a page
+
+        :param photos: Photos on the page
+        :param seconds: Time taken to fetch the page
+        :param nbytes: Size of the response
+        '''
+
+        if photos <= 0:
+            return
+        with self._lock:
+            self._seconds = self._average(self._seconds, seconds / photos)
+            self._bytes = self._average(self._bytes, float(nbytes) / photos)
+            best = min(self.target_seconds / max(self._seconds, 1e-6),
+                       self.max_bytes / max(self._bytes, 1.0))
+            best = int(best) // MIN_PER_PAGE * MIN_PER_PAGE
+            best = max(MIN_PER_PAGE, min(best, MAX_PER_PAGE))
+            if best >= self.size * 2 or best * 2 <= self.size or \
+                    best in (MIN_PER_PAGE, MAX_PER_PAGE):
+                self.size = best
+
+    def _average(self, current, value):
+        if current is None:
+            return value
+        return current + self.smoothing * (value - current)
 
 
 class Flickr(object):
-    def __init__(self):
+    def __init__(self, metrics=None,
+                 token_check_interval=TOKEN_CHECK_INTERVAL, scheduler=None):
         '''Handle querying and iterating over resultant photo data
 
+        Nothing is imported or read from disk until the first call.
+
+        :keyword metrics: :obj:`~flickr_spellcheckr.utils.metrics.Metrics`
+            to record API calls in. Default: the shared registry
+        :keyword token_check_interval: Seconds after flickr last confirmed
+            the saved token during which :meth:`login` trusts it without
+            asking flickr again
+        :keyword scheduler:
+            :obj:`~flickr_spellcheckr.utils.quota.QuotaScheduler` every API
+            call waits its turn with. Default: one that counts calls and
+            backs off when flickr pushes back, but sets no hourly limit
         :ivar logged_in: Boolean for if we're logged into flickr
         :ivar _flickr: Instance of :obj:`flickrapi`
         '''
 
         self.logged_in = False
-        self._flickr = flickrapi.FlickrAPI(APIKEY, APISECRET, cache=True)
+        self.metrics = metrics if metrics is not None else \
+            metrics_module.registry
+        self.page_sizer = PageSizer()
+        self.token_check_interval = token_check_interval
+        self.scheduler = scheduler if scheduler is not None else \
+            quota.QuotaScheduler(hourly=None)
+        self._api = None
+        self._api_lock = threading.RLock()
+
+    @property
+    def _flickr(self):
+        if self._api is None:
+            with self._api_lock:
+                if self._api is None:
+                    self._api = flickrapi.FlickrAPI(APIKEY, APISECRET,
+                                                    cache=True)
+        return self._api
+
+    def _call(self, method, **kwargs):
+        '''Call a flickr API method and return the parsed response
+
+        Every API call made after login goes through here so it can be
+        counted and timed.
+
+        :param method: flickrapi method name, e.g. ``photos_search``
+        :returns: :obj:`~xml.etree.ElementTree.Element` of the ``<rsp>``
+        '''
+
+        raw = self._call_raw(method, **kwargs)
+        with self.metrics.timer('parse.' + method), self._token_errors():
+            return _parse_response(raw)
+
+    @contextlib.contextmanager
+    def _token_errors(self):
+        '''Stop trusting the saved token if flickr rejects it
+        '''
 
-    def login(self):
+        try:
+            yield
+        except flickrapi.FlickrError, e:
+            if _error_code(e) == INVALID_TOKEN:
+                self.logged_in = False
+                self._forget_token_check()
+            raise
+
+    def close(self):
+        '''Release anything held open between calls
+        '''
+
+    def _call_raw(self, method, **kwargs):
+        '''Call a flickr API method and return the unparsed response
+
+        Every call waits its turn with :attr:`scheduler`, writes
+        (:data:`WRITE_METHODS`) after any reads. A call flickr throttles or
+        fails with a server error pauses every call and is tried again, up
+        to the scheduler's ``retries``.
+        '''
+
+        priority = quota.WRITE if method in WRITE_METHODS else quota.READ
+        return self._scheduled(priority, self._send, method, **kwargs)
+
+    def _scheduled(self, priority, func, *args, **kwargs):
+        '''Call ``func`` when :attr:`scheduler` lets a call through, trying
+        it again while flickr throttles it
+
+        :param priority: :data:`~flickr_spellcheckr.utils.quota.READ` or
+            :data:`~flickr_spellcheckr.utils.quota.WRITE`
+        :returns: What ``func`` returns
+        '''
+
+        attempt = 0
+        while True:
+            attempt += 1
+            waited = self.scheduler.acquire(priority)
+            if waited:
+                self.metrics.observe('api.quota_wait', waited)
+            try:
+                result = func(*args, **kwargs)
+            except Exception, e:
+                if not quota.is_throttled(e):
+                    raise
+                self.scheduler.throttled()
+                self.metrics.incr('api.throttled')
+                if attempt >= self.scheduler.retries:
+                    raise
+                continue
+            self.scheduler.succeeded()
+            return result
+
+    def quota(self):
+        '''Return the API quota used so far, see
+        :meth:`~flickr_spellcheckr.utils.quota.QuotaScheduler.snapshot`
+        '''
+
+        return self.scheduler.snapshot()
+
+    def _send(self, method, **kwargs):
+        '''Make one API call through :mod:`flickrapi`
+        '''
+
+        self.metrics.incr('api.calls')
+        with self.metrics.timer('api.' + method):
+            raw = getattr(self._flickr, method)(format='rest', **kwargs)
+        self.metrics.incr('api.bytes', len(raw))
+        return raw
+
+    def login(self, interactive=True):
         '''Setup the :attr:`flickr` object and perform the login to flickr
 
         It is safe to call this function several times. Subsequent calls have
         no effect.
 
-        :keyword get_token: If get_token_part_one succeeds, get the frob
-        :return: True if fully logged in callable to finish login otherwise
+        :keyword interactive: False to only use a saved token, for running
+            unattended. Without one nothing is sent to flickr and no browser
+            is opened
+        :return: True if fully logged in, otherwise a callable to finish
+            login, or False if not ``interactive``
         '''
 
         def finish_login():
-            self._flickr.get_token_part_two((token, frob))
+            token = self._scheduled(quota.READ,
+                                    self._flickr.get_token_part_two,
+                                    (token_part, frob))
+            self._save_token_check(token)
             self.logged_in = True
             return True
         if self.logged_in:
             return True
-        (token, frob) = self._flickr.get_token_part_one(perms='write')
+        if self._token_recently_checked():
+            # Skip a round trip to flickr on every start up
+            self.logged_in = True
+            return True
+        # Checking the token and fetching a frob are API calls too
+        if interactive:
+            (token_part, frob) = self._scheduled(
+                                quota.READ, self._flickr.get_token_part_one,
+                                perms='write')
+        elif not self._flickr.token_cache.token:
+            return False
+        else:
+            # A token flickr rejects must not start the browser login
+            (token_part, frob) = self._scheduled(
+                                quota.READ, self._flickr.get_token_part_one,
+                                perms='write', auth_callback=False)
+        if not token_part:
+            return finish_login if interactive else False
+        return finish_login()
+
+    def _token_check_file(self):
+        return os.path.join(self._flickr.token_cache.get_cached_token_path(),
+                            'checked.json')
+
+    def _token_recently_checked(self):
+        token = self._flickr.token_cache.token
         if not token:
-            return finish_login
-        finish_login()
+            return False
+        try:
+            with open(self._token_check_file()) as check_file:
+                check = json.load(check_file)
+        except (IOError, ValueError):
+            return False
+        age = time.time() - check.get('checked', 0)
+        return (check.get('token') == token and check.get('perms') == 'write'
+                and 0 <= age < self.token_check_interval)
+
+    def _save_token_check(self, token):
+        path = self._token_check_file()
+        try:
+            with open(path + '.tmp', 'w') as check_file:
+                json.dump({'token': token, 'perms': 'write',
+                           'checked': time.time()}, check_file)
+            if sys.platform == 'win32' and os.path.exists(path):
+                os.remove(path)  # rename won't replace a file there
+            os.rename(path + '.tmp', path)
+        except (IOError, OSError):
+            pass  # Only costs a check next time
+
+    def _forget_token_check(self):
+        try:
+            os.remove(self._token_check_file())
+        except OSError:
+            pass
 
-    def photos_iter(self, date_from=None, date_to=None):
+    def photos_iter(self, date_from=None, date_to=None, per_page=None,
+                    workers=1, max_pages=None):
         '''Return an iterator over flickr photos and handle all pagination
 
         The search will only return photos owned by the logged in user.
         The photos objects returned will have their description attached.
 
+        With ``workers`` greater than 1 the first page is fetched as normal
+        and the remaining pages are then prefetched by a pool of threads.
+        Photos are still yielded in the order flickr returns them.
+
+        Flickr stops returning new photos after :data:`MAX_SEARCH_RESULTS`,
+        so a range with more than that is split into date windows, see
+        :meth:`_search_iter`.
+
         :param date_from: The min date the photo was taken on
         :keyword date_to: The max date the photo was taken on. Default: now
+        :keyword per_page: Photos per page, up to :data:`MAX_PER_PAGE`.
+            Default: picked by :attr:`page_sizer`
+        :keyword workers: Number of pages to fetch concurrently
+        :keyword max_pages: Most pages to hold in memory (fetched or being
+            fetched) at once. Default: twice ``workers``
         '''
 
-        def get_photos_element(resp):
-            photos = resp.getchildren()
-            if len(photos) != 1:
-                raise ValueError('Flickr XML response in unexpected format')
-            photos = photos[0]
-            for key in ('page', 'pages', 'total'):
-                if key not in photos.attrib:
-                    raise ValueError('Flickr XML response in unexpected '
-                                       'format')
-            return photos
-
-        def simplephoto_iter(photos):
-            for photo in photos.getchildren():
-                for key in ('title', 'id'):
-                    if key not in photo.attrib:
-                        raise ValueError('Flickr XML response in unexpected '
-                                           'format')
-                children = photo.getchildren()
-                if len(children) != 1:
-                    raise ValueError('Flickr XML response in unexpected '
-                                       'format')
-                yield SimplePhoto(title=photo.attrib['title'],
-                                  description=children[0].text,
-                                  photo_id=photo.attrib['id'])
         if date_from is None:
             date_from = (datetime.datetime.utcnow()
-                         - datetime.timedelta(days=40))
+                         - datetime.timedelta(days=DEFAULT_SEARCH_DAYS))
         assert self.logged_in, 'Must be logged in to flickr to search photos'
         search_args = {'min_taken_date': time.mktime(date_from.timetuple()),
                        'user_id': 'me',
-                       'extras': 'description'}
+                       'extras': PHOTO_EXTRAS}
         if date_to is not None:
             search_args['max_taken_date'] = time.mktime(date_to.timetuple())
-        resp = self._flickr.photos_search(**search_args)
-        photos = get_photos_element(resp)
-        for simplephoto in simplephoto_iter(photos):
+        return self._search_iter(search_args, 'taken',
+                                 search_args['min_taken_date'],
+                                 search_args.get('max_taken_date'),
+                                 per_page=per_page, workers=workers,
+                                 max_pages=max_pages)
+
+    def all_photos_iter(self, per_page=None, workers=1):
+        '''Return an iterator over every photo the logged in user owns
+
+        :keyword per_page: Photos per page. Default: picked by
+            :attr:`page_sizer`
+        :keyword workers: Number of pages to fetch concurrently
+        '''
+
+        assert self.logged_in, 'Must be logged in to flickr to search photos'
+        search_args = {'user_id': 'me', 'extras': PHOTO_EXTRAS}
+        return self._search_iter(search_args, 'upload', 0, None,
+                                 per_page=per_page, workers=workers)
+
+    def updated_photos_iter(self, since, per_page=None, workers=1):
+        '''Return an iterator over photos created or changed since a time
+
+        :param since: Unix timestamp, photos updated after this are returned
+        :keyword per_page: Photos per page. Default: picked by
+            :attr:`page_sizer`
+        :keyword workers: Number of pages to fetch concurrently
+        '''
+
+        assert self.logged_in, 'Must be logged in to flickr to search photos'
+        search_args = {'min_date': int(since), 'extras': PHOTO_EXTRAS}
+        return self._paged_iter('photos_recentlyUpdated', search_args,
+                                per_page=per_page, workers=workers)
+
+    def _search_iter(self, search_args, date_field, date_from, date_to,
+                     per_page=None, workers=1, max_pages=None):
+        '''Walk a photos.search, split into date windows if it is too big
+
+        Flickr is first asked for just the total of the whole search. If it
+        is no more than :data:`MAX_SEARCH_RESULTS` photos the search is
+        walked as it is. Otherwise it is split into date windows that each
+        fit, see :meth:`_windows_iter`. With ``workers`` greater than 1 that
+        many windows are walked at once, while further windows are still
+        being found. Photos are yielded newest window first, each photo once.
+
+        :param search_args: Keyword arguments for photos.search
+        :param date_field: ``taken`` or ``upload``, the date to split on
+        :param date_from: Unix timestamp the search starts at
+        :param date_to: Unix timestamp the search ends at. Default: now
+        '''
+
+        total = self._search_total(search_args)
+        date_from = int(date_from)
+        date_to = int(date_to if date_to is not None else time.time())
+        if total <= MAX_SEARCH_RESULTS or date_to - date_from < 2:
+            for simplephoto in self._paged_iter('photos_search', search_args,
+                                                per_page=per_page,
+                                                workers=workers,
+                                                max_pages=max_pages):
+                yield simplephoto
+            return
+
+        def walk(window):
+            return self._paged_iter('photos_search',
+                                    _window_args(search_args, date_field,
+                                                 *window),
+                                    per_page=per_page)
+        windows = self._windows_iter(search_args, date_field, date_from,
+                                     date_to, total)
+        if workers > 1:
+            pages = prefetch_iter(lambda window: list(walk(window)), windows,
+                                  workers=workers, max_pending=workers)
+        else:
+            pages = (walk(window) for window in windows)
+        seen = set()  # In case a photo's date changes during the walk
+        for photos in pages:
+            for simplephoto in photos:
+                if simplephoto.photo_id not in seen:
+                    seen.add(simplephoto.photo_id)
+                    yield simplephoto
+
+    def _windows_iter(self, search_args, date_field, date_from, date_to,
+                      total):
+        '''Split a search into date windows of no more than
+        :data:`MAX_SEARCH_RESULTS` photos, newest first
+
+        Windows are halved until they fit, asking flickr for just the total
+        of each half, so busy stretches of time get narrow windows and quiet
+        ones wide. A window is only split if the halves' totals show flickr
+        narrowed the search by their dates, otherwise it is used as it is.
+
+        :param total: Photos in the whole search
+        :returns: Iterator of (date from, date to) Unix timestamps
+        '''
+
+        windows = [(date_from, date_to, total)]
+        while windows:
+            date_from, date_to, total = windows.pop()
+            if total <= MAX_SEARCH_RESULTS or date_to - date_from < 2:
+                if total:
+                    self.metrics.incr('photos.windows')
+                    yield date_from, date_to
+                continue
+            middle = (date_from + date_to) // 2
+            halves = [(date_from, middle), (middle + 1, date_to)]
+            totals = [self._search_total(_window_args(search_args,
+                                                      date_field, lo, hi))
+                      for lo, hi in halves]
+            if sum(totals) >= total * 2:
+                self.metrics.incr('photos.windows')
+                yield date_from, date_to  # Dates ignored, can't split
+                continue
+            windows.extend((lo, hi, half_total) for (lo, hi), half_total
+                           in zip(halves, totals))
+
+    def _search_total(self, search_args):
+        '''Return how many photos a photos.search finds
+        '''
+
+        raw = self._call_raw('photos_search', page=1, per_page=1,
+                             **search_args)
+        with self._token_errors():
+            return int(_stream_photos(raw)[0]['total'])
+
+    def _paged_iter(self, method, search_args, per_page=None, workers=1,
+                    max_pages=None):
+        '''Walk every page of a flickr call returning a ``<photos>`` list
+
+        Each page is parsed as it is read, photos are handed on as soon as
+        their element is complete and the element is then thrown away, so
+        no page is ever held as a whole tree.
+
+        Without ``per_page`` pages are sized by :attr:`page_sizer`. On the
+        serial path the size is revisited after every page, a resized page
+        starts at the first photo not yet seen. Prefetched pages keep the
+        size of the first page.
+
+        :param method: flickrapi method to call, e.g. ``photos_search``
+        :param search_args: Keyword arguments for every call of ``method``
+        '''
+
+        adaptive = per_page is None
+        if adaptive:
+            per_page = self.page_sizer.size
+        per_page = min(int(per_page), MAX_PER_PAGE)
+        attrib, photos = self._fetch_page(method, search_args, 1, per_page)
+        for simplephoto in photos:
             yield simplephoto
-        if photos.attrib['pages'] != '1':
-            for idx in xrange(2, int(photos.attrib['pages']) + 1):
-                resp = self._flickr.photos_search(page=idx, **search_args)
-                for simplephoto in simplephoto_iter(get_photos_element(resp)):
+        rest = xrange(2, int(attrib['pages']) + 1)
+        if workers > 1 and len(rest) > 1:
+            def fetch_page(idx):
+                # Runs in a worker thread, only the parsed photos are kept
+                return list(self._fetch_page(method, search_args, idx,
+                                             per_page)[1])
+            for page in prefetch_iter(fetch_page, rest, workers=workers,
+                                      max_pending=max_pages):
+                for simplephoto in page:
+                    yield simplephoto
+            return
+        page, pages = 1, int(attrib['pages'])
+        total = int(attrib['total'])
+        while True:
+            skip = 0  # Photos on the next page already seen, when resized
+            if adaptive and self.page_sizer.size != per_page:
+                offset = page * per_page
+                per_page = self.page_sizer.size
+                page, skip = divmod(offset, per_page)
+                pages = -(-total // per_page)
+            if page >= pages:
+                return
+            page += 1
+            attrib, photos = self._fetch_page(method, search_args, page,
+                                              per_page)
+            pages, total = int(attrib['pages']), int(attrib['total'])
+            for idx, simplephoto in enumerate(photos):
+                if idx >= skip:
                     yield simplephoto
 
+    def _fetch_page(self, method, search_args, page, per_page):
+        '''Fetch one page of photos, parsed as the photos are asked for
+
+        :returns: Tuple of (attributes of the ``<photos>`` element,
+            iterator of :obj:`SimplePhoto`)
+        '''
+
+        started = time.time()
+        raw = self._call_raw(method, page=page, per_page=per_page,
+                             **search_args)
+        seconds = time.time() - started
+        with self._token_errors():
+            attrib, photos = _stream_photos(raw)
+        parsing = time.time() - started - seconds
+        self.metrics.incr('photos.pages')
+
+        def counted(parsing):
+            # Parse time excludes time spent by the caller between photos
+            count = 0
+            while True:
+                started = time.time()
+                simplephoto = next(photos, None)
+                parsing += time.time() - started
+                if simplephoto is None:
+                    break
+                count += 1
+                yield simplephoto
+            self.metrics.incr('photos.fetched', count)
+            self.metrics.observe('parse.' + method, parsing)
+            self.page_sizer.record(count, seconds, len(raw))
+        return attrib, counted(parsing)
+
     def save_meta(self, photo):
         '''Save the title and description fields of a photo to Flickr
 
         :param photo: :obj:`SimplePhoto` object to save to Flickr
         '''
-        self._flickr.photos_setMeta(photo_id=photo.photo_id,
-                                    title=photo.title,
-                                    description=photo.description)
+        self._call('photos_setMeta', photo_id=photo.photo_id,
+                   title=photo.title, description=photo.description)
 
     def tag_list(self):
         '''Return an iterator of the tags the user has
+
+        Tags are given as they were typed (flickr's raw form) rather than
+        flickr's cleaned up form, so multi word tags keep their spaces. A tag
+        typed several ways is given once for each way.
+        '''
+
+        for tag in _get_tags_element(self._call('tags_getListUserRaw')):
+            raws = tag.findall('raw')
+            if not raws:
+                yield tag.attrib.get('clean')
+            for raw in raws:
+                yield raw.text
+
+    def tag_counts(self):
+        '''Return a dict of how many photos use each tag
+
+        :returns: {clean tag: count, ...}
+        '''
+
+        resp = self._call('tags_getListUserPopular', count=MAX_POPULAR_TAGS)
+        counts = {}
+        for tag in _get_tags_element(resp):
+            counts[tag.text] = int(tag.attrib.get('count', 0))
+        return counts
+
+    def tagged_photos_iter(self, tag, per_page=None, workers=1):
+        '''Return an iterator over the logged in user's photos with a tag
+
+        :param tag: Tag in flickr's cleaned up form, see
+            :func:`~flickr_spellcheckr.utils.tagcheck.clean_tag`
+        :keyword per_page: Photos per page. Default: picked by
+            :attr:`page_sizer`
+        :keyword workers: Number of pages to fetch concurrently
+        '''
+
+        assert self.logged_in, 'Must be logged in to flickr to search photos'
+        search_args = {'user_id': 'me', 'tags': tag, 'extras': PHOTO_EXTRAS}
+        return self._search_iter(search_args, 'upload', 0, None,
+                                 per_page=per_page, workers=workers)
+
+    def photoset_list(self):
+        '''Return the logged in user's albums, in the order flickr shows them
+
+        :returns: List of :obj:`Photoset`
+        '''
+
+        photosets = []
+        page, pages = 1, 1
+        while page <= pages:
+            resp = self._call('photosets_getList', page=page,
+                              per_page=MAX_PER_PAGE)
+            attrib = resp.find('photosets').attrib
+            pages = int(attrib.get('pages', 1))
+            photosets.extend(Photoset(photoset.attrib['id'],
+                                      photoset.findtext('title'),
+                                      int(photoset.attrib.get('photos', 0)))
+                             for photoset in resp.findall(
+                                                    'photosets/photoset'))
+            page += 1
+        return photosets
+
+    def photoset_photos_iter(self, photoset_id, per_page=None, workers=1):
+        '''Return an iterator over the photos in an album
+
+        :param photoset_id: The album's id
+        :keyword per_page: Photos per page. Default: picked by
+            :attr:`page_sizer`
+        :keyword workers: Number of pages to fetch concurrently
+        '''
+
+        assert self.logged_in, 'Must be logged in to flickr to list photos'
+        search_args = {'photoset_id': photoset_id, 'extras': PHOTO_EXTRAS}
+        return self._paged_iter('photosets_getPhotos', search_args,
+                                per_page=per_page, workers=workers)
+
+    def collection_photosets(self, collection_ids):
+        '''Return the ids of the albums in collections
+
+        Albums in collections nested inside a collection are included. A
+        collection may be given by its full id or by the id shown in its
+        address on flickr, which leaves off the part before the ``-``.
+
+        :param collection_ids: List of collection ids
+        :returns: List of album ids, each once, in the order the
+            collections were given
+        :raises: :obj:`ValueError` if the user has no such collection
+        '''
+
+        resp = self._call('collections_getTree')
+        tree = collections.OrderedDict()
+        for collection in resp.iter('collection'):
+            tree[collection.attrib['id']] = [photoset.attrib['id']
+                                             for photoset
+                                             in collection.iter('set')]
+        photoset_ids = []
+        for collection_id in collection_ids:
+            matches = [photosets for full_id, photosets in tree.iteritems()
+                       if full_id == collection_id or
+                       full_id.endswith('-' + collection_id)]
+            if not matches:
+                raise ValueError('No collection %s' % collection_id)
+            for photoset_id in matches[0]:
+                if photoset_id not in photoset_ids:
+                    photoset_ids.append(photoset_id)
+        return photoset_ids
+
+    def scoped_photos_iter(self, photoset_ids=(), tags=(), per_page=None,
+                           workers=1):
+        '''Return an iterator over the photos in some albums or carrying
+        some tags, each photo once
+
+        With ``workers`` greater than 1 that many albums are listed at once,
+        with the tag search alongside them. Photos are still yielded album
+        by album in the order given, then those with the tags. A photo in
+        more than one album, or also carrying a tag, is only yielded the
+        first time it is found.
+
+        :keyword photoset_ids: List of album ids
+        :keyword tags: List of tags in flickr's cleaned up form, photos with
+            any of them are included
+        :keyword per_page: Photos per page. Default: picked by
+            :attr:`page_sizer`
+        :keyword workers: Number of albums to list concurrently
+        '''
+
+        sources = [(self.photoset_photos_iter, photoset_id)
+                   for photoset_id in photoset_ids]
+        if tags:
+            sources.append((self.tagged_photos_iter, u','.join(tags)))
+
+        def walk(source):
+            func, arg = source
+            return func(arg, per_page=per_page)
+        if workers > 1 and len(sources) > 1:
+            batches = prefetch_iter(lambda source: list(walk(source)),
+                                    sources, workers=workers,
+                                    max_pending=workers)
+        else:
+            batches = (walk(source) for source in sources)
+        seen = set()
+        for photos in batches:
+            for simplephoto in photos:
+                if simplephoto.photo_id in seen:
+                    self.metrics.incr('photos.duplicates')
+                    continue
+                seen.add(simplephoto.photo_id)
+                yield simplephoto
+
+    def photo_tags(self, photo_id):
+        '''Return the tags on a photo
+
+        :returns: List of :obj:`PhotoTag`
+        '''
+
+        resp = self._call('tags_getListPhoto', photo_id=photo_id)
+        return [PhotoTag(tag.attrib['id'], tag.attrib.get('raw', tag.text),
+                         tag.text)
+                for tag in resp.findall('photo/tags/tag')]
+
+    def add_tags(self, photo_id, tags):
+        '''Add tags to a photo, tags it already has are left as they are
+
+        :param tags: List of tags as they should be shown, may have spaces
+        '''
+
+        self._call('photos_addTags', photo_id=photo_id,
+                   tags=u' '.join(u'"%s"' % tag for tag in tags))
+
+    def remove_tag(self, tag_id):
+        '''Remove a tag from the photo it is on
+
+        :param tag_id: :attr:`PhotoTag.tag_id` of the tag
         '''
 
-        resp = self._flickr.tags_getListUser()
-        tags = resp.getchildren()[0]
-        assert tags.tag == 'who'
-        tags = tags.getchildren()[0]
-        assert tags.tag == 'tags'
-        for tag in tags.getiterator():
-            yield tag.text
+        self._call('photos_removeTag', tag_id=tag_id)
+
+
+class PooledFlickr(Flickr):
+    def __init__(self, metrics=None, connections=httppool.DEFAULT_CONNECTIONS,
+                 pool=None, scheduler=None):
+        '''Flickr client making its calls over pooled keep-alive connections
+
+        Does everything :obj:`Flickr` does, logging in included, but signs
+        and sends API calls itself rather than through :mod:`flickrapi`,
+        which opens a new connection for every call. Calls from any number
+        of threads share the pool, so with ``workers`` set on the photo
+        iterators or a :obj:`~flickr_spellcheckr.utils.bulksave.BulkSaver`
+        with many workers, as many calls as there are connections are in
+        flight at once.
+
+        :keyword connections: Most connections to flickr open at once
+        :keyword pool: :obj:`~flickr_spellcheckr.utils.httppool.ConnectionPool`
+            to use instead of one to flickr's API host
+        :keyword scheduler: As for :obj:`Flickr`
+        '''
+
+        Flickr.__init__(self, metrics=metrics, scheduler=scheduler)
+        self.connections = connections
+        self._pool = pool
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._api_lock:
+                if self._pool is None:
+                    self._pool = httppool.ConnectionPool(
+                        self._flickr.flickr_host, size=self.connections)
+        return self._pool
+
+    def _send(self, method, **kwargs):
+        '''Sign and send one API call, returning the unparsed response
+        '''
+
+        args = {'method': 'flickr.' + method.replace('_', '.'),
+                'api_key': self._flickr.api_key,
+                'auth_token': self._flickr.token_cache.token,
+                'format': 'rest'}
+        args.update(kwargs)
+        args = dict((key, value) for key, value in args.iteritems()
+                    if value is not None)
+        body = self._flickr.encode_and_sign(args)
+        self.metrics.incr('api.calls')
+        with self.metrics.timer('api.' + method):
+            raw = self.pool.request('POST', self._flickr.flickr_rest_form,
+                                    body, POST_HEADERS)
+        self.metrics.incr('api.bytes', len(raw))
+        return raw
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+
+
+def _window_args(search_args, date_field, date_from, date_to):
+    search_args = dict(search_args)
+    search_args['min_%s_date' % date_field] = date_from
+    search_args['max_%s_date' % date_field] = date_to
+    return search_args
+
+
+def _error_code(error):
+    '''Return the flickr error code in a FlickrError's message, or None
+    '''
+
+    try:
+        return int(unicode(error).split(':')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _parse_response(raw):
+    '''Parse a REST response, raising FlickrError like flickrapi does
+    '''
+
+    rsp = ElementTree.fromstring(raw)
+    if rsp.attrib.get('stat') == 'ok':
+        return rsp
+    err = rsp.find('err')
+    if err is None:
+        raise flickrapi.FlickrError(u'Error: unexpected response')
+    raise flickrapi.FlickrError(u'Error: %(code)s: %(msg)s' % err.attrib)
+
+
+def _get_tags_element(resp):
+    tags = resp.getchildren()[0]
+    assert tags.tag == 'who'
+    tags = tags.getchildren()[0]
+    assert tags.tag == 'tags'
+    return tags.getchildren()
+
+
+def _stream_photos(raw):
+    '''Parse a ``<photos>`` response incrementally
+
+    The ``<photos>`` element's attributes are read straight away, the
+    photos only as the returned iterator is walked. Each ``<photo>`` is
+    cleared from the tree as soon as its :obj:`SimplePhoto` is made. An
+    album's ``<photoset>`` is read the same way.
+
+    :param raw: XML of the response
+    :returns: Tuple of (attributes of ``<photos>``, iterator of
+        :obj:`SimplePhoto`)
+    :raises: :obj:`flickrapi.FlickrError` if flickr returned an error
+    '''
+
+    events = ElementTree.iterparse(StringIO(raw), events=('start', 'end'))
+    for event, elem in events:
+        if event == 'start' and elem.tag in ('photos', 'photoset'):
+            attrib = dict(elem.attrib)
+            break
+        if event == 'end' and elem.tag == 'err':
+            raise flickrapi.FlickrError(u'Error: %(code)s: %(msg)s' %
+                                        elem.attrib)
+    else:
+        raise flickrapi.FlickrError(u'Error: unexpected response')
+    for key in ('page', 'pages', 'total'):
+        if key not in attrib:
+            raise ValueError('Flickr XML response in unexpected format')
+    return attrib, _simplephoto_iter(events, elem)
+
+
+def _simplephoto_iter(events, photos):
+    for event, photo in events:
+        if event != 'end' or photo.tag != 'photo':
+            continue
+        for key in ('title', 'id'):
+            if key not in photo.attrib:
+                raise ValueError('Flickr XML response in unexpected '
+                                   'format')
+        children = photo.getchildren()
+        if len(children) != 1:
+            raise ValueError('Flickr XML response in unexpected '
+                               'format')
+        last_update = photo.attrib.get('lastupdate')
+        if last_update is not None:
+            last_update = int(last_update)
+        simplephoto = SimplePhoto(title=photo.attrib['title'],
+                                  description=children[0].text,
+                                  photo_id=photo.attrib['id'],
+                                  date_taken=photo.attrib.get('datetaken'),
+                                  last_update=last_update)
+        photos.clear()  # Drop the finished photo elements
+        yield simplephoto
+
+
+def prefetch_iter(func, items, workers, max_pending=None):
+    '''Map ``func`` over ``items`` with a pool of threads, in order
+
+    At most ``max_pending`` results are held (queued, running or finished but
+    not yet consumed) at once, so a slow consumer doesn't cause every item to
+    be fetched into memory. Exceptions raised by ``func`` are re-raised when
+    their result is reached.
+
+    :param func: Callable taking one item
+    :param items: Iterable of arguments for ``func``
+    :param workers: Number of threads in the pool
+    :keyword max_pending: Most results held at once. Default: 2 * workers
+    '''
+
+    if max_pending is None:
+        max_pending = workers * 2
+    pool = ThreadPool(workers)
+    try:
+        for result in pipeline.bounded_imap(pool, func, items, max_pending):
+            yield result
+    finally:
+        pool.terminate()
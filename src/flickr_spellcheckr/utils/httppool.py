@@ -0,0 +1,150 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.httppool
+=================================
+
+Pool of keep-alive HTTP connections to one host, shared between threads.
+Reusing connections saves a TCP and TLS handshake on every flickr call,
+which is most of the cost of a small call like ``photos.setMeta``.
+'''
+
+import Queue
+import httplib
+import socket
+import threading
+
+DEFAULT_CONNECTIONS = 16  # Connections to flickr open at once at most
+DEFAULT_TIMEOUT = 60  # Seconds
+
+# Errors that on a reused connection mean the server dropped it while idle
+STALE_ERRORS = (httplib.BadStatusLine, httplib.CannotSendRequest,
+                httplib.ResponseNotReady, socket.error)
+
+
+class HTTPStatusError(IOError):
+    def __init__(self, status, reason):
+        '''Response with a status other than 200
+
+        An :obj:`IOError` like any network error. Callers only retry the
+        statuses worth retrying, see
+        :func:`~flickr_spellcheckr.utils.bulksave.is_transient`.
+        '''
+
+        IOError.__init__(self, 'HTTP %d: %s' % (status, reason))
+        self.status = status
+        self.reason = reason
+
+
+class ConnectionPool(object):
+    def __init__(self, host, size=DEFAULT_CONNECTIONS, scheme='https',
+                 timeout=DEFAULT_TIMEOUT, connection_factory=None):
+        '''Keep-alive connections to ``host``, at most ``size`` at once
+
+        Threads asking for a connection when ``size`` are in use wait for
+        one to be handed back.
+
+        :param host: Host name, optionally with ``:port``
+        :keyword size: Most connections open at once
+        :keyword scheme: ``https`` or ``http``
+        :keyword timeout: Socket timeout in seconds
+        :keyword connection_factory: Callable taking (host, timeout=) and
+            returning an :obj:`httplib.HTTPConnection`. Default: picked by
+            ``scheme``
+        '''
+
+        if connection_factory is None:
+            connection_factory = (httplib.HTTPSConnection if scheme == 'https'
+                                  else httplib.HTTPConnection)
+        self.host = host
+        self.size = max(size, 1)
+        self.timeout = timeout
+        self._factory = connection_factory
+        self._idle = Queue.LifoQueue()  # Warmest connection first
+        self._slots = threading.Semaphore(self.size)
+        self._lock = threading.Lock()
+        self._open = []
+
+    def request(self, method, path, body=None, headers=None):
+        '''Make a request and return the response body
+
+        A request on a reused connection that the server has since closed
+        is retried once on a fresh connection.
+
+        :raises: :obj:`HTTPStatusError` for any status but 200, or
+            :obj:`IOError`/:obj:`httplib.HTTPException` on network errors
+        '''
+
+        headers = dict(headers or {})
+        self._slots.acquire()
+        try:
+            conn, reused = self._get()
+            try:
+                response = self._send(conn, method, path, body, headers)
+            except STALE_ERRORS:
+                self._discard(conn)
+                if not reused:
+                    raise
+                conn, _reused = self._new(), False
+                try:
+                    response = self._send(conn, method, path, body, headers)
+                except Exception:
+                    self._discard(conn)
+                    raise
+            except Exception:
+                self._discard(conn)
+                raise
+            try:
+                data = response.read()
+            except Exception:
+                self._discard(conn)
+                raise
+            if response.will_close:
+                self._discard(conn)
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+        if response.status != httplib.OK:
+            raise HTTPStatusError(response.status, response.reason)
+        return data
+
+    def _send(self, conn, method, path, body, headers):
+        conn.request(method, path, body, headers)
+        return conn.getresponse()
+
+    def _get(self):
+        try:
+            return self._idle.get_nowait(), True
+        except Queue.Empty:
+            return self._new(), False
+
+    def _new(self):
+        conn = self._factory(self.host, timeout=self.timeout)
+        with self._lock:
+            self._open.append(conn)
+        return conn
+
+    def _discard(self, conn):
+        conn.close()
+        with self._lock:
+            if conn in self._open:
+                self._open.remove(conn)
+
+    def __len__(self):
+        '''Number of connections currently open
+        '''
+
+        with self._lock:
+            return len(self._open)
+
+    def close(self):
+        with self._lock:
+            conns, self._open = self._open, []
+        for conn in conns:
+            conn.close()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except Queue.Empty:
+                break
@@ -0,0 +1,183 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.journal
+================================
+
+Append only, on disk journal of corrected photos waiting to be saved to
+flickr, so a crash, a ^C or a dropped connection part way through a long
+review loses nothing. Each line is a JSON record: ``pending`` when a photo
+is corrected and ``saved`` once flickr has confirmed the save. Reading the
+journal back gives the photos still to be saved.
+'''
+
+from flickr_spellcheckr.utils.flickr import SimplePhoto
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+SYNC_EVERY = 20  # Records written between fsyncs at most
+SYNC_INTERVAL = 1.0  # Seconds between fsyncs at most, checked on each write
+COMPACT_MIN = 100  # Dead records before the journal is rewritten
+PHOTO_FIELDS = ('photo_id', 'title', 'description', 'date_taken',
+                'last_update', 'original_title', 'original_description')
+
+
+class Journal(object):
+    def __init__(self, path, sync_every=SYNC_EVERY,
+                 sync_interval=SYNC_INTERVAL, compact_min=COMPACT_MIN,
+                 clock=time.time):
+        '''Journal of corrections not yet saved to flickr
+
+        Every record is flushed to the OS as soon as it is written, which is
+        enough to survive the program dying. To bound the cost of surviving
+        the machine dying too, fsync is called once per ``sync_every``
+        records or ``sync_interval`` seconds, and by :meth:`sync`.
+
+        A torn record at the end of the file, left by a crash mid-write, is
+        dropped. The journal may be shared between threads.
+
+        :param path: File name of the journal, created if missing
+        :keyword sync_every: Records written between fsyncs at most
+        :keyword sync_interval: Seconds between fsyncs at most
+        :keyword compact_min: Records no longer needed before
+            :meth:`confirm` rewrites the journal without them
+        '''
+
+        self.path = path
+        self.sync_every = max(sync_every, 1)
+        self.sync_interval = sync_interval
+        self.compact_min = compact_min
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._pending = collections.OrderedDict()
+        self._records = 0
+        self._unsynced = 0
+        self._last_sync = clock()
+        self._load()
+        self._file = open(path, 'ab')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        good = 0  # Offset of the end of the last whole record
+        with open(self.path, 'r+b') as journal:
+            for line in iter(journal.readline, ''):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Torn write, nothing valid can follow it
+                self._records += 1
+                self._apply(record)
+                good += len(line)
+            # Drop a torn record so new ones don't get appended onto it
+            journal.truncate(good)
+
+    def _apply(self, record):
+        photo_id = record['photo_id']
+        if record['op'] == 'pending':
+            self._pending.pop(photo_id, None)  # Newest correction goes last
+            self._pending[photo_id] = record
+        elif record['op'] == 'saved':
+            pending = self._pending.get(photo_id)
+            # Only the version flickr confirmed is done with, not a newer one
+            if pending is not None and _same_text(pending, record):
+                del self._pending[photo_id]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def pending(self):
+        '''Return the photos corrected but not confirmed saved, in order
+
+        :returns: List of :obj:`SimplePhoto`
+        '''
+
+        with self._lock:
+            return [SimplePhoto(**dict((field, record[field])
+                                       for field in PHOTO_FIELDS
+                                       if field in record))
+                    for record in self._pending.itervalues()]
+
+    def append(self, photo):
+        '''Record a corrected photo waiting to be saved
+
+        :param photo: :obj:`SimplePhoto` with the corrected text
+        '''
+
+        self._write(_record('pending', photo))
+
+    def confirm(self, photo):
+        '''Record that flickr has saved the photo
+
+        The journal is compacted once enough records are no longer needed.
+
+        :param photo: :obj:`SimplePhoto` as it was saved
+        '''
+
+        with self._lock:
+            self._write(_record('saved', photo))
+            if self._records - len(self._pending) >= self.compact_min:
+                self.compact()
+
+    def _write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, sort_keys=True) + '\n')
+            self._file.flush()
+            self._records += 1
+            self._unsynced += 1
+            self._apply(record)
+            if self._unsynced >= self.sync_every or \
+                    self._clock() - self._last_sync >= self.sync_interval:
+                self.sync()
+
+    def sync(self):
+        '''Make sure everything written so far is on disk
+        '''
+
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = self._clock()
+
+    def compact(self):
+        '''Rewrite the journal keeping only the photos still to be saved
+        '''
+
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as tmp:
+                for record in self._pending.itervalues():
+                    tmp.write(json.dumps(record, sort_keys=True) + '\n')
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            self._file.close()
+            if sys.platform == 'win32':
+                os.remove(self.path)  # rename won't replace a file there
+            os.rename(tmp_path, self.path)
+            self._file = open(self.path, 'ab')
+            self._records = len(self._pending)
+            self._unsynced = 0
+            self._last_sync = self._clock()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self.sync()
+                self._file.close()
+
+
+def _record(op, photo):
+    record = dict((field, getattr(photo, field)) for field in PHOTO_FIELDS)
+    record['op'] = op
+    return record
+
+
+def _same_text(first, second):
+    return (first['title'] == second['title'] and
+            first['description'] == second['description'])
@@ -0,0 +1,87 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.lazy
+=============================
+
+Helpers to keep startup fast: modules imported on first use and objects
+built on a background thread while the user is typing the first command.
+'''
+
+import importlib
+import sys
+import threading
+
+
+class LazyModule(object):
+    def __init__(self, name):
+        '''Module imported the first time one of its attributes is used
+
+        Attributes are looked up on the real module every time, so patching
+        the module, e.g. with :func:`mock.patch`, is seen through the proxy.
+
+        :param name: Full name of the module, e.g. ``flickrapi``
+        '''
+
+        self.__name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.__name), attr)
+
+    def __repr__(self):
+        return '<lazy module %r>' % self.__name
+
+
+class Background(object):
+    def __init__(self, factory, *args, **kwargs):
+        '''Object built by ``factory`` on a background thread
+
+        Building starts straight away. Using any attribute of this object
+        waits for the build to finish and then uses the built object's, so
+        the object can be handed to code expecting the real thing. An
+        exception raised by ``factory`` is re-raised where the object is
+        first used.
+
+        :param factory: Callable returning the object, called with ``args``
+            and ``kwargs``
+        '''
+
+        self._factory = factory
+        self._done = threading.Event()
+        self._value = None
+        self._exc_info = None
+        thread = threading.Thread(target=self._build, args=args,
+                                  kwargs=kwargs, name='background_load')
+        thread.daemon = True
+        thread.start()
+
+    def _build(self, *args, **kwargs):
+        try:
+            self._value = self._factory(*args, **kwargs)
+        except Exception:
+            self._exc_info = sys.exc_info()
+        finally:
+            self._done.set()
+
+    def ready(self):
+        '''Return True once the object has been built or failed to be
+        '''
+
+        return self._done.is_set()
+
+    def result(self):
+        '''Wait for and return the built object
+        '''
+
+        # Waiting with a timeout keeps the main thread responsive to ^C
+        while not self._done.wait(0.1):
+            pass
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._value
+
+    def __getattr__(self, attr):
+        return getattr(self.result(), attr)
+
+    def __iter__(self):
+        return iter(self.result())
@@ -0,0 +1,379 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.lexicon
+================================
+
+On disk index of the words known to be spelt correctly, memory mapped so
+every process checking photos shares one copy. Words are looked up in the
+index a whole text at a time and only the ones it doesn't know are checked
+with enchant. Words enchant accepts are added to the index, as are words
+added to the personal word list, so over time nearly every word is found
+without loading a dictionary at all.
+
+The index is a hash table of offsets into a block of words, each stored as
+a two byte length followed by its UTF-8 bytes::
+
+    header | slot * slots | (length, word) * words
+'''
+
+from flickr_spellcheckr.utils import detect, markup
+import array
+import collections
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+
+MAGIC = 'FSLX'
+VERSION = 1
+# magic, version, slots, words, size and CRC of the personal word list
+HEADER = struct.Struct('<4sIIIQI')
+SLOT = struct.Struct('<I')  # Offset of the word + 1, 0 for an empty slot
+LENGTH = struct.Struct('<H')
+LOAD_FACTOR = 0.5  # Most words per slot
+MERGE_MIN = 1000  # Learned words waiting before they are merged in
+MAX_WORD_BYTES = 0xffff
+
+CheckError = collections.namedtuple('CheckError', 'word wordpos')
+
+
+class Lexicon(object):
+    def __init__(self, path, pwl=None, merge_min=MERGE_MIN):
+        '''Index of words known to be spelt correctly, kept in ``path``
+
+        Words learned are appended to ``<path>.new`` and merged into the
+        index when the lexicon is opened once ``merge_min`` of them have
+        built up. Opening also brings the index up to date with the personal
+        word list: words appended to it since it was last seen are learned,
+        and if it was changed any other way, e.g. a word removed, the index
+        is rebuilt from it alone.
+
+        Any number of processes may use the same files at once. A lexicon
+        may be shared between threads.
+
+        :param path: File name of the index, created if missing
+        :keyword pwl: Path of the personal word list
+        :keyword merge_min: Learned words waiting before they are merged in
+        '''
+
+        self.path = path
+        self.pwl = pwl
+        self.merge_min = merge_min
+        self._new_path = path + '.new'
+        self._lock = threading.Lock()
+        self._learned = set()
+        self._new_file = None
+        self._map = None
+        self._open()
+
+    def _open(self):
+        pwl_data = _read(self.pwl)
+        header = _read_header(self.path)
+        if header is None or not _extends(pwl_data, header):
+            _remove(self._new_path)
+            write_index(self.path, _lines(pwl_data), pwl_data)
+            self._map_index()
+            return
+        added = _lines(pwl_data[header['pwl_size']:])
+        if added:
+            # Learn the new words before recording them as seen, a crash
+            # between the two only means learning them twice
+            self._append_new(added)
+            _write_header(self.path, header, pwl_data)
+        learned = _lines(_read(self._new_path))
+        self._map_index()
+        if len(learned) >= self.merge_min:
+            words = self._indexed_words() + learned
+            self.close()
+            write_index(self.path, words, pwl_data)
+            _remove(self._new_path)
+            self._learned.clear()
+            self._map_index()
+        else:
+            self._learned.update(word.encode('utf-8') for word in learned)
+
+    def _map_index(self):
+        with open(self.path, 'rb') as index:
+            self._map = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self._map, 0)
+        self._slots = header[2]
+        self._words = header[3]
+        self._table = HEADER.size
+        self._block = HEADER.size + SLOT.size * self._slots
+
+    def __len__(self):
+        with self._lock:
+            return self._words + len(self._learned)
+
+    def __contains__(self, word):
+        if isinstance(word, unicode):
+            word = word.encode('utf-8')
+        if word in self._learned:
+            return True
+        data, slots, table = self._map, self._slots, self._table
+        unpack_slot, unpack_length = SLOT.unpack_from, LENGTH.unpack_from
+        slot = _crc(word) % slots
+        while True:
+            offset = unpack_slot(data, table + 4 * slot)[0]
+            if not offset:
+                return False
+            start = self._block + offset + 1  # Past the length
+            if unpack_length(data, start - 2)[0] == len(word) and \
+                    data[start:start + len(word)] == word:
+                return True
+            slot = (slot + 1) % slots
+
+    def unknown(self, words):
+        '''Return the words not in the lexicon
+
+        :param words: Iterable of words
+        :returns: List of the unknown words in the order first seen, each
+            only once
+        '''
+
+        seen = set()
+        unknown = []
+        for word in words:
+            if word in seen:
+                continue
+            seen.add(word)
+            if word not in self:
+                unknown.append(word)
+        return unknown
+
+    def learn(self, words):
+        '''Add words known to be spelt correctly
+
+        They are used straight away by this lexicon, and by others once
+        opened again.
+        '''
+
+        words = [word for word in words
+                 if len(word.encode('utf-8')) <= MAX_WORD_BYTES]
+        if words:
+            self._append_new(words)
+
+    def _append_new(self, words):
+        with self._lock:
+            if self._new_file is None:
+                self._new_file = open(self._new_path, 'ab')
+            # One write, so lines from other processes don't get interleaved
+            self._new_file.write(u''.join(word + u'\n' for word in words)
+                                 .encode('utf-8'))
+            self._new_file.flush()
+            self._learned.update(word.encode('utf-8') for word in words)
+
+    def _indexed_words(self):
+        data = self._map
+        words = []
+        start = self._block
+        while start < len(data):
+            length = LENGTH.unpack_from(data, start)[0]
+            start += LENGTH.size
+            words.append(data[start:start + length].decode('utf-8'))
+            start += length
+        return words
+
+    def close(self):
+        with self._lock:
+            if self._new_file is not None:
+                self._new_file.close()
+                self._new_file = None
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+
+class IndexedChecker(object):
+    def __init__(self, lexicon, dictionary, tokenizer):
+        '''Spellchecker asking a :obj:`Lexicon` first and enchant only about
+        the words it doesn't know
+
+        Stands in for a :obj:`~enchant.checker.SpellChecker` that is only
+        given text and iterated over for its errors, as in
+        :mod:`~flickr_spellcheckr.utils.detect`.
+
+        :param lexicon: :obj:`Lexicon` of words known to be right
+        :param dictionary: Callable returning an object with a
+            ``check(word)`` method, e.g. an :obj:`enchant.Dict`. Only called
+            once a word isn't in the lexicon
+        :param tokenizer: Callable taking text and returning an iterator of
+            (word, offset)
+        '''
+
+        self.lexicon = lexicon
+        self._dictionary_factory = dictionary
+        self._dictionary = None
+        self._tokenizer = tokenizer
+        self._text = None
+        self._errors = []
+
+    def unknown(self, words):
+        '''Return the words spelt wrongly, each once, in the order first seen
+        '''
+
+        misses = self.lexicon.unknown(words)
+        if not misses:
+            return []
+        if self._dictionary is None:
+            self._dictionary = self._dictionary_factory()
+        wrong = [word for word in misses if not self._dictionary.check(word)]
+        if len(wrong) < len(misses):
+            wrong_set = set(wrong)
+            self.lexicon.learn(word for word in misses
+                               if word not in wrong_set)
+        return wrong
+
+    def set_text(self, text):
+        self._text = text
+        tokens = list(self._tokenizer(text))
+        wrong = set(self.unknown(word for word, _offset in tokens))
+        self._errors = [CheckError(word, offset) for word, offset in tokens
+                        if word in wrong]
+
+    def get_text(self):
+        return self._text
+
+    def __iter__(self):
+        return iter(self._errors)
+
+
+def index_path(lang, pwl):
+    '''Path of the index kept alongside the personal word list
+    '''
+
+    return '%s-%s.words' % (os.path.splitext(pwl)[0], lang)
+
+
+def make_checker(lang, pwl=None, filters=markup.DEFAULT_FILTERS,
+                 patterns=()):
+    '''Return an :obj:`IndexedChecker` for the language
+
+    Without a personal word list there is nowhere to keep the index, so a
+    plain :obj:`~enchant.checker.SpellChecker` is returned.
+
+    :keyword filters: Markup to skip, names from
+        :data:`~flickr_spellcheckr.utils.markup.FILTERS`
+    :keyword patterns: Extra regular expressions of text to skip
+    '''
+
+    if pwl is None:
+        return detect.make_checker(lang, filters=filters, patterns=patterns)
+    from enchant.tokenize import get_tokenizer
+
+    chunkers, token_filters = markup.tokenizer_args(filters, patterns)
+
+    def dictionary():
+        import enchant
+        return enchant.DictWithPWL(lang, pwl=pwl)
+    return IndexedChecker(Lexicon(index_path(lang, pwl), pwl=pwl),
+                          dictionary,
+                          get_tokenizer(lang, chunkers, token_filters))
+
+
+def write_index(path, words, pwl_data=''):
+    '''Write a new index of the words to ``path``, replacing any there
+
+    :param words: Iterable of unicode words
+    :keyword pwl_data: Contents of the personal word list the words include
+    '''
+
+    encoded = []
+    seen = set()
+    for word in words:
+        word = word.encode('utf-8')
+        if word not in seen and len(word) <= MAX_WORD_BYTES:
+            seen.add(word)
+            encoded.append(word)
+    slots = int(len(encoded) / LOAD_FACTOR) + 1
+    table = array.array('I', [0]) * slots
+    block = []
+    offset = 0
+    for word in encoded:
+        slot = _crc(word) % slots
+        while table[slot]:
+            slot = (slot + 1) % slots
+        table[slot] = offset + 1
+        block.append(LENGTH.pack(len(word)))
+        block.append(word)
+        offset += LENGTH.size + len(word)
+    if sys.byteorder == 'big':
+        table.byteswap()
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as index:
+        index.write(HEADER.pack(MAGIC, VERSION, slots, len(encoded),
+                                len(pwl_data), _crc(pwl_data)))
+        index.write(table.tostring())
+        index.write(''.join(block))
+    if sys.platform == 'win32':
+        _remove(path)  # rename won't replace a file there
+    os.rename(tmp_path, path)
+
+
+def _read_header(path):
+    try:
+        with open(path, 'rb') as index:
+            data = index.read(HEADER.size)
+            size = os.fstat(index.fileno()).st_size
+    except IOError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, version, slots, words, pwl_size, pwl_crc = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION or not slots or \
+            size < HEADER.size + SLOT.size * slots:
+        return None
+    return {'slots': slots, 'words': words, 'pwl_size': pwl_size,
+            'pwl_crc': pwl_crc}
+
+
+def _extends(pwl_data, header):
+    '''Return True if the personal word list has at most been added to
+    since the index was written
+    '''
+
+    size = header['pwl_size']
+    return len(pwl_data) >= size and _crc(pwl_data[:size]) == \
+        header['pwl_crc']
+
+
+def _write_header(path, header, pwl_data):
+    with open(path, 'r+b') as index:
+        index.write(HEADER.pack(MAGIC, VERSION, header['slots'],
+                                header['words'], len(pwl_data),
+                                _crc(pwl_data)))
+
+
+def _crc(data):
+    return zlib.crc32(data) & 0xffffffff
+
+
+def _read(path):
+    if path is None:
+        return ''
+    try:
+        with open(path, 'rb') as source:
+            return source.read()
+    except IOError:
+        return ''
+
+
+def _lines(data):
+    if data.startswith('\xef\xbb\xbf'):
+        data = data[3:]
+    words = []
+    for line in data.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            words.append(line.decode('utf-8', 'replace'))
+    return words
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,150 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.markup
+===============================
+
+Filters keeping HTML, URLs, email addresses, hashtags, CamelCase names and
+model numbers away from the spellchecker. Descriptions are full of them and
+every one would otherwise be reported as a spelling error.
+
+The filters plug into enchant's tokenizer as a chunker, which skips whole
+spans of the text, and a token filter, which skips single words. Words are
+still reported at their offsets in the original text, so corrections made
+through a :obj:`~enchant.checker.SpellChecker` land in the right place.
+'''
+
+import re
+
+# Spans of text skipped whole, tried in this order
+SPAN_PATTERNS = (
+    ('html', r'<[^<>]*>|&#?\w+;'),
+    # Trailing punctuation is left to end the sentence
+    ('url', r'\b(?:[A-Za-z][A-Za-z0-9+.-]*://|[Ww]{3}\.)[^\s<>"]*'
+            r'[^\s<>".,;:!?\'()]'),
+    ('email', r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+'),
+    ('hashtag', r'(?<![\w&])[#@]\w+'),
+)
+
+
+def is_camel_case(word):
+    '''Return True for words with a capital after a lower case letter,
+    e.g. ``iPhone`` or ``PhotoShop``
+    '''
+
+    for idx, char in enumerate(word):
+        if char.islower():
+            return any(later.isupper() for later in word[idx + 1:])
+    return False
+
+
+def has_digit(word):
+    '''Return True for words with a digit in, e.g. ``D700`` or ``18mm``
+    '''
+
+    return any(char.isdigit() for char in word)
+
+# Single words skipped
+WORD_FILTERS = (
+    ('camelcase', is_camel_case),
+    ('alphanumeric', has_digit),
+)
+
+FILTERS = tuple(name for name, _ in SPAN_PATTERNS + WORD_FILTERS)
+DEFAULT_FILTERS = FILTERS
+
+
+def skip_regex(filters=DEFAULT_FILTERS, patterns=()):
+    '''Return one compiled regex matching every span to skip, or None
+
+    :keyword filters: Names from :data:`FILTERS` to use
+    :keyword patterns: Extra regular expressions of text to skip
+    '''
+
+    alternatives = [pattern for name, pattern in SPAN_PATTERNS
+                    if name in filters] + list(patterns)
+    if not alternatives:
+        return None
+    return re.compile('|'.join('(?:%s)' % pattern
+                               for pattern in alternatives), re.UNICODE)
+
+
+def word_filter(filters=DEFAULT_FILTERS):
+    '''Return a callable that is True for the words to skip, or None
+    '''
+
+    tests = [test for name, test in WORD_FILTERS if name in filters]
+    if not tests:
+        return None
+    return lambda word: any(test(word) for test in tests)
+
+
+def next_chunk(text, offset, regex):
+    '''Return (start, end) of the first run of text from ``offset`` that
+    ``regex`` doesn't match, or None if there isn't one
+    '''
+
+    for match in regex.finditer(text, offset):
+        if match.end() == match.start():
+            continue  # Nothing to skip
+        if match.start() > offset:
+            return offset, match.start()
+        offset = match.end()
+    if offset < len(text):
+        return offset, len(text)
+    return None
+
+
+def chunks(text, regex):
+    '''Iterate over (start, end) of the runs of text ``regex`` doesn't match
+    '''
+
+    offset = 0
+    while True:
+        chunk = next_chunk(text, offset, regex)
+        if chunk is None:
+            return
+        yield chunk
+        offset = chunk[1]
+
+
+def tokenizer_args(filters=DEFAULT_FILTERS, patterns=()):
+    '''Return (chunkers, filters) for enchant's tokenizer
+
+    Pass them to :obj:`~enchant.checker.SpellChecker` or
+    :func:`enchant.tokenize.get_tokenizer` as ``chunkers`` and ``filters``.
+
+    :keyword filters: Names from :data:`FILTERS` to use
+    :keyword patterns: Extra regular expressions of text to skip
+    '''
+
+    from enchant.tokenize import Chunker, Filter
+
+    chunkers = []
+    regex = skip_regex(filters, patterns)
+    if regex is not None:
+        class SpanChunker(Chunker):
+            def next(self):
+                # The spellchecker edits the text in place as words are
+                # replaced, so look at the text as it is now every time
+                text = self._text
+                if not isinstance(text, basestring):
+                    text = text.tounicode() if text.typecode == 'u' else \
+                        text.tostring()
+                chunk = next_chunk(text, self._offset, regex)
+                if chunk is None:
+                    raise StopIteration()
+                self._offset = chunk[1]
+                return self._text[chunk[0]:chunk[1]], chunk[0]
+        chunkers.append(SpanChunker)
+    token_filters = []
+    skip = word_filter(filters)
+    if skip is not None:
+        class WordFilter(Filter):
+            def _skip(self, word):
+                if not isinstance(word, basestring):
+                    word = word.tounicode() if word.typecode == 'u' else \
+                        word.tostring()
+                return skip(word)
+        token_filters.append(WordFilter)
+    return chunkers, token_filters
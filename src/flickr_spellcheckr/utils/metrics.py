@@ -0,0 +1,150 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.metrics
+================================
+
+Counters and histograms recording where a session's time goes: flickr API
+calls, response sizes, XML parsing, spellchecking and suggestions. Everything
+records into :data:`registry` unless given its own :obj:`Metrics`.
+'''
+
+import contextlib
+import threading
+import time
+
+HISTOGRAM_BUCKETS = 32  # Each bucket's upper bound is double the last
+
+
+class Histogram(object):
+    def __init__(self, base=0.001):
+        '''Fixed memory histogram with exponentially sized buckets
+
+        :keyword base: Upper bound of the first bucket, e.g. 0.001 seconds
+        '''
+
+        self.base = base
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        bound = self.base
+        for idx in xrange(HISTOGRAM_BUCKETS - 1):
+            if value <= bound:
+                break
+            bound *= 2
+        else:
+            idx = HISTOGRAM_BUCKETS - 1
+        self.buckets[idx] += 1
+
+    def percentile(self, pct):
+        '''Estimate a percentile, accurate to within a factor of two
+
+        :param pct: Percentile wanted, 0 to 100
+        '''
+
+        if not self.count:
+            return None
+        wanted = self.count * pct / 100.0
+        seen = 0
+        bound = self.base
+        for count in self.buckets:
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.max)
+            bound *= 2
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else None,
+                'min': self.min,
+                'max': self.max,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99)}
+
+
+class Metrics(object):
+    def __init__(self):
+        '''Thread safe set of named counters and histograms
+        '''
+
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.counters = {}
+            self.histograms = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value, base=0.001):
+        '''Add a value to a histogram, created with ``base`` if new
+        '''
+
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(base)
+            self.histograms[name].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        '''Record how long the with block takes in seconds
+
+        Blocks that raise are counted under ``<name>.errors`` as well.
+        '''
+
+        started = time.time()
+        try:
+            yield
+        except Exception:
+            self.incr(name + '.errors')
+            raise
+        finally:
+            self.observe(name, time.time() - started)
+
+    def snapshot(self):
+        '''Return everything recorded as a dict ready for JSON
+        '''
+
+        with self._lock:
+            return {'started': self.started,
+                    'elapsed': time.time() - self.started,
+                    'counters': dict(self.counters),
+                    'histograms': dict((name, hist.snapshot()) for name, hist
+                                       in self.histograms.iteritems())}
+
+    def report(self):
+        '''Return a human readable summary as a list of lines
+        '''
+
+        snap = self.snapshot()
+        lines = ['Session time: %.1fs' % snap['elapsed']]
+        if snap['counters']:
+            lines.append('Counters:')
+            for name, value in sorted(snap['counters'].iteritems()):
+                lines.append('  %-32s %12d' % (name, value))
+        if snap['histograms']:
+            lines.append('%-34s %7s %9s %9s %9s %9s %9s' % (
+                    'Histograms:', 'count', 'total', 'mean', 'p50', 'p90',
+                    'max'))
+            for name, hist in sorted(snap['histograms'].iteritems()):
+                lines.append('  %-32s %7d %9.3f %9.3f %9.3f %9.3f %9.3f' % (
+                    name, hist['count'], hist['total'], hist['mean'],
+                    hist['p50'], hist['p90'], hist['max']))
+        return lines
+
+registry = Metrics()
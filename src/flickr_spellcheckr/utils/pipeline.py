@@ -0,0 +1,116 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.pipeline
+=================================
+
+Producer/consumer helpers so that fetching and checking photos happens on
+background threads or processes, e.g. while the user is busy answering
+prompts.
+'''
+
+import Queue
+import collections
+import sys
+import threading
+
+DEFAULT_QUEUE_SIZE = 50  # Photos waiting for the user at most
+POLL_INTERVAL = 0.1  # Seconds, keeps blocked threads responsive to stop/^C
+
+_DONE = object()
+
+
+class _Failure(object):
+    def __init__(self, exc_info):
+        '''Exception raised by the producer, re-raised in the consumer
+        '''
+
+        self.exc_info = exc_info
+
+
+def background_filter(items, predicate, maxsize=DEFAULT_QUEUE_SIZE,
+                      on_reject=None):
+    '''Iterate ``items`` and run ``predicate`` on a background thread
+
+    Only the items for which ``predicate`` is true are yielded, in order.
+    At most ``maxsize`` of them are queued up waiting for the consumer, so a
+    slow consumer doesn't pull the whole of ``items`` into memory. An
+    exception from the background thread is re-raised in the consumer.
+
+    Neither ``predicate`` nor ``on_reject`` may share unsynchronised state
+    with the consumer, they run on the background thread.
+
+    :param items: Iterable to walk on the background thread
+    :param predicate: Callable taking one item
+    :keyword maxsize: Most items queued for the consumer
+    :keyword on_reject: Callable taking each item ``predicate`` rejected
+    '''
+
+    queue = Queue.Queue(maxsize=max(maxsize, 1))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except Queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if stop.is_set():
+                    return
+                if predicate(item):
+                    if not put(item):
+                        return
+                elif on_reject is not None:
+                    on_reject(item)
+        except Exception:
+            put(_Failure(sys.exc_info()))
+        else:
+            put(_DONE)
+
+    thread = threading.Thread(target=produce, name='background_filter')
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            try:
+                item = queue.get(timeout=POLL_INTERVAL)
+            except Queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc_info[0], item.exc_info[1], item.exc_info[2]
+            yield item
+    finally:
+        stop.set()
+
+
+def bounded_imap(pool, func, items, max_pending):
+    '''Map ``func`` over ``items`` using ``pool``, yielding results in order
+
+    Unlike ``pool.imap`` at most ``max_pending`` items are handed to the pool
+    (queued, running or finished but not yet consumed) at once, so neither a
+    large ``items`` nor a slow consumer pulls everything into memory.
+    Exceptions raised by ``func`` are re-raised when their result is reached.
+
+    :param pool: :obj:`multiprocessing.pool.Pool` or
+        :obj:`multiprocessing.pool.ThreadPool` to run ``func`` on
+    :param func: Callable taking one item
+    :param items: Iterable of arguments for ``func``
+    :param max_pending: Most items handed to the pool at once
+    '''
+
+    max_pending = max(max_pending, 1)
+    pending = collections.deque()
+    for item in items:
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (item, )))
+    while pending:
+        yield pending.popleft().get()
@@ -0,0 +1,178 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.quota
+==============================
+
+Pace every call to flickr against the API key's hourly limit. Each call
+takes a token from a bucket refilled at the hourly rate. Reads, which the
+user is usually waiting on, go before writes saved in the background. When
+flickr pushes back, with a 429 or a server error, every call is paused for
+a while that doubles each time until calls get through again.
+'''
+
+import collections
+import threading
+import time
+
+READ = 'read'
+WRITE = 'write'
+HOURLY_LIMIT = 3600  # Calls per hour flickr allows each API key
+BURST = 100  # Calls that may be made at once before pacing starts
+BACKOFF = 1.0  # Seconds calls are paused for the first time flickr pushes back
+MAX_BACKOFF = 300.0  # Longest pause, in seconds
+RETRIES = 4  # Attempts per call when flickr pushes back
+HOUR = 60 * 60  # Seconds
+TOO_MANY_REQUESTS = 429  # HTTP status flickr throttles with
+
+
+class QuotaScheduler(object):
+    def __init__(self, hourly=HOURLY_LIMIT, burst=BURST, backoff=BACKOFF,
+                 max_backoff=MAX_BACKOFF, retries=RETRIES, clock=time.time,
+                 sleep=time.sleep):
+        '''Thread safe token bucket shared by every call to flickr
+
+        :keyword hourly: Most calls per hour, the rate the bucket refills
+            at. None or 0 means no limit, calls are still counted and paused
+            when flickr pushes back
+        :keyword burst: Most tokens the bucket can hold
+        :keyword backoff: Seconds to pause for the first time flickr pushes
+            back, doubled each time after that until a call succeeds
+        :keyword max_backoff: Longest pause in seconds
+        :keyword retries: Attempts per call when flickr pushes back
+        :keyword clock: Callable returning the current time in seconds
+        :keyword sleep: Callable used to wait for a token
+        '''
+
+        self.hourly = hourly
+        self.burst = max(burst, 1)
+        self.initial_backoff = backoff
+        self.max_backoff = max_backoff
+        self.retries = max(retries, 1)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._last = clock()
+        self._backoff = backoff
+        self._paused_until = 0
+        self._calls = collections.deque()  # When each call in the last hour
+        self._waiting = {READ: 0, WRITE: 0}
+        self._waited = {READ: 0.0, WRITE: 0.0}
+        self._throttled = 0
+
+    @property
+    def rate(self):
+        '''Tokens added per second, None for no limit
+        '''
+
+        return float(self.hourly) / HOUR if self.hourly else None
+
+    def acquire(self, priority=READ):
+        '''Block until a call may be made
+
+        A write waits while any read is waiting, so reads always go first.
+
+        :keyword priority: :data:`READ` or :data:`WRITE`
+        :returns: Seconds spent waiting
+        '''
+
+        started = self._clock()
+        with self._lock:
+            self._waiting[priority] += 1
+        try:
+            while True:
+                with self._lock:
+                    now = self._clock()
+                    wait = self._wait(now, priority)
+                    if wait <= 0:
+                        if self.hourly:
+                            self._tokens -= 1
+                        self._record(now)
+                        waited = now - started
+                        self._waited[priority] += waited
+                        return waited
+                self._sleep(wait)
+        finally:
+            with self._lock:
+                self._waiting[priority] -= 1
+
+    def _wait(self, now, priority):
+        # Only called with the lock held, seconds until a token may be taken
+        if now < self._paused_until:
+            return self._paused_until - now
+        rate = self.rate
+        if not rate:
+            return 0
+        self._tokens = min(self.burst, self._tokens +
+                           (now - self._last) * rate)
+        self._last = now
+        if self._tokens < 1:
+            return (1 - self._tokens) / rate
+        if priority == WRITE and self._waiting[READ]:
+            return 1 / rate  # Let the read have this token
+        return 0
+
+    def _record(self, now):
+        # Only called with the lock held
+        self._calls.append(now)
+        while self._calls and self._calls[0] <= now - HOUR:
+            self._calls.popleft()
+
+    def throttled(self):
+        '''Flickr pushed back, pause every call for a while
+
+        The pause doubles each time, up to ``max_backoff``, until
+        :meth:`succeeded` is called.
+        '''
+
+        with self._lock:
+            now = self._clock()
+            self._paused_until = max(self._paused_until, now + self._backoff)
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+            self._tokens = 0.0  # No burst of calls straight after the pause
+            self._last = max(self._last, self._paused_until)
+            self._throttled += 1
+
+    def succeeded(self):
+        '''A call got through, the next pause starts short again
+        '''
+
+        with self._lock:
+            self._backoff = self.initial_backoff
+
+    def snapshot(self):
+        '''Return the quota used so far as a dict
+        '''
+
+        with self._lock:
+            now = self._clock()
+            while self._calls and self._calls[0] <= now - HOUR:
+                self._calls.popleft()
+            calls = len(self._calls)
+            rate = self.rate
+            tokens = None
+            if rate:
+                tokens = int(min(self.burst, self._tokens +
+                                 max(now - self._last, 0) * rate))
+            return {'hourly_limit': self.hourly or None,
+                    'calls_last_hour': calls,
+                    'remaining_this_hour': (max(self.hourly - calls, 0)
+                                            if self.hourly else None),
+                    'tokens': tokens,
+                    'throttled': self._throttled,
+                    'paused_for': max(self._paused_until - now, 0),
+                    'waiting': dict(self._waiting),
+                    'waited': dict(self._waited)}
+
+
+def is_throttled(error):
+    '''Return True for an error meaning flickr wants fewer calls: a 429 or
+    any server error
+    '''
+
+    # HTTPStatusError has status, urllib2's HTTPError code
+    status = getattr(error, 'status', None) or getattr(error, 'code', None)
+    if not isinstance(error, IOError) or not isinstance(status, int):
+        return False
+    return status == TOO_MANY_REQUESTS or 500 <= status < 600
@@ -0,0 +1,140 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.rules
+==============================
+
+Persistent "always replace" and "always ignore" decisions. Once a word has
+been answered with ``R`` or ``I`` it is never asked about again, in this
+session or any later one, until the rule is removed or expires.
+'''
+
+import collections
+import sqlite3
+import threading
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rules (
+    word TEXT PRIMARY KEY,
+    replacement TEXT,
+    created REAL NOT NULL,
+    used REAL,
+    uses INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS rules_used ON rules (used);
+'''
+
+Rule = collections.namedtuple('Rule', 'word replacement created used uses')
+
+
+class RuleStore(object):
+    def __init__(self, path=':memory:', clock=time.time):
+        '''Store of words to always replace or always ignore
+
+        A rule with a ``replacement`` of None means ignore the word. Every
+        rule is kept in memory as well as on disk, so looking words up
+        while checking costs no queries. The store may be shared between
+        threads.
+
+        :keyword path: File name of the SQLite database, or ``:memory:``
+        '''
+
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._rules = dict((row[0], Rule(*row)) for row in self._conn.execute(
+                    'SELECT word, replacement, created, used, uses '
+                    'FROM rules'))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rules)
+
+    def get(self, word):
+        '''Return the :obj:`Rule` for a word, None if there isn't one
+        '''
+
+        with self._lock:
+            return self._rules.get(word)
+
+    def ignored(self, word):
+        '''Return True if there is a rule to always ignore the word
+        '''
+
+        rule = self.get(word)
+        return rule is not None and rule.replacement is None
+
+    def rules(self):
+        '''Return every :obj:`Rule`, sorted by word
+        '''
+
+        with self._lock:
+            return sorted(self._rules.itervalues())
+
+    def set(self, word, replacement=None):
+        '''Always replace a word with ``replacement``, or always ignore it
+        if ``replacement`` is None
+
+        Replaces any rule already set for the word.
+        '''
+
+        rule = Rule(word, replacement, self._clock(), None, 0)
+        with self._lock:
+            with self._conn:
+                self._conn.execute('INSERT OR REPLACE INTO rules (word, '
+                                   'replacement, created, used, uses) '
+                                   'VALUES (?, ?, ?, ?, ?)', rule)
+            self._rules[word] = rule
+
+    def remove(self, word):
+        '''Remove the rule for a word
+
+        :returns: True if there was one
+        '''
+
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM rules WHERE word = ?',
+                                   (word, ))
+            return self._rules.pop(word, None) is not None
+
+    def record_use(self, word):
+        '''Note that a word's rule has just been applied
+        '''
+
+        now = self._clock()
+        with self._lock:
+            rule = self._rules.get(word)
+            if rule is None:
+                return
+            with self._conn:
+                self._conn.execute('UPDATE rules SET used = ?, '
+                                   'uses = uses + 1 WHERE word = ?',
+                                   (now, word))
+            self._rules[word] = rule._replace(used=now, uses=rule.uses + 1)
+
+    def expire(self, max_age):
+        '''Remove the rules not applied in the last ``max_age`` seconds
+
+        Rules never applied count from when they were set.
+
+        :returns: List of the :obj:`Rule` removed
+        '''
+
+        cutoff = self._clock() - max_age
+        with self._lock:
+            expired = [rule for rule in self._rules.itervalues()
+                       if (rule.used or rule.created) < cutoff]
+            with self._conn:
+                self._conn.executemany('DELETE FROM rules WHERE word = ?',
+                                       [(rule.word, ) for rule in expired])
+            for rule in expired:
+                del self._rules[rule.word]
+        return sorted(expired)
@@ -0,0 +1,118 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.scope
+==============================
+
+Pick the photos to check by album, collection or tag instead of only by the
+date they were taken, so checking a few albums doesn't mean going through
+every photo taken over the same dates. Selectors are written
+``album:<id>``, ``collection:<id>`` and ``tag:<tag>``, and ``all`` picks
+the whole photostream. Any dates given alongside selectors narrow the
+photos they pick down to those taken between the dates.
+'''
+
+from flickr_spellcheckr.utils import tagcheck
+import datetime
+import shlex
+
+ALL = 'all'
+DATE_FORMAT = '%m/%d/%Y'  # How dates are typed
+TAKEN_FORMAT = '%Y-%m-%d %H:%M:%S'  # How flickr formats date_taken
+
+
+class Scope(object):
+    def __init__(self, albums=(), collections=(), tags=(), everything=False):
+        '''The albums, collections and tags to check the photos of
+
+        A scope with nothing in it is false, the photos are then picked by
+        date as before.
+
+        :keyword albums: List of album ids
+        :keyword collections: List of collection ids
+        :keyword tags: List of tags in flickr's cleaned up form
+        :keyword everything: True to check the whole photostream
+        '''
+
+        self.albums = list(albums)
+        self.collections = list(collections)
+        self.tags = list(tags)
+        self.everything = everything
+
+    def __nonzero__(self):
+        return bool(self.everything or self.albums or self.collections or
+                    self.tags)
+
+    def __str__(self):
+        if self.everything:
+            return 'every photo'
+        parts = []
+        for name, items in (('album', self.albums),
+                            ('collection', self.collections),
+                            ('tag', self.tags)):
+            if items:
+                parts.append('%d %s%s' % (len(items), name,
+                                          's' if len(items) > 1 else ''))
+        return ', '.join(parts) or 'photos by date'
+
+
+def parse(line):
+    '''Split a command's argument into a scope and a date range
+
+    Words are selectors or dates, in any order. A tag with spaces can be
+    quoted, e.g. ``tag:"New York"``, it is looked up in flickr's cleaned up
+    form either way.
+
+    :param line: The argument, e.g. ``album:72157 01/14/2012``
+    :returns: Tuple of (:obj:`Scope`, list of :obj:`datetime.datetime`)
+    :raises: :obj:`ValueError` for a word that is neither or an ``all``
+        mixed with anything else
+    '''
+
+    if isinstance(line, unicode):
+        line = line.encode('utf-8')
+    scope = Scope()
+    date_range = []
+    for word in shlex.split(line):
+        word = word.decode('utf-8')
+        kind, _sep, value = word.partition(':')
+        if word == ALL:
+            scope.everything = True
+        elif not _sep:
+            date_range.append(datetime.datetime.strptime(word, DATE_FORMAT))
+        elif not value:
+            raise ValueError('Nothing given for %s' % kind)
+        elif kind == 'album':
+            scope.albums.append(value)
+        elif kind == 'collection':
+            scope.collections.append(value)
+        elif kind == 'tag':
+            scope.tags.append(tagcheck.clean_tag(value))
+        else:
+            raise ValueError("Don't know how to pick photos by %s" % kind)
+    if scope.everything and (date_range or scope.albums or
+                             scope.collections or scope.tags):
+        raise ValueError('%s picks every photo, it takes nothing else' % ALL)
+    if len(date_range) > 2:
+        raise ValueError('At most two dates can be given')
+    return scope, date_range
+
+
+def taken_between(photos, date_from=None, date_to=None):
+    '''Iterate over the photos taken between two dates
+
+    Photos without a date taken are kept.
+
+    :param photos: Iterable of
+        :obj:`~flickr_spellcheckr.utils.flickr.SimplePhoto`
+    :keyword date_from: :obj:`datetime.datetime` to start from
+    :keyword date_to: :obj:`datetime.datetime` to end at
+    '''
+
+    low = date_from.strftime(TAKEN_FORMAT) if date_from is not None else None
+    high = date_to.strftime(TAKEN_FORMAT) if date_to is not None else None
+    for photo in photos:
+        taken = photo.date_taken
+        if taken is None or ((low is None or taken >= low) and
+                             (high is None or taken <= high)):
+            yield photo
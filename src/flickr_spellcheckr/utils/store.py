@@ -0,0 +1,190 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.store
+==============================
+
+Local SQLite copy of the photostream's titles and descriptions. Once the
+store has been filled only photos changed on flickr since the last sync
+need to be downloaded, and photos that were already checked and found clean
+are skipped without any calls to flickr.
+'''
+
+from flickr_spellcheckr.utils.flickr import SimplePhoto
+import sqlite3
+import threading
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS photos (
+    photo_id TEXT PRIMARY KEY,
+    title TEXT,
+    description TEXT,
+    date_taken TEXT,
+    last_update INTEGER,
+    verified INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS photos_date_taken ON photos (date_taken);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'  # How flickr formats date_taken
+PAGE_SIZE = 500  # Rows read at a time by PhotoStore.photos
+# Keyset paging, newest taken first with ties broken by photo id
+PAGE_ORDER = "ORDER BY IFNULL(date_taken, '') DESC, photo_id DESC LIMIT ?"
+PAGE_AFTER = ("AND (IFNULL(date_taken, '') < ? OR "
+              "(IFNULL(date_taken, '') = ? AND photo_id < ?))")
+
+
+class PhotoStore(object):
+    def __init__(self, path):
+        '''Persistent store of :obj:`SimplePhoto` records
+
+        A photo is marked verified once its text has been checked and found
+        clean. The mark is kept for as long as the stored text is unchanged,
+        any edit made on flickr clears it when it is synced. The store may be
+        shared between threads.
+
+        :param path: File name of the SQLite database, or ``:memory:``
+        '''
+
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _get_meta(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?',
+                                     (key, )).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, key, value):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('INSERT OR REPLACE INTO meta (key, value) '
+                                   'VALUES (?, ?)', (key, value))
+
+    @property
+    def last_sync(self):
+        '''Unix timestamp of the last sync with flickr, None if never synced
+        '''
+
+        value = self._get_meta('last_sync')
+        return float(value) if value is not None else None
+
+    @last_sync.setter
+    def last_sync(self, value):
+        self._set_meta('last_sync', repr(float(value)))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM photos'
+                                      ).fetchone()[0]
+
+    def update(self, photos):
+        '''Insert or refresh photos from flickr
+
+        :param photos: Iterable of :obj:`SimplePhoto`
+        :returns: Number of photos written
+        '''
+
+        count = 0
+        with self._lock:
+            with self._conn:
+                for photo in photos:
+                    # Keep the verified mark only if the text is untouched
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO photos (photo_id, title, '
+                        'description, date_taken, last_update, verified) '
+                        'VALUES (?, ?, ?, ?, ?, COALESCE((SELECT verified '
+                        'FROM photos WHERE photo_id = ? AND title IS ? AND '
+                        'description IS ?), 0))',
+                        (photo.photo_id, photo.title, photo.description,
+                         photo.date_taken, photo.last_update, photo.photo_id,
+                         photo.title, photo.description))
+                    count += 1
+        return count
+
+    def mark_verified(self, photo):
+        '''Record that the photo's current text is clean
+
+        The stored text is replaced with the photo's, so this can also be
+        used after saving a corrected photo to flickr.
+
+        :param photo: :obj:`SimplePhoto` that was checked
+        '''
+
+        with self._lock:
+            with self._conn:
+                self._conn.execute('UPDATE photos SET title = ?, '
+                                   'description = ?, verified = 1 '
+                                   'WHERE photo_id = ?',
+                                   (photo.title, photo.description,
+                                    photo.photo_id))
+
+    def is_verified(self, photo):
+        '''Return True if the photo was verified clean with the text it has
+        now
+
+        Lets photos fetched straight from flickr, e.g. an album's, skip the
+        ones already checked without a sync.
+
+        :param photo: :obj:`SimplePhoto` as it is on flickr
+        '''
+
+        with self._lock:
+            row = self._conn.execute('SELECT verified FROM photos WHERE '
+                                     'photo_id = ? AND title IS ? AND '
+                                     'description IS ?',
+                                     (photo.photo_id, photo.title,
+                                      photo.description)).fetchone()
+        return bool(row and row[0])
+
+    def photos(self, date_from=None, date_to=None, unverified=True,
+               page_size=PAGE_SIZE):
+        '''Yield the stored photos taken between the given dates
+
+        Rows are read a page at a time, each page starting after the last
+        photo of the one before, so photos marked verified while the caller
+        walks the store neither shift the pages nor hold the lock.
+
+        :keyword date_from: :obj:`datetime.datetime` to search from
+        :keyword date_to: :obj:`datetime.datetime` to search to
+        :keyword unverified: Only return photos not yet verified clean
+        :keyword page_size: Number of rows read from the database at once
+        :returns: Iterator of :obj:`SimplePhoto` newest taken first
+        '''
+
+        query = ['SELECT title, description, photo_id, date_taken, '
+                 'last_update FROM photos WHERE 1']
+        args = []
+        if date_from is not None:
+            query.append('AND date_taken >= ?')
+            args.append(date_from.strftime(DATE_FORMAT))
+        if date_to is not None:
+            query.append('AND date_taken <= ?')
+            args.append(date_to.strftime(DATE_FORMAT))
+        if unverified:
+            query.append('AND verified = 0')
+        first = ' '.join(query + [PAGE_ORDER])
+        following = ' '.join(query + [PAGE_AFTER, PAGE_ORDER])
+        rows = self._page(first, args + [page_size])
+        while rows:
+            for row in rows:
+                yield SimplePhoto(*row)
+            if len(rows) < page_size:
+                break
+            last = rows[-1]
+            taken = last[3] or ''
+            rows = self._page(following, args + [taken, taken, last[2],
+                                                 page_size])
+
+    def _page(self, query, args):
+        with self._lock:
+            return self._conn.execute(query, args).fetchall()
@@ -0,0 +1,307 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.suggest
+================================
+
+Cache of spelling suggestions. Asking enchant for suggestions is by far the
+slowest part of checking a word and the same misspellings turn up again and
+again, so the lists are kept in memory and on disk between runs, and the
+lists for the errors coming up are worked out while the user is still
+answering the prompt for the one before.
+'''
+
+from flickr_spellcheckr.utils import metrics as metrics_module
+from multiprocessing.pool import ThreadPool
+import collections
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS suggestions (
+    word TEXT NOT NULL,
+    version TEXT NOT NULL,
+    suggestions TEXT NOT NULL,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (word, version)
+);
+CREATE INDEX IF NOT EXISTS suggestions_used ON suggestions (used);
+'''
+
+
+def pwl_version(lang, pwl=None):
+    '''Return a string that changes whenever the dictionary or PWL does
+
+    :param lang: Dictionary tag, e.g. ``en_US``
+    :keyword pwl: Path of the personal word list
+    '''
+
+    if pwl is None or not os.path.exists(pwl):
+        return lang
+    stat = os.stat(pwl)
+    return '%s:%d:%d' % (lang, stat.st_size, int(stat.st_mtime * 1000))
+
+
+class SuggestionCache(object):
+    def __init__(self, lang, pwl=None, path=None, max_memory=1000,
+                 max_disk=50000):
+        '''Two level LRU cache of suggestion lists
+
+        Entries are keyed by the word and :func:`pwl_version`, so changing
+        the personal word list makes every cached list stale. Call
+        :meth:`refresh` after adding words to it.
+
+        :param lang: Dictionary tag, e.g. ``en_US``
+        :keyword pwl: Path of the personal word list
+        :keyword path: File name of the on disk cache. Default: memory only
+        :keyword max_memory: Most entries kept in memory
+        :keyword max_disk: Most entries kept on disk
+        '''
+
+        self.lang = lang
+        self.pwl = pwl
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.version = pwl_version(lang, pwl)
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._clock = 0
+        self._size = 0
+        if path is not None:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+            self._purge()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get(self, word):
+        '''Return the cached suggestions for a word, None if not cached
+        '''
+
+        with self._lock:
+            if word in self._memory:
+                suggs = self._memory.pop(word)
+                self._memory[word] = suggs
+                return list(suggs)
+            if self._conn is None:
+                return None
+            row = self._conn.execute('SELECT suggestions FROM suggestions '
+                                     'WHERE word = ? AND version = ?',
+                                     (word, self.version)).fetchone()
+            if row is None:
+                return None
+            suggs = json.loads(row[0])
+            self._clock += 1
+            with self._conn:
+                self._conn.execute('UPDATE suggestions SET used = ? '
+                                   'WHERE word = ? AND version = ?',
+                                   (self._clock, word, self.version))
+            self._remember(word, suggs)
+            return list(suggs)
+
+    def put(self, word, suggs):
+        '''Cache the suggestions for a word
+        '''
+
+        with self._lock:
+            self._remember(word, list(suggs))
+            if self._conn is None:
+                return
+            self._clock += 1
+            with self._conn:
+                cursor = self._conn.execute('UPDATE suggestions SET '
+                                            'suggestions = ?, used = ? WHERE '
+                                            'word = ? AND version = ?',
+                                            (json.dumps(suggs), self._clock,
+                                             word, self.version))
+                if cursor.rowcount == 0:
+                    self._conn.execute('INSERT INTO suggestions (word, '
+                                       'version, suggestions, used) '
+                                       'VALUES (?, ?, ?, ?)',
+                                       (word, self.version,
+                                        json.dumps(suggs), self._clock))
+                    self._size += 1
+                self._evict()
+
+    def suggest(self, word, suggest):
+        '''Return suggestions for a word, computing them if not cached
+
+        :param word: The misspelled word
+        :param suggest: Callable returning the suggestion list on a miss,
+            e.g. ``error.suggest``
+        '''
+
+        suggs = self.get(word)
+        if suggs is None:
+            suggs = list(suggest())
+            self.put(word, suggs)
+        return suggs
+
+    def refresh(self):
+        '''Drop entries made stale by a change to the personal word list
+        '''
+
+        with self._lock:
+            version = pwl_version(self.lang, self.pwl)
+            if version == self.version:
+                return
+            self.version = version
+            self._memory.clear()
+            if self._conn is not None:
+                self._purge()
+
+    def _remember(self, word, suggs):
+        self._memory.pop(word, None)
+        self._memory[word] = suggs
+        while len(self._memory) > self.max_memory:
+            self._memory.popitem(last=False)
+
+    def _purge(self):
+        # Only called with the lock held, or before the cache is shared
+        with self._conn:
+            self._conn.execute('DELETE FROM suggestions WHERE version != ?',
+                               (self.version, ))
+        row = self._conn.execute('SELECT COUNT(*), MAX(used) '
+                                 'FROM suggestions').fetchone()
+        self._size = row[0]
+        self._clock = row[1] or 0
+
+    def _evict(self):
+        # Only called with the lock held and inside a transaction
+        if self._size > self.max_disk:
+            self._conn.execute('DELETE FROM suggestions WHERE rowid IN '
+                               '(SELECT rowid FROM suggestions ORDER BY used '
+                               'LIMIT ?)', (self._size - self.max_disk, ))
+            self._size = self.max_disk
+
+
+def make_suggester(lang, pwl=None):
+    '''Return a new dictionary's ``suggest`` method, for
+    :obj:`SuggestionPrefetcher`
+
+    :param lang: Dictionary tag, e.g. ``en_US``
+    :keyword pwl: Path of the personal word list
+    '''
+
+    import enchant
+    return enchant.DictWithPWL(lang, pwl=pwl).suggest
+
+
+class SuggestionPrefetcher(object):
+    def __init__(self, factory, workers=1, cache=None, max_pending=200,
+                 metrics=None):
+        '''Work out suggestion lists on background threads before they are
+        needed
+
+        Words passed to :meth:`prefetch` are queued for the workers in the
+        order given, which should be the order they will be asked about.
+        :meth:`suggest` then hands over the finished list, waiting for it if
+        a worker is still busy with it.
+
+        :param factory: Callable returning a callable that takes a word and
+            returns its suggestions, e.g. a :func:`make_suggester` partial.
+            Called once on each worker thread, as enchant dictionaries can't
+            be used by more than one thread at a time
+        :keyword workers: Threads working out suggestions
+        :keyword cache: :obj:`SuggestionCache` looked in before working out
+            a list, and that every list worked out is stored in
+        :keyword max_pending: Most words waiting to be asked about, words
+            prefetched past this are left until they are asked about
+        :keyword metrics: :obj:`~flickr_spellcheckr.utils.metrics.Metrics`
+            to count prefetched and missed words in. Default: the shared
+            registry
+        '''
+
+        self.factory = factory
+        self.cache = cache
+        self.max_pending = max_pending
+        self.metrics = metrics if metrics is not None else \
+            metrics_module.registry
+        self._pool = ThreadPool(workers)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict()
+        self._generation = 0
+
+    def close(self):
+        self._pool.terminate()
+
+    def prefetch(self, words):
+        '''Queue words to work out suggestions for
+
+        Words already queued are skipped.
+        '''
+
+        with self._lock:
+            for word in words:
+                if word in self._pending:
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    break
+                self._pending[word] = self._pool.apply_async(
+                                self._work_out, (word, self._generation))
+
+    def suggest(self, word, suggest):
+        '''Return suggestions for a word, prefetched if it was queued
+
+        Words queued before this one are taken to have been passed over and
+        are dropped.
+
+        :param word: The misspelled word
+        :param suggest: Callable returning the suggestion list if the word
+            wasn't queued, e.g. ``error.suggest``
+        '''
+
+        with self._lock:
+            result = self._pending.get(word)
+            if result is not None:
+                while True:
+                    older = self._pending.popitem(last=False)[0]
+                    if older == word:
+                        break
+        if result is not None:
+            try:
+                suggs = result.get()
+            except Exception:
+                self.metrics.incr('suggest.prefetch_errors')
+            else:
+                if suggs is not None:
+                    self.metrics.incr('suggest.prefetched')
+                    return suggs
+        self.metrics.incr('suggest.not_prefetched')
+        if self.cache is not None:
+            return self.cache.suggest(word, suggest)
+        return list(suggest())
+
+    def clear(self):
+        '''Drop every queued word and start again with new dictionaries
+
+        Call after adding words to the personal word list.
+        '''
+
+        with self._lock:
+            self._generation += 1
+            self._pending.clear()
+
+    def _work_out(self, word, generation):
+        # Run on a worker thread
+        if generation != self._generation:
+            return None  # Queued before a clear, nobody wants it
+        local = self._local
+        if getattr(local, 'generation', None) != generation:
+            local.suggest = self.factory()
+            local.generation = generation
+        suggs = self.cache.get(word) if self.cache is not None else None
+        if suggs is None:
+            suggs = list(local.suggest(word))
+            # A list worked out with the old dictionary mustn't be cached
+            # under the new version of the personal word list
+            if self.cache is not None and generation == self._generation:
+                self.cache.put(word, suggs)
+        return suggs
@@ -0,0 +1,78 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.tagcheck
+=================================
+
+Spellcheck tags one tag at a time. Each distinct tag is checked once and
+each distinct word once, however many tags share it, and machine tags are
+left alone.
+'''
+
+import re
+
+# Machine tags look like namespace:predicate=value
+MACHINE_TAG = re.compile(r'^[a-zA-Z_]\w*:[a-zA-Z_]\w*=', re.UNICODE)
+WORD = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*", re.UNICODE)
+
+
+def clean_tag(tag):
+    '''Return the tag the way flickr cleans it, e.g. "New York" -> newyork
+    '''
+
+    return u''.join(char for char in tag.lower() if char.isalnum())
+
+
+def unique_tags(tags):
+    '''Iterate over the distinct tags, skipping machine tags
+
+    :param tags: Iterable of tag names, may contain repeats
+    '''
+
+    seen = set()
+    for tag in tags:
+        if not tag or tag in seen or MACHINE_TAG.match(tag):
+            continue
+        seen.add(tag)
+        yield tag
+
+
+def tag_words(tag):
+    '''Return the words in a tag, in order without repeats
+    '''
+
+    words = []
+    for word in WORD.findall(tag):
+        if word not in words:
+            words.append(word)
+    return words
+
+
+def find_misspelled(tags, check):
+    '''Iterate over the tags that contain an unknown word
+
+    ``check`` is called at most once for each distinct word.
+
+    :param tags: Iterable of distinct tags, see :func:`unique_tags`
+    :param check: Callable taking a word, true if the word is spelt right
+    :returns: Iterator of (tag, [unknown word, ...])
+    '''
+
+    known = {}
+    for tag in tags:
+        unknown = []
+        for word in tag_words(tag):
+            if word not in known:
+                known[word] = bool(check(word))
+            if not known[word]:
+                unknown.append(word)
+        if unknown:
+            yield tag, unknown
+
+
+def replace_word(tag, word, repl):
+    '''Replace every use of a whole word in a tag
+    '''
+
+    pattern = re.compile(r'(?<!\w)%s(?!\w)' % re.escape(word), re.UNICODE)
+    return pattern.sub(lambda _match: repl, tag)
@@ -0,0 +1,344 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.tagrename
+==================================
+
+Rename tags across the whole photostream. Flickr's API has no call to rename
+a tag, so every photo carrying the old tag has the new one added and the old
+one removed. Photos are worked through by a pool of threads under a calls
+per second ceiling, and each photo is logged as it is finished, so an
+interrupted rename carries on from where it stopped.
+'''
+
+from flickr_spellcheckr.utils import bulksave, quota, tagcheck
+from multiprocessing.pool import ThreadPool
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+
+class RenameLog(object):
+    def __init__(self, path):
+        '''Append only log of the tag renames started and the photos each
+        has finished with
+
+        Each line is a JSON record: ``rename`` when a rename is started,
+        ``done`` as each photo is finished with and ``finished`` once every
+        photo has been. Records are flushed to the OS as they are written. A
+        torn record at the end of the file, left by a crash mid-write, is
+        dropped. The log may be shared between threads.
+
+        :param path: File name of the log, created if missing
+        '''
+
+        self.path = path
+        self._lock = threading.RLock()
+        self._renames = collections.OrderedDict()  # old: (new, done ids)
+        self._load()
+        self._file = open(path, 'ab')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        good = 0  # Offset of the end of the last whole record
+        with open(self.path, 'r+b') as log:
+            for line in iter(log.readline, ''):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Torn write, nothing valid can follow it
+                self._apply(record)
+                good += len(line)
+            # Drop a torn record so new ones don't get appended onto it
+            log.truncate(good)
+
+    def _apply(self, record):
+        old = record['old']
+        if record['op'] == 'rename':
+            current = self._renames.get(old)
+            if current is None or current[0] != record['new']:
+                self._renames[old] = (record['new'], set())
+        elif record['op'] == 'done':
+            if old in self._renames:
+                self._renames[old][1].add(record['photo_id'])
+        elif record['op'] == 'finished':
+            self._renames.pop(old, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._renames)
+
+    def pending(self):
+        '''Return the renames started but not finished, in order
+
+        :returns: List of (old tag, new tag)
+        '''
+
+        with self._lock:
+            return [(old, new) for old, (new, _done)
+                    in self._renames.iteritems()]
+
+    def done(self, old):
+        '''Return the ids of the photos a rename has finished with
+        '''
+
+        with self._lock:
+            rename = self._renames.get(old)
+            return set(rename[1]) if rename is not None else set()
+
+    def start(self, old, new):
+        '''Record a rename about to be made
+
+        Starting a rename already in the log keeps the photos it has
+        finished with, unless the new tag is different.
+        '''
+
+        self._write({'op': 'rename', 'old': old, 'new': new})
+
+    def photo_done(self, old, photo_id):
+        '''Record that a photo no longer has the old tag
+        '''
+
+        self._write({'op': 'done', 'old': old, 'photo_id': photo_id})
+
+    def finish(self, old):
+        '''Record that every photo is finished with, compacting the log once
+        nothing is left unfinished
+        '''
+
+        with self._lock:
+            self._write({'op': 'finished', 'old': old})
+            if not self._renames:
+                self.compact()
+
+    def _write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, sort_keys=True) + '\n')
+            self._file.flush()
+            self._apply(record)
+
+    def compact(self):
+        '''Rewrite the log keeping only the unfinished renames
+        '''
+
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as tmp:
+                for old, (new, done) in self._renames.iteritems():
+                    tmp.write(json.dumps({'op': 'rename', 'old': old,
+                                          'new': new}, sort_keys=True) + '\n')
+                    for photo_id in sorted(done):
+                        tmp.write(json.dumps({'op': 'done', 'old': old,
+                                              'photo_id': photo_id},
+                                             sort_keys=True) + '\n')
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            self._file.close()
+            if sys.platform == 'win32':
+                os.remove(self.path)  # rename won't replace a file there
+            os.rename(tmp_path, self.path)
+            self._file = open(self.path, 'ab')
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+
+class RenameResult(object):
+    def __init__(self, old, new, photo_id, changed=False, error=None,
+                 calls=0):
+        '''Outcome of renaming a tag on one photo
+
+        :param old: The tag renamed
+        :param new: What it was renamed to
+        :param photo_id: The photo's id
+        :keyword changed: True if the photo's tags were changed, False if
+            there was nothing to do, e.g. it was done by an earlier run
+        :keyword error: Exception from the last failed call, None if renamed
+        :keyword calls: How many calls to flickr it took
+        '''
+
+        self.old = old
+        self.new = new
+        self.photo_id = photo_id
+        self.changed = changed
+        self.error = error
+        self.calls = calls
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class TagRenamer(object):
+    def __init__(self, flickr, workers=4, rate=None, retries=3, backoff=1.0,
+                 log=None, sleep=time.sleep):
+        '''Rename tags on every photo carrying them, concurrently
+
+        :param flickr: :obj:`~flickr_spellcheckr.utils.flickr.Flickr` object
+        :keyword workers: Number of photos worked on at once
+        :keyword rate: Most calls to flickr started per second, counting the
+            calls looking up a photo's tags. Default: no limit. Ignored
+            when ``flickr`` paces its calls with a
+            :obj:`~flickr_spellcheckr.utils.quota.QuotaScheduler`
+        :keyword retries: Attempts per call for transient errors. Calls the
+            scheduler has already retried after being throttled are not
+            tried again
+        :keyword backoff: Seconds to wait before the first retry, doubled on
+            each retry after that
+        :keyword log: :obj:`RenameLog` to record progress in, so an
+            interrupted rename can be finished later
+        :keyword sleep: Callable used to wait between retries
+        '''
+
+        self.flickr = flickr
+        self.workers = max(workers, 1)
+        self.retries = max(retries, 1)
+        self.backoff = backoff
+        self.limiter = bulksave.RateLimiter(
+                            None if bulksave.is_paced(flickr) else rate,
+                            sleep=sleep)
+        self._scheduled = getattr(flickr, 'scheduler', None) is not None
+        self.log = log
+        self._sleep = sleep
+
+    def pending(self):
+        '''Return the renames an earlier run left unfinished
+
+        :returns: List of (old tag, new tag)
+        '''
+
+        return self.log.pending() if self.log is not None else []
+
+    def rename_all(self, renames, progress=None, on_result=None):
+        '''Rename each tag on every photo carrying it
+
+        Tags that flickr cleans to the same tag, e.g. ``New York`` and
+        ``newyork``, are the same tag to flickr, only the first rename of
+        them is made. Photos the log shows as finished by an earlier run are
+        skipped. A rename is logged as finished once no photo failed.
+
+        :param renames: List of (old tag, new tag)
+        :keyword progress: Callable taking (done, total), called as each
+            photo finishes
+        :keyword on_result: Callable taking each :obj:`RenameResult` as soon
+            as its photo finishes, called on the calling thread
+        :returns: List of :obj:`RenameResult` in the order the photos
+            finished
+        '''
+
+        renames = distinct_renames(renames)
+        tasks = []
+        for old, new in renames:
+            done = set()
+            if self.log is not None:
+                self.log.start(old, new)
+                done = self.log.done(old)
+            for photo in self.flickr.tagged_photos_iter(
+                                                tagcheck.clean_tag(old)):
+                if photo.photo_id not in done:
+                    done.add(photo.photo_id)
+                    tasks.append((old, new, photo.photo_id))
+        results = []
+        failed = set()
+        if tasks:
+            pool = ThreadPool(min(self.workers, len(tasks)))
+            try:
+                for result in pool.imap_unordered(self._rename_task, tasks):
+                    results.append(result)
+                    if not result.ok:
+                        failed.add(result.old)
+                    elif self.log is not None:
+                        self.log.photo_done(result.old, result.photo_id)
+                    if on_result is not None:
+                        on_result(result)
+                    if progress is not None:
+                        progress(len(results), len(tasks))
+            finally:
+                pool.terminate()
+        if self.log is not None:
+            for old, _new in renames:
+                if old not in failed:
+                    self.log.finish(old)
+        return results
+
+    def _rename_task(self, args):
+        return self.rename_one(*args)
+
+    def rename_one(self, old, new, photo_id):
+        '''Rename a tag on a single photo, retrying transient errors
+
+        The new tag is added before the old one is removed, so the photo is
+        never left with neither. Where the two only differ in how they are
+        written, e.g. ``newyork`` and ``New York``, flickr treats them as
+        the same tag and the old one has to be removed first.
+
+        :returns: :obj:`RenameResult`
+        '''
+
+        calls = [0]
+
+        def call(func, *args):
+            for attempt in xrange(1, self.retries + 1):
+                self.limiter.acquire()
+                calls[0] += 1
+                try:
+                    return func(*args)
+                except bulksave.TRANSIENT_ERRORS, e:
+                    # The scheduler has already retried a throttled call
+                    if attempt == self.retries or \
+                            not bulksave.is_transient(e) or (
+                            self._scheduled and quota.is_throttled(e)):
+                        raise
+                    self._sleep(self.backoff * 2 ** (attempt - 1))
+        try:
+            tags = call(self.flickr.photo_tags, photo_id)
+            stale = [tag for tag in tags
+                     if tag.clean == tagcheck.clean_tag(old)]
+            if tagcheck.clean_tag(old) == tagcheck.clean_tag(new):
+                changed = any(tag.raw != new for tag in stale)
+                if changed:
+                    for tag in stale:
+                        call(self.flickr.remove_tag, tag.tag_id)
+                    call(self.flickr.add_tags, photo_id, [new])
+            else:
+                changed = bool(stale)
+                if changed:
+                    if not any(tag.clean == tagcheck.clean_tag(new)
+                               for tag in tags):
+                        call(self.flickr.add_tags, photo_id, [new])
+                    for tag in stale:
+                        call(self.flickr.remove_tag, tag.tag_id)
+        except Exception, e:
+            return RenameResult(old, new, photo_id, error=e, calls=calls[0])
+        return RenameResult(old, new, photo_id, changed=changed,
+                            calls=calls[0])
+
+
+def distinct_renames(renames):
+    '''Return the renames without repeats of an old tag or ones that change
+    nothing
+
+    Old tags are compared in flickr's cleaned up form, the first rename of
+    each is kept.
+
+    :param renames: Iterable of (old tag, new tag)
+    :returns: List of (old tag, new tag)
+    '''
+
+    seen = set()
+    distinct = []
+    for old, new in renames:
+        clean = tagcheck.clean_tag(old)
+        if old == new or clean in seen:
+            continue
+        seen.add(clean)
+        distinct.append((old, new))
+    return distinct
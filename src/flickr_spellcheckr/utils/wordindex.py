@@ -0,0 +1,86 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.wordindex
+==================================
+
+Index of where each misspelled word occurs across many photos, so a single
+decision about a word can be applied everywhere it is used.
+'''
+
+import collections
+
+Occurrence = collections.namedtuple('Occurrence', 'photo key offset')
+
+
+class WordIndex(object):
+    def __init__(self):
+        '''Map of misspelled word to every place it occurs
+
+        Offsets are into the text of the field at the time it was indexed.
+        The photos must not be edited between indexing and :meth:`apply`.
+        '''
+
+        self._occurrences = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._occurrences)
+
+    def add(self, word, photo, key, offset):
+        '''Record one occurrence of a misspelled word
+
+        :param word: The misspelled word
+        :param photo: :obj:`~flickr_spellcheckr.utils.flickr.SimplePhoto`
+        :param key: Name of the field, ``title`` or ``description``
+        :param offset: Position of the word in the field's text
+        '''
+
+        self._occurrences.setdefault(word, []).append(
+                                                Occurrence(photo, key, offset))
+
+    def occurrences(self, word):
+        return list(self._occurrences.get(word, ()))
+
+    def photo_count(self, word):
+        '''Number of different photos a word occurs in
+        '''
+
+        return len(set(id(occ.photo) for occ in self.occurrences(word)))
+
+    def most_common(self):
+        '''Return [(word, [occurrence, ...]), ...] most frequent word first
+
+        Words with the same count keep the order they were first seen in.
+        '''
+
+        return sorted(self._occurrences.items(),
+                      key=lambda item: -len(item[1]))
+
+    def apply(self, replacements):
+        '''Replace words in every place they occur
+
+        :param replacements: Dict of misspelled word to its replacement
+        :returns: List of the photos that were changed
+        '''
+
+        edits = collections.OrderedDict()  # field -> (photo, [edit, ...])
+        for word, occurrences in self._occurrences.iteritems():
+            if word not in replacements:
+                continue
+            for occ in occurrences:
+                field = (id(occ.photo), occ.key)
+                if field not in edits:
+                    edits[field] = (occ.photo, [])
+                edits[field][1].append((occ.offset, word, replacements[word]))
+        changed = collections.OrderedDict()
+        for (photo_ref, key), (photo, field_edits) in edits.iteritems():
+            text = getattr(photo, key)
+            # Work backwards so earlier offsets stay valid
+            for offset, word, repl in sorted(field_edits, reverse=True):
+                if text[offset:offset + len(word)] != word:
+                    continue
+                text = text[:offset] + repl + text[offset + len(word):]
+            if text != getattr(photo, key):
+                setattr(photo, key, text)
+                changed[photo_ref] = photo
+        return changed.values()
@@ -0,0 +1,167 @@
+# -*- coding: UTF-8 -*-
+
+'''
+flickr_spellcheckr.utils.writebehind
+====================================
+
+Save corrected photos to flickr in the background while the review carries
+on. Photos are saved in batches, once enough of them are waiting or the
+oldest has waited long enough, so only the photos not yet saved are ever
+held in memory however many are corrected.
+'''
+
+from flickr_spellcheckr.utils import bulksave
+import collections
+import threading
+import time
+
+FLUSH_COUNT = 20  # Photos waiting before a batch is saved
+FLUSH_AGE = 60.0  # Seconds the oldest photo waits before a batch is saved
+
+
+class WriteBehind(object):
+    def __init__(self, saver, max_count=FLUSH_COUNT, max_age=FLUSH_AGE,
+                 on_result=None, clock=time.time):
+        '''Save photos in batches on a background thread as they are added
+
+        A batch is saved once ``max_count`` photos are waiting or the
+        oldest has waited ``max_age`` seconds. Adding a photo only waits
+        for flickr if another ``max_count`` photos are already waiting
+        behind a batch still being saved. Photos whose text is back to what
+        is on flickr are not saved.
+
+        :param saver: :obj:`~flickr_spellcheckr.utils.bulksave.BulkSaver`
+            each batch is saved with
+        :keyword max_count: Photos waiting before a batch is saved
+        :keyword max_age: Seconds the oldest photo waits before a batch is
+            saved
+        :keyword on_result: Callable taking each
+            :obj:`~flickr_spellcheckr.utils.bulksave.SaveResult` as soon as
+            its photo finishes, called on the background thread
+        :keyword clock: Callable returning the current time in seconds
+        '''
+
+        self.saver = saver
+        self.max_count = max(max_count, 1)
+        self.max_age = max_age
+        self.on_result = on_result
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._waiting = collections.OrderedDict()
+        self._oldest = None  # When the oldest waiting photo was added
+        self._saving = 0  # Photos in the batch being saved
+        self._flushing = False
+        self._closing = False
+        self._saved = 0
+        self._failed = []
+        self._thread = threading.Thread(target=self._run,
+                                        name='write-behind')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __len__(self):
+        '''Photos added but not yet saved, including a batch being saved
+        '''
+
+        with self._cond:
+            return len(self._waiting) + self._saving
+
+    def add(self, photo):
+        '''Queue a corrected photo to be saved
+
+        A photo added again before it is saved is only saved once, with
+        the newest text.
+        '''
+
+        with self._cond:
+            while self._saving and len(self._waiting) >= self.max_count:
+                self._cond.wait()
+            if not self._waiting:
+                self._oldest = self._clock()
+            self._waiting.pop(photo.photo_id, None)
+            self._waiting[photo.photo_id] = photo
+            self._cond.notify_all()
+
+    def flush(self):
+        '''Save every photo waiting and wait until they are all saved
+
+        :returns: Tuple of (photos saved, list of
+            :obj:`~flickr_spellcheckr.utils.bulksave.SaveResult` of the
+            photos that failed), counting from the last flush
+        '''
+
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            while self._waiting or self._saving:
+                self._cond.wait()
+            self._flushing = False
+            saved, failed = self._saved, self._failed
+            self._saved, self._failed = 0, []
+        return saved, failed
+
+    def close(self):
+        '''Save every photo waiting and stop the background thread
+
+        :returns: As :meth:`flush`
+        '''
+
+        result = self.flush()
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        return result
+
+    def _due(self):
+        # Only called with the lock held
+        if not self._waiting:
+            return False
+        return (self._flushing or self._closing or
+                len(self._waiting) >= self.max_count or
+                self._clock() - self._oldest >= self.max_age)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due():
+                    if self._closing:
+                        return
+                    timeout = None
+                    if self._waiting:
+                        timeout = max(self._oldest + self.max_age -
+                                      self._clock(), 0.01)
+                    self._cond.wait(timeout)
+                batch = self._waiting.values()
+                self._waiting = collections.OrderedDict()
+                self._saving = len(batch)
+                self._cond.notify_all()
+            finished = set()
+            try:
+                self._save(batch, finished)
+            except Exception, e:
+                # Keep the thread going, the batch is reported as failed
+                with self._cond:
+                    self._failed.extend(bulksave.SaveResult(photo, error=e)
+                                        for photo in batch
+                                        if photo.photo_id not in finished)
+            finally:
+                with self._cond:
+                    self._saving = 0
+                    self._cond.notify_all()
+
+    def _save(self, batch, finished):
+        def on_result(result):
+            if self.on_result is not None:
+                self.on_result(result)
+            with self._cond:
+                finished.add(result.photo.photo_id)
+                if result.ok:
+                    self._saved += 1
+                else:
+                    self._failed.append(result)
+        for photo in batch:
+            if not photo.dirty:
+                on_result(bulksave.SaveResult(photo, attempts=0))
+        self.saver.save_all([photo for photo in batch if photo.dirty],
+                            on_result=on_result)